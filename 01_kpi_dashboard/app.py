@@ -6,7 +6,8 @@ sys.path.append(str(Path(__file__).resolve().parents[1]))
 import pandas as pd
 import streamlit as st
 from sqlalchemy import text
-from common.db import engine
+from common.db import read_engine
+from common.rollups import KPI_DAY_SQL, TREND_SQL, UTIL_DAY_SQL
 from datetime import datetime, date, timedelta
 import pytz
 
@@ -31,7 +32,7 @@ picked_day = st.sidebar.date_input(
 # show last refresh info if table exists
 last_info = ""
 try:
-    with engine.begin() as conn:
+    with read_engine.begin() as conn:
         df = pd.read_sql(
             text(
                 """SELECT target_date, MAX(ran_at) AS last_run
@@ -62,49 +63,19 @@ if st.sidebar.button("Refresh KPIs now"):
 # -------------------------------
 @st.cache_data(ttl=60)
 def kpis_for_day(day):
-    q = """
-    WITH todays AS (
-      SELECT * FROM appointments
-      WHERE DATE(appt_start) = :d
-    ),
-    completed AS (
-      SELECT * FROM todays WHERE status='completed'
-    ),
-    noshow AS (
-      SELECT * FROM todays WHERE status='no_show'
-    ),
-    canceled AS (
-      SELECT * FROM todays WHERE status='canceled'
-    )
-    SELECT
-      (SELECT COUNT(*) FROM todays) AS bookings,
-      (SELECT COUNT(*) FROM canceled) AS cancellations,
-      (SELECT CASE WHEN (SELECT COUNT(*) FROM completed)+ (SELECT COUNT(*) FROM noshow) = 0
-              THEN 0.0
-              ELSE 1.0 * (SELECT COUNT(*) FROM completed) /
-                   ((SELECT COUNT(*) FROM completed) + (SELECT COUNT(*) FROM noshow))
-           END) AS show_rate,
-      (SELECT COALESCE(SUM(price_estimate),0) FROM todays) AS revenue_estimate,
-      (SELECT COALESCE(SUM(amount),0) FROM payments
-         JOIN appointments a ON a.appointment_id = payments.appointment_id
-         WHERE DATE(a.appt_start) = :d) AS revenue_paid
-    ;
-    """
-    with engine.begin() as conn:
-        row = conn.execute(text(q), {"d": str(day)}).mappings().first()
-        util_q = """
-        WITH todays AS (
-          SELECT physio_id, appt_start, appt_end FROM appointments
-          WHERE DATE(appt_start) = :d
-        )
-        SELECT p.full_name,
-               SUM(strftime('%s', appt_end) - strftime('%s', appt_start)) / 3600.0 AS hours_scheduled
-        FROM todays t JOIN physios p ON p.physio_id = t.physio_id
-        GROUP BY p.full_name
-        ORDER BY p.full_name;
-        """
-        util = pd.read_sql(text(util_q), conn, params={"d": str(day)})
-    return row, util
+    # pre-aggregated by etl/load.py and etl/refresh_daily.py (see common/rollups.py)
+    with read_engine.begin() as conn:
+        row = conn.execute(text(KPI_DAY_SQL), {"d": str(day)}).mappings().first()
+        util = pd.read_sql(text(UTIL_DAY_SQL), conn, params={"d": str(day)})
+    if row is None:
+        row = {
+            "bookings": 0,
+            "cancellations": 0,
+            "show_rate": 0.0,
+            "revenue_estimate": 0.0,
+            "revenue_paid": 0.0,
+        }
+    return dict(row), util
 
 
 row, util = kpis_for_day(picked_day)
@@ -131,19 +102,8 @@ st.subheader("Last 14 days trend")
 
 @st.cache_data(ttl=60)
 def last_14_days():
-    q = """
-    SELECT DATE(appt_start) AS d,
-           COUNT(*) AS bookings,
-           SUM(CASE WHEN status='canceled' THEN 1 ELSE 0 END) AS cancellations,
-           SUM(CASE WHEN status='completed' THEN 1 ELSE 0 END) AS completed,
-           SUM(CASE WHEN status='no_show' THEN 1 ELSE 0 END) AS no_show
-    FROM appointments
-    WHERE appt_start >= DATE('now','-14 day')
-    GROUP BY DATE(appt_start)
-    ORDER BY DATE(appt_start);
-    """
-    with engine.begin() as conn:
-        return pd.read_sql(text(q), conn)
+    with read_engine.begin() as conn:
+        return pd.read_sql(text(TREND_SQL), conn)
 
 
 trend = last_14_days()
@@ -157,33 +117,39 @@ st.line_chart(
 st.subheader("Tomorrow at a glance")
 
 tomorrow = today + timedelta(days=1)
-priorities_file = (
-    Path(__file__).resolve().parents[1]
-    / ".."
-    / "02_reception_automation"
-    / f"priorities_{tomorrow.isoformat()}.csv"
-)
 
-if priorities_file.exists():
-    df = pd.read_csv(priorities_file)
-    if not df.empty:
-        high_risk = (df["risk_bucket"] == "high").sum()
-        missing_phone = df["missing_phone"].sum()
-        missing_consent = df["missing_consent"].sum()
+# n_rows is NULL when the day's list was never built
+PRIORITY_SUMMARY_SQL = """
+SELECT (SELECT n_rows FROM priority_builds WHERE day = :d) AS n_rows,
+       COALESCE(SUM(risk_bucket = 'high'), 0) AS high_risk,
+       COALESCE(SUM(missing_phone), 0) AS missing_phone,
+       COALESCE(SUM(missing_consent), 0) AS missing_consent
+FROM priorities WHERE day = :d
+"""
+
+PRIORITY_TOP_SQL = """
+SELECT patient_name, physio_name, appt_start, priority_reason, priority_score
+FROM priorities WHERE day = :d
+ORDER BY priority_score DESC, appointment_id
+LIMIT 10
+"""
+
+
+@st.cache_data(ttl=60)
+def tomorrow_priorities(day: str):
+    with read_engine.begin() as conn:
+        summary = conn.execute(text(PRIORITY_SUMMARY_SQL), {"d": day}).mappings().one()
+        top = pd.read_sql(text(PRIORITY_TOP_SQL), conn, params={"d": day})
+    return dict(summary), top
+
+
+summary, top = tomorrow_priorities(tomorrow.isoformat())
+if summary["n_rows"] is not None:
+    if summary["n_rows"]:
         st.write(
-            f"📌 Appointments: {len(df)} | ⚠️ High risk: {high_risk} | ☎ Missing phone: {missing_phone} | 📄 Missing consent: {missing_consent}"
-        )
-        st.dataframe(
-            df[
-                [
-                    "patient_name",
-                    "physio_name",
-                    "appt_start",
-                    "priority_reason",
-                    "priority_score",
-                ]
-            ].head(10)
+            f"📌 Appointments: {summary['n_rows']} | ⚠️ High risk: {summary['high_risk']} | ☎ Missing phone: {summary['missing_phone']} | 📄 Missing consent: {summary['missing_consent']}"
         )
+        st.dataframe(top)
     else:
         st.info("No appointments for tomorrow.")
 else:
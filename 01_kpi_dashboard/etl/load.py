@@ -3,9 +3,11 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[2]))
 
-import pandas as pd
 from sqlalchemy import text
+from common.bulk import stream_csv
 from common.db import engine, run_sql_file
+from common.patient_history import rebuild_patient_history
+from common.rollups import rebuild_rollups
 
 
 root = Path(__file__).resolve().parents[2]
@@ -14,8 +16,13 @@ schema_path = root / "01_kpi_dashboard" / "schema.sql"
 
 
 def load_table(csv_path, table):
-    df = pd.read_csv(csv_path)
-    df.to_sql(table, engine, if_exists="append", index=False)
+    """Stream a CSV into `table` in chunks, one transaction per table"""
+    stats = stream_csv(engine, csv_path, table)
+    print(
+        f"  {table}: {stats['rows']:,} rows in {stats['seconds']:.2f}s "
+        f"({stats['rows_per_sec']:,.0f} rows/s)"
+    )
+    return stats
 
 
 if __name__ == "__main__":
@@ -34,4 +41,9 @@ if __name__ == "__main__":
     load_table(raw / "appointments.csv", "appointments")
     load_table(raw / "payments.csv", "payments")
 
+    # fill the dashboard rollups and scoring history from the freshly loaded tables
+    with engine.begin() as conn:
+        rebuild_rollups(conn)
+        rebuild_patient_history(conn)
+
     print("Loaded CSVs into DB.")
@@ -51,11 +51,6 @@ CREATE TABLE IF NOT EXISTS payments_v2 (
   paid_date TEXT GENERATED ALWAYS AS (date(paid_at)) STORED
 );
 
--- indices
-CREATE INDEX IF NOT EXISTS idx_appt_date ON appointments_v2(appt_date);
-CREATE INDEX IF NOT EXISTS idx_appt_physio_date ON appointments_v2(physio_id, appt_date);
-CREATE INDEX IF NOT EXISTS idx_payments_paid_date ON payments_v2(paid_date);
-
 -- prevent payments unless the appointment is completed
 CREATE TRIGGER IF NOT EXISTS trg_payments_only_completed
 BEFORE INSERT ON payments_v2
@@ -96,6 +91,16 @@ ALTER TABLE appointments_v2 RENAME TO appointments;
 ALTER TABLE payments_v2 RENAME TO payments;
 """
 
+# created after the swap: schema.sql may already own these index names on the
+# old tables, and they go away with the DROPs above
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_appt_date ON appointments(appt_date);
+CREATE INDEX IF NOT EXISTS idx_appt_physio_date ON appointments(physio_id, appt_date);
+CREATE INDEX IF NOT EXISTS idx_appt_patient_date ON appointments(patient_id, appt_date);
+CREATE INDEX IF NOT EXISTS idx_payments_paid_date ON payments(paid_date);
+CREATE INDEX IF NOT EXISTS idx_payments_appointment ON payments(appointment_id);
+"""
+
 
 def run():
     # Use raw sqlite3 connection underneath SQLAlchemy so we can call executescript
@@ -106,6 +111,7 @@ def run():
         raw.executescript(DDL)
         raw.executescript(COPY)  # will raise if any row violates new checks
         raw.executescript(SWAP)
+        raw.executescript(INDEXES)
     print("✅ Migration to v2 schema completed.")
 
 
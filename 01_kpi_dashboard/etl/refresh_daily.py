@@ -3,10 +3,52 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[2]))
 
-import argparse, pandas as pd
-from datetime import datetime
-from sqlalchemy import text
-from common.db import engine
+import argparse
+import hashlib
+import importlib
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from common.bulk import coerce_frame, delete_keys, read_csv_text, table_columns, upsert_frame
+from common.db import engine, read_engine
+from common.patient_history import refresh_patient_history
+from common.rollups import refresh_rollups
+from common.validate_frames import forget, known_ids, quarantine, remember, validate_day
+
+DAY_APPOINTMENT_ROWS = """
+SELECT appointment_id, patient_id, physio_id, appt_start, appt_end, booked_at,
+       status, price_estimate
+FROM appointments WHERE appt_date=:d
+"""
+DAY_APPOINTMENT_IDS = """
+SELECT appointment_id FROM appointments WHERE appt_date=:d
+"""
+DAY_PAYMENT_ROWS = """
+SELECT p.payment_id, p.appointment_id, p.amount, p.paid_at, p.method
+FROM payments p JOIN appointments a ON a.appointment_id = p.appointment_id
+WHERE a.appt_date=:d
+"""
+# where an incoming id currently sits (rescheduled appointments move days,
+# corrected rows can move patients)
+CURRENT_DATES = """
+SELECT appt_date, patient_id FROM appointments WHERE appointment_id IN :ids
+"""
+# the day of the appointment a stored payment belongs to (revenue_paid), which
+# can differ from the drop's day
+PAYMENT_DATES = """
+SELECT a.appt_date FROM payments p JOIN appointments a ON a.appointment_id = p.appointment_id
+WHERE p.payment_id IN :ids
+"""
+
+MANIFEST_FILES = ("appointments.csv", "payments.csv")
+
+QUARANTINE_ROOT = Path(__file__).resolve().parents[2] / "data" / "quarantine"
 
 
 def latest_day_dir(daily_root: Path) -> Path:
@@ -17,45 +59,396 @@ def latest_day_dir(daily_root: Path) -> Path:
     return sorted(dirs)[-1]
 
 
-def refresh_for_day(day: str, daily_dir: Path):
-    """Refresh DB for a given day from daily snapshot"""
+def day_dirs_between(daily_root: Path, start: str = None, end: str = None) -> list:
+    """Daily folders named YYYY-MM-DD within [start, end], oldest first"""
+    out = []
+    for p in sorted(daily_root.glob("*")):
+        try:
+            date.fromisoformat(p.name)
+        except ValueError:
+            continue
+        if p.is_dir() and (start is None or p.name >= start) and (end is None or p.name <= end):
+            out.append(p)
+    return out
+
+
+def file_hashes(daily_dir: Path) -> dict:
+    """sha256 per drop file; a missing file hashes to an empty string"""
+    out = {}
+    for name in MANIFEST_FILES:
+        path = daily_dir / name
+        out[name] = hashlib.sha256(path.read_bytes()).hexdigest() if path.exists() else ""
+    return out
+
+
+def load_manifest(conn, days) -> dict:
+    """{day: {file: sha256}} for days that were loaded before"""
+    q = text("SELECT day, file, sha256 FROM etl_manifest WHERE day IN :days").bindparams(
+        bindparam("days", expanding=True)
+    )
+    out = {}
+    for day, name, sha in conn.execute(q, {"days": list(days)}):
+        out.setdefault(day, {})[name] = sha
+    return out
+
+
+def read_day(daily_dir: Path, appt_types: dict, pay_types: dict, known: dict = None):
+    """Parse and check one day folder; safe to run in a worker process.
+
+    Returns None without parsing when the file hashes match `known` (the
+    manifest entry for this day), else (appointments, payments, hashes).
+    """
+    hashes = file_hashes(daily_dir)
+    if known is not None and known == hashes:
+        return None
+
     appt_csv = daily_dir / "appointments.csv"
     pay_csv = daily_dir / "payments.csv"
 
-    appts = pd.read_csv(appt_csv)
+    appts = read_csv_text(appt_csv)
     pays = (
-        pd.read_csv(pay_csv)
+        read_csv_text(pay_csv)
         if pay_csv.exists()
-        else pd.DataFrame(
-            columns=["payment_id", "appointment_id", "amount", "paid_at", "method"]
-        )
+        else pd.DataFrame(columns=list(pay_types))
     )
 
-    with engine.begin() as conn:
-        # remove existing rows for that day
+    for name, df, types in (("appointments", appts, appt_types), ("payments", pays, pay_types)):
+        missing = [c for c in types if c not in df.columns]
+        if missing:
+            raise ValueError(f"{daily_dir.name}/{name}.csv missing columns: {missing}")
+    dupes = appts["appointment_id"][appts["appointment_id"].duplicated()]
+    if not dupes.empty:
+        raise ValueError(f"{daily_dir.name}: duplicate appointment_id {dupes.tolist()[:5]}")
+
+    return coerce_frame(appts, appt_types), coerce_frame(pays, pay_types), hashes
+
+
+def _diff(existing: pd.DataFrame, incoming: pd.DataFrame, key: str, types: dict):
+    """Rows of `incoming` that are new or changed, and keys missing from it"""
+    existing = coerce_frame(existing, types)
+    merged = incoming.merge(
+        existing, on=key, how="left", suffixes=("", "_old"), indicator=True
+    )
+    new = merged["_merge"] == "left_only"
+    changed = pd.Series(False, index=merged.index)
+    for c in incoming.columns:
+        if c == key:
+            continue
+        a, b = merged[c], merged[f"{c}_old"]
+        changed |= (a != b).fillna(True) & ~(a.isna() & b.isna())
+    upserts = incoming[(new | changed).to_numpy()]
+    deleted = existing.loc[~existing[key].isin(incoming[key]), key]
+    return upserts, deleted.tolist(), int(new.sum())
+
+
+def _current_dates(conn, ids):
+    """(days, patients) the given appointment ids currently belong to"""
+    q = text(CURRENT_DATES).bindparams(bindparam("ids", expanding=True))
+    days, patients = set(), set()
+    ids = [int(i) for i in ids]
+    for i in range(0, len(ids), 500):
+        for d, pid in conn.execute(q, {"ids": ids[i : i + 500]}):
+            days.add(d)
+            patients.add(pid)
+    return days, patients
+
+
+def _payment_dates(conn, pay_up: pd.DataFrame, pay_del: list) -> set:
+    """Days whose revenue_paid moves: of the appointments upserted payments
+    point at, and of those upserted or deleted payments pointed at before"""
+    days, _ = _current_dates(conn, pay_up["appointment_id"].dropna())
+    q = text(PAYMENT_DATES).bindparams(bindparam("ids", expanding=True))
+    ids = [int(i) for i in pay_up["payment_id"]] + [int(i) for i in pay_del]
+    for i in range(0, len(ids), 500):
+        days.update(d for (d,) in conn.execute(q, {"ids": ids[i : i + 500]}))
+    return days
+
+
+def _log_run(conn, job: str, day: str):
+    conn.execute(
+        text("INSERT INTO etl_runs(job, target_date, ran_at) VALUES(:j,:td,:t)"),
+        {"j": job, "td": day, "t": datetime.utcnow().isoformat()},
+    )
+
+
+def apply_day(
+    conn,
+    day: str,
+    appts: pd.DataFrame,
+    pays: pd.DataFrame,
+    hashes: dict = None,
+    held: dict = None,
+):
+    """Bring one day in line with its drop inside the caller's transaction.
+
+    Only rows that were added, changed or removed are written; a re-sent day
+    with a handful of edits costs a handful of statements. Keys in `held`
+    ({table: ids}, the quarantined rows) keep their current DB version, and
+    so does an appointment missing from the drop while a payment still points
+    at it. The manifest hashes are only saved when nothing was held, so the
+    same files sent again are retried instead of skipped.
+    """
+    held = dict(held or {})
+    appt_types = table_columns(conn, "appointments")
+    pay_types = table_columns(conn, "payments")
+    old_appts = pd.read_sql(text(DAY_APPOINTMENT_ROWS), conn, params={"d": day})
+    old_pays = pd.read_sql(text(DAY_PAYMENT_ROWS), conn, params={"d": day})
+
+    appt_up, appt_del, appt_new = _diff(old_appts, appts, "appointment_id", appt_types)
+    pay_up, pay_del, pay_new = _diff(old_pays, pays, "payment_id", pay_types)
+    appt_del = [i for i in appt_del if i not in held.get("appointments", ())]
+    pay_del = [i for i in pay_del if i not in held.get("payments", ())]
+    # a payment that stays (held, kept or re-sent) keeps its appointment (FK)
+    if appt_del:
+        staying = old_pays[
+            ~old_pays["payment_id"].isin(pay_del)
+            & ~old_pays["payment_id"].isin(pay_up["payment_id"])
+        ]
+        paid = set(staying["appointment_id"]) | set(pay_up["appointment_id"])
+        kept = {i for i in appt_del if i in paid}
+        if kept:
+            appt_del = [i for i in appt_del if i not in kept]
+            held["appointments"] = set(held.get("appointments", ())) | kept
+
+    # days whose rollups move: this one, where upserted rows land, where
+    # rescheduled appointments used to be, and where changed payments belong
+    touched = {day}
+    # patients whose history moves: on either side of an upsert, or deleted
+    patients = set(old_appts.loc[old_appts["appointment_id"].isin(appt_del), "patient_id"])
+    if not appt_up.empty:
+        touched |= set(
+            pd.to_datetime(appt_up["appt_start"], utc=True).dt.strftime("%Y-%m-%d")
+        )
+        days, before = _current_dates(conn, appt_up["appointment_id"])
+        touched |= days
+        patients |= before | set(appt_up["patient_id"].dropna())
+    if pay_del or not pay_up.empty:
+        touched |= _payment_dates(conn, pay_up, pay_del)
+
+    # payments first on the way out and last on the way in (FK order)
+    delete_keys(conn, "payments", "payment_id", pay_del)
+    delete_keys(conn, "appointments", "appointment_id", appt_del)
+    upsert_frame(conn, "appointments", appt_up, "appointment_id", appt_types)
+    upsert_frame(conn, "payments", pay_up, "payment_id", pay_types)
+
+    stats = {
+        "appointments": (appt_new, len(appt_up) - appt_new, len(appt_del)),
+        "payments": (pay_new, len(pay_up) - pay_new, len(pay_del)),
+    }
+    if appt_del or pay_del or not appt_up.empty or not pay_up.empty:
+        refresh_rollups(conn, touched)
+    if patients:
+        refresh_patient_history(conn, patients)
+
+    if hashes is not None and any(held.values()):
+        conn.execute(text("DELETE FROM etl_manifest WHERE day=:d"), {"d": day})
+    elif hashes is not None:
+        rows = {"appointments.csv": len(appts), "payments.csv": len(pays)}
+        t = datetime.utcnow().isoformat()
         conn.execute(
             text(
-                "DELETE FROM payments WHERE appointment_id IN "
-                "(SELECT appointment_id FROM appointments WHERE DATE(appt_start)=:d)"
+                "INSERT INTO etl_manifest(day, file, sha256, rows, loaded_at) "
+                "VALUES(:d, :f, :h, :n, :t) ON CONFLICT (day, file) DO UPDATE SET "
+                "sha256=excluded.sha256, rows=excluded.rows, loaded_at=excluded.loaded_at"
             ),
-            {"d": day},
-        )
-        conn.execute(
-            text("DELETE FROM appointments WHERE DATE(appt_start)=:d"), {"d": day}
+            [{"d": day, "f": f, "h": h, "n": rows[f], "t": t} for f, h in hashes.items()],
         )
 
-        # insert fresh data
-        appts.to_sql("appointments", conn.connection, if_exists="append", index=False)
-        if not pays.empty:
-            pays.to_sql("payments", conn.connection, if_exists="append", index=False)
+    # log the run
+    _log_run(conn, "refresh_daily", day)
+    return stats
 
-        # log the run
-        conn.execute(
-            text("INSERT INTO etl_runs(job, target_date, ran_at) VALUES(:j,:td,:t)"),
-            {"j": "refresh_daily", "td": day, "t": datetime.utcnow().isoformat()},
-        )
 
-    print(f"✅ Refreshed day {day} from {daily_dir}")
+def _fmt(stats: dict) -> str:
+    return ", ".join(f"{k} +{i} ~{u} -{d}" for k, (i, u, d) in stats.items())
+
+
+def _written(stats: dict) -> int:
+    return sum(sum(v) for v in stats.values())
+
+
+def _schema_types():
+    with engine.begin() as conn:
+        return table_columns(conn, "appointments"), table_columns(conn, "payments")
+
+
+def screen_day(day: str, appts: pd.DataFrame, pays: pd.DataFrame, ids: dict):
+    """Run the frame checks on a parsed drop, quarantine what fails.
+
+    `ids` (known_ids) follows the day: the day's appointments missing from the
+    drop are forgotten before the checks, so payments still pointing at them
+    are held instead of written, and the accepted ones are remembered for
+    later days of a backfill. Returns (appts, pays, held) ready for apply_day.
+    """
+    with read_engine.begin() as conn:
+        current = pd.read_sql(text(DAY_APPOINTMENT_IDS), conn, params={"d": day})
+    current = current["appointment_id"]
+    forget(ids, "appointments", current[~current.isin(appts["appointment_id"])])
+    appts, pays, report = validate_day(appts, pays, ids)
+    remember(ids, "appointments", appts["appointment_id"])
+    where = quarantine(day, report, QUARANTINE_ROOT)
+    if report["rejected"]:
+        counts = ", ".join(f"{k}={v}" for k, v in report["rejected"].items())
+        print(f"  🧪 {day}: quarantined {counts} -> {where}")
+    if report["warnings"]:
+        counts = ", ".join(f"{k}={v}" for k, v in report["warnings"].items())
+        print(f"  ⚠️ {day}: {counts}")
+    held = {}
+    for table, key in (("appointments", "appointment_id"), ("payments", "payment_id")):
+        if table in report["quarantine"]:
+            held[table] = set(report["quarantine"][table][key].dropna().astype(int))
+    return appts, pays, held
+
+
+def _log_failed(day: str):
+    """etl_runs entry for a day whose drop could not be read or applied"""
+    with engine.begin() as conn:
+        _log_run(conn, "refresh_daily_failed", day)
+
+
+def _apply_batch(batch: list) -> tuple:
+    """Apply parsed days in one transaction; (rows written, failed days).
+
+    When a day fails the transaction is rolled back and the days are applied
+    one per transaction, so only the failing ones are lost.
+    """
+    try:
+        with engine.begin() as conn:
+            return sum(_written(apply_day(conn, *item)) for item in batch), []
+    except Exception as e:
+        if len(batch) == 1:
+            _log_failed(batch[0][0])
+            return 0, [(batch[0][0], str(e))]
+    n_rows, failed = 0, []
+    for item in batch:
+        rows, bad = _apply_batch([item])
+        n_rows += rows
+        failed += bad
+    return n_rows, failed
+
+
+def _rebuild_priorities():
+    """Tomorrow's priority list reads patient_history, which a refresh that
+    wrote rows has just changed"""
+    bp = importlib.import_module("02_reception_automation.build_priorities")
+    bp.rebuild_tomorrow("refresh_daily")
+
+
+def refresh_for_day(day: str, daily_dir: Path, force: bool = False):
+    """Refresh DB for a given day from daily snapshot (no-op if unchanged).
+
+    When rows were written, tomorrow's priority list is rebuilt.
+    """
+    appt_types, pay_types = _schema_types()
+    with engine.begin() as conn:
+        known = None if force else load_manifest(conn, [day]).get(day)
+
+    try:
+        parsed = read_day(daily_dir, appt_types, pay_types, known)
+        if parsed is None:
+            with engine.begin() as conn:
+                _log_run(conn, "refresh_daily_unchanged", day)
+            print(f"⏭️  Day {day} unchanged since last load, skipped")
+            return
+
+        appts, pays, hashes = parsed
+        with read_engine.begin() as conn:
+            ids = known_ids(conn)
+        appts, pays, held = screen_day(day, appts, pays, ids)
+        with engine.begin() as conn:
+            stats = apply_day(conn, day, appts, pays, hashes, held)
+    except Exception:
+        _log_failed(day)
+        raise
+
+    print(f"✅ Refreshed day {day} from {daily_dir} ({_fmt(stats)})")
+    if _written(stats):
+        _rebuild_priorities()
+
+
+def backfill(day_dirs: list, workers: int = None, batch_days: int = 7, force: bool = False):
+    """Refresh many day folders: parse in a process pool, write from here.
+
+    Days are applied oldest first in transactions of `batch_days` days.
+    Unchanged folders are skipped. A folder that fails to parse or apply is
+    logged in etl_runs as refresh_daily_failed and the run goes on with the
+    rest; returns the number of failed days. When rows were written,
+    tomorrow's priority list is rebuilt once at the end.
+    """
+    if not day_dirs:
+        print("No daily folders in range. Nothing to backfill.")
+        return 0
+
+    appt_types, pay_types = _schema_types()
+    with engine.begin() as conn:
+        manifest = {} if force else load_manifest(conn, [d.name for d in day_dirs])
+    with read_engine.begin() as conn:
+        ids = known_ids(conn)
+    workers = workers or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    n_days, n_rows, skipped, failed = 0, 0, [], []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # bounded look-ahead so parsed frames do not pile up ahead of the writer
+        window = 2 * workers * batch_days
+        todo = deque(day_dirs)
+        inflight = deque()
+        while todo or inflight:
+            while todo and len(inflight) < window:
+                d = todo.popleft()
+                known = manifest.get(d.name)
+                inflight.append((d, pool.submit(read_day, d, appt_types, pay_types, known)))
+
+            batch, unchanged = [], []
+            while inflight and len(batch) < batch_days:
+                d, fut = inflight.popleft()
+                try:
+                    parsed = fut.result()
+                except Exception as e:
+                    _log_failed(d.name)
+                    failed.append((d.name, str(e)))
+                    print(f"  ⚠️ {d.name}: {e}")
+                    continue
+                if parsed is None:
+                    unchanged.append(d.name)
+                    continue
+                appts, pays, hashes = parsed
+                appts, pays, held = screen_day(d.name, appts, pays, ids)
+                batch.append((d.name, appts, pays, hashes, held))
+
+            if unchanged:
+                # same record refresh_for_day leaves for a skipped day
+                with engine.begin() as conn:
+                    for day in unchanged:
+                        _log_run(conn, "refresh_daily_unchanged", day)
+                skipped += unchanged
+            if not batch:
+                continue
+            rows, bad = _apply_batch(batch)
+            for day, error in bad:
+                print(f"  ⚠️ {day}: {error}")
+            n_rows += rows
+            n_days += len(batch) - len(bad)
+            failed += bad
+            if len(bad) == len(batch):
+                continue
+            secs = time.perf_counter() - t0
+            print(
+                f"  [{n_days + len(skipped) + len(failed)}/{len(day_dirs)}] "
+                f"{batch[0][0]}..{batch[-1][0]} committed, {n_rows:,} rows written, {secs:.1f}s"
+            )
+
+    secs = time.perf_counter() - t0
+    print(
+        f"✅ Backfilled {n_days} days ({len(skipped)} unchanged, skipped), "
+        f"{n_rows:,} rows written in {secs:.2f}s "
+        f"({n_rows / secs:,.0f} rows/s, {(n_days + len(skipped)) / secs:.1f} days/s)"
+    )
+    if failed:
+        print(f"❌ {len(failed)} day(s) failed: {', '.join(d for d, _ in failed)}")
+    if n_rows:
+        _rebuild_priorities()
+    return len(failed)
 
 
 if __name__ == "__main__":
@@ -66,8 +459,24 @@ if __name__ == "__main__":
     parser.add_argument(
         "--day", help="YYYY-MM-DD (default = latest folder under data/daily)"
     )
+    parser.add_argument("--from", dest="start", help="backfill from YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", help="backfill up to YYYY-MM-DD")
+    parser.add_argument(
+        "--all", action="store_true", help="backfill every folder under data/daily"
+    )
+    parser.add_argument("--workers", type=int, help="parser processes (default = CPUs)")
+    parser.add_argument(
+        "--batch-days", type=int, default=7, help="days per write transaction"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="reload even if the drop files are unchanged"
+    )
     args = parser.parse_args()
 
+    if args.all or args.start or args.end:
+        dirs = day_dirs_between(daily_root, args.start, args.end)
+        sys.exit(1 if backfill(dirs, args.workers, args.batch_days, args.force) else 0)
+
     if args.day:
         day = args.day
         ddir = daily_root / day
@@ -76,4 +485,4 @@ if __name__ == "__main__":
         ddir = latest_day_dir(daily_root)
         day = ddir.name  # folder name is the date
 
-    refresh_for_day(day, ddir)
+    refresh_for_day(day, ddir, force=args.force)
@@ -22,7 +22,8 @@ CREATE TABLE IF NOT EXISTS appointments (
   appt_end   TEXT NOT NULL,
   booked_at  TEXT NOT NULL,
   status     TEXT NOT NULL CHECK (status IN ('booked','completed','canceled','no_show')),
-  price_estimate REAL NOT NULL
+  price_estimate REAL NOT NULL,
+  appt_date TEXT GENERATED ALWAYS AS (date(appt_start)) STORED
 );
 
 CREATE TABLE IF NOT EXISTS payments (
@@ -30,12 +31,138 @@ CREATE TABLE IF NOT EXISTS payments (
   appointment_id INTEGER NOT NULL REFERENCES appointments(appointment_id),
   amount REAL NOT NULL,
   paid_at TEXT NOT NULL,
-  method TEXT NOT NULL
+  method TEXT NOT NULL,
+  paid_date TEXT GENERATED ALWAYS AS (date(paid_at)) STORED
 );
 
+-- day-scoped queries filter on the stored dates so these indexes can serve them
+CREATE INDEX IF NOT EXISTS idx_appt_date ON appointments(appt_date);
+CREATE INDEX IF NOT EXISTS idx_appt_physio_date ON appointments(physio_id, appt_date);
+CREATE INDEX IF NOT EXISTS idx_appt_patient_date ON appointments(patient_id, appt_date);
+CREATE INDEX IF NOT EXISTS idx_payments_paid_date ON payments(paid_date);
+CREATE INDEX IF NOT EXISTS idx_payments_appointment ON payments(appointment_id);
+
 CREATE TABLE IF NOT EXISTS etl_runs (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   job TEXT NOT NULL,
   target_date TEXT NOT NULL,
   ran_at TEXT NOT NULL
 );
+
+-- content hash per daily drop file, so refresh_daily can skip unchanged days
+CREATE TABLE IF NOT EXISTS etl_manifest (
+  day TEXT NOT NULL,
+  file TEXT NOT NULL,
+  sha256 TEXT NOT NULL,
+  rows INTEGER NOT NULL,
+  loaded_at TEXT NOT NULL,
+  PRIMARY KEY (day, file)
+);
+
+
+-- pre-aggregated KPIs per day, maintained by load.py and refresh_daily.py
+CREATE TABLE IF NOT EXISTS daily_kpis (
+  day TEXT PRIMARY KEY,
+  bookings INTEGER NOT NULL DEFAULT 0,
+  completed INTEGER NOT NULL DEFAULT 0,
+  canceled INTEGER NOT NULL DEFAULT 0,
+  no_show INTEGER NOT NULL DEFAULT 0,
+  revenue_estimate REAL NOT NULL DEFAULT 0,
+  revenue_paid REAL NOT NULL DEFAULT 0,
+  updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS daily_utilization (
+  day TEXT NOT NULL,
+  physio_id INTEGER NOT NULL,
+  appointments INTEGER NOT NULL DEFAULT 0,
+  hours_scheduled REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, physio_id)
+);
+
+-- per patient and appointment day, the history a scorer needs up to that day
+-- (prior_* and the rolling windows exclude the day itself), kept current by
+-- refresh_daily for the patients a refresh touches. pos counts canceled and
+-- no_show (the model label), noshow only no_show (build_priorities)
+CREATE TABLE IF NOT EXISTS patient_history (
+  patient_id INTEGER NOT NULL,
+  day TEXT NOT NULL,
+  n_total INTEGER NOT NULL,
+  n_pos INTEGER NOT NULL,
+  n_noshow INTEGER NOT NULL,
+  prior_total INTEGER NOT NULL,
+  prior_pos INTEGER NOT NULL,
+  first_seen TEXT NOT NULL,
+  last_seen TEXT,
+  total_30d INTEGER NOT NULL DEFAULT 0,
+  pos_30d INTEGER NOT NULL DEFAULT 0,
+  noshow_30d INTEGER NOT NULL DEFAULT 0,
+  total_90d INTEGER NOT NULL DEFAULT 0,
+  pos_90d INTEGER NOT NULL DEFAULT 0,
+  noshow_90d INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (patient_id, day)
+);
+
+-- cancellation model output, one row per appointment and model version
+-- (no FK so a refresh can still delete rescheduled appointments)
+CREATE TABLE IF NOT EXISTS cancellation_scores (
+  appointment_id INTEGER NOT NULL,
+  model_version TEXT NOT NULL,
+  day TEXT NOT NULL,
+  risk_score REAL NOT NULL,
+  risk_bucket TEXT NOT NULL,
+  scored_at TEXT NOT NULL,
+  PRIMARY KEY (appointment_id, model_version)
+);
+CREATE INDEX IF NOT EXISTS idx_scores_day ON cancellation_scores(day, scored_at);
+
+-- the reception callback lists, written by build_priorities. A build replaces
+-- its days' rows and priority_builds entries in one transaction, so readers
+-- see the previous lists or the new ones, never a mix. A day with a
+-- priority_builds row but no priorities rows was built and had no
+-- appointments.
+CREATE TABLE IF NOT EXISTS priorities (
+  day TEXT NOT NULL,
+  appointment_id INTEGER NOT NULL,
+  patient_id INTEGER NOT NULL,
+  patient_name TEXT NOT NULL,
+  phone TEXT,
+  consent_form_received INTEGER,
+  physio_name TEXT,
+  appt_start TEXT NOT NULL,
+  appt_end TEXT,
+  booked_at TEXT,
+  is_new_patient INTEGER NOT NULL,
+  noshow_rate_90d REAL NOT NULL,
+  risk_score REAL NOT NULL,
+  risk_bucket TEXT NOT NULL,
+  missing_phone INTEGER NOT NULL,
+  missing_consent INTEGER NOT NULL,
+  priority_score REAL NOT NULL,
+  priority_reason TEXT NOT NULL,
+  PRIMARY KEY (day, appointment_id)
+);
+CREATE INDEX IF NOT EXISTS idx_priorities_score ON priorities(day, priority_score);
+CREATE INDEX IF NOT EXISTS idx_priorities_bucket ON priorities(day, risk_bucket);
+
+CREATE TABLE IF NOT EXISTS priority_builds (
+  day TEXT PRIMARY KEY,
+  built_at TEXT NOT NULL,
+  n_rows INTEGER NOT NULL
+);
+
+-- SMTP delivery of reminders (send_reminders --smtp), one row per appointment
+-- and day. content_sha is the hash of the reminder that was sent, so an
+-- unchanged reminder is not sent twice and a changed one (new time or physio)
+-- is.
+CREATE TABLE IF NOT EXISTS reminder_deliveries (
+  day TEXT NOT NULL,
+  appointment_id INTEGER NOT NULL,
+  recipient TEXT NOT NULL,
+  content_sha TEXT NOT NULL,
+  status TEXT NOT NULL CHECK (status IN ('sent','failed')),
+  attempts INTEGER NOT NULL,
+  last_error TEXT,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (day, appointment_id)
+);
@@ -3,15 +3,20 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
-import argparse, os
-from pathlib import Path
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import pandas as pd
+
 import numpy as np
-from sqlalchemy import text
-from common.db import engine
+import pandas as pd
 import pytz
+from sqlalchemy import text
 
+from common.bulk import insert_frame, upsert_frame
+from common.db import engine, read_engine, run_sql_file
 
 BERLIN = pytz.timezone("Europe/Berlin")
 
@@ -20,193 +25,343 @@ def _tomorrow_str():
     return (datetime.now(BERLIN).date() + timedelta(days=1)).isoformat()
 
 
-def _load_day_appointments(day: str) -> pd.DataFrame:
-    q = """
-    SELECT a.appointment_id, a.patient_id, a.physio_id,
-           a.appt_start, a.appt_end, a.booked_at, a.status, a.price_estimate,
-           p.first_name, p.last_name, p.phone, p.consent_form_received,
-           ph.full_name AS physio_name
-    FROM appointments a
-    JOIN patients p ON p.patient_id = a.patient_id
-    JOIN physios ph ON ph.physio_id = a.physio_id
-    WHERE DATE(a.appt_start) = :d
-    ORDER BY a.appt_start;
-    """
-    with engine.begin() as conn:
-        df = pd.read_sql(text(q), conn, params={"d": day})
+# every query takes a day range (start = end for one day) and is index-backed
+RANGE_APPOINTMENTS_SQL = """
+SELECT a.appointment_id, a.patient_id, a.physio_id,
+       a.appt_start, a.appt_end, a.booked_at, a.status, a.price_estimate,
+       p.first_name, p.last_name, p.phone, p.consent_form_received,
+       ph.full_name AS physio_name, a.appt_date
+FROM appointments a
+JOIN patients p ON p.patient_id = a.patient_id
+JOIN physios ph ON ph.physio_id = a.physio_id
+WHERE a.appt_date BETWEEN :start AND :end
+ORDER BY a.appt_date, a.appt_start;
+"""
+
+# each day's row of patient_history for each patient booked that day: a
+# primary key lookup per patient, however long the clinic's history is.
+# prior_total counts every earlier appointment, the 90d columns the 90 days
+# before.
+RANGE_PATIENT_STATS_SQL = """
+SELECT DISTINCT a.appt_date, a.patient_id, h.prior_total, h.total_90d, h.noshow_90d
+FROM appointments a
+LEFT JOIN patient_history h ON h.patient_id = a.patient_id AND h.day = a.appt_date
+WHERE a.appt_date BETWEEN :start AND :end;
+"""
+
+# per day, the scores of the model version that scored it most recently. A
+# rescheduled appointment can have scores on its old day too, so they are
+# matched on (day, appointment_id).
+RANGE_SCORES_SQL = """
+SELECT s.day AS appt_date, s.appointment_id, s.risk_score
+FROM cancellation_scores s
+WHERE s.day BETWEEN :start AND :end
+  AND s.model_version = (
+    SELECT model_version FROM cancellation_scores
+    WHERE day = s.day ORDER BY scored_at DESC LIMIT 1
+  );
+"""
+
+
+# columns of a priorities list (table rows less `day`, and the CSV export)
+COLUMNS = [
+    "appointment_id",
+    "patient_id",
+    "patient_name",
+    "phone",
+    "consent_form_received",
+    "physio_name",
+    "appt_start",
+    "appt_end",
+    "booked_at",
+    "is_new_patient",
+    "noshow_rate_90d",
+    "risk_score",
+    "risk_bucket",
+    "missing_phone",
+    "missing_consent",
+    "priority_score",
+    "priority_reason",
+]
+
+# the day's build, if any: built_at changes with every rebuild
+BUILT_SQL = """
+SELECT built_at, n_rows FROM priority_builds WHERE day = :d;
+"""
+
+# a stored list, highest priority first (ties by appointment)
+DAY_PRIORITIES_SQL = f"""
+SELECT {", ".join(COLUMNS)} FROM priorities
+WHERE day = :d
+ORDER BY priority_score DESC, appointment_id;
+"""
+
+# stored as 0/1 INTEGER, read back as booleans
+BOOL_COLUMNS = ["is_new_patient", "missing_phone", "missing_consent"]
+
+
+def built(day: str) -> dict:
+    """{"built_at", "n_rows"} of the day's stored list, None if never built"""
+    with read_engine.begin() as conn:
+        row = conn.execute(text(BUILT_SQL), {"d": day}).mappings().first()
+    return dict(row) if row else None
+
+
+def load_priorities(day: str) -> pd.DataFrame:
+    """A day's stored list, highest priority first"""
+    with read_engine.begin() as conn:
+        df = pd.read_sql(text(DAY_PRIORITIES_SQL), conn, params={"d": day})
+    return df.astype({c: bool for c in BOOL_COLUMNS})
+
+
+def output_path(day: str) -> Path:
+    return Path(__file__).resolve().parent / f"priorities_{day}.csv"
+
+
+def _write_csv(df: pd.DataFrame, out_csv: Path) -> None:
+    """Write aside and rename, so readers never see a half-written list and
+    concurrent builds of the same day cannot interleave their rows"""
+    tmp = out_csv.with_name(f".{out_csv.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, out_csv)
+
+
+def _load_appointments(start: str, end: str) -> pd.DataFrame:
+    with read_engine.begin() as conn:
+        df = pd.read_sql(text(RANGE_APPOINTMENTS_SQL), conn, params={"start": start, "end": end})
     return df
 
 
-def _is_new_patient(day: str) -> pd.DataFrame:
-    q = """
-    SELECT patient_id,
-           MIN(DATE(appt_start)) AS first_seen
-    FROM appointments
-    WHERE DATE(appt_start) < :d
-    GROUP BY patient_id;
-    """
-    with engine.begin() as conn:
-        seen = pd.read_sql(text(q), conn, params={"d": day})
-    seen["is_new_before_day"] = False
-    return seen
-
-
-def _patient_noshow_rate(day: str, window_days: int = 90) -> pd.DataFrame:
-    q = """
-    SELECT patient_id,
-           SUM(CASE WHEN status='no_show' THEN 1 ELSE 0 END) AS noshows,
-           COUNT(*) AS total
-    FROM appointments
-    WHERE DATE(appt_start) < :d
-      AND DATE(appt_start) >= DATE(:d, :delta)
-    GROUP BY patient_id;
+def _patient_stats(start: str, end: str) -> pd.DataFrame:
+    """is_new_patient and noshow_rate_90d per (appt_date, patient_id) booked in the range"""
+    with read_engine.begin() as conn:
+        stats = pd.read_sql(
+            text(RANGE_PATIENT_STATS_SQL), conn, params={"start": start, "end": end}
+        )
+    # no row means refresh never saw the patient before: new, no history
+    stats["is_new_patient"] = stats["prior_total"].fillna(0) == 0
+    total = stats["total_90d"].fillna(0)
+    stats["noshow_rate_90d"] = (stats["noshow_90d"] / total.replace(0, np.nan)).fillna(0.0)
+    return stats[["appt_date", "patient_id", "is_new_patient", "noshow_rate_90d"]]
+
+
+def _load_model_scores(start: str, end: str) -> pd.DataFrame:
+    with read_engine.begin() as conn:
+        return pd.read_sql(text(RANGE_SCORES_SQL), conn, params={"start": start, "end": end})
+
+
+def _heuristic_risk(
+    rate: np.ndarray, is_new: np.ndarray, hour: np.ndarray, weekday: np.ndarray
+) -> np.ndarray:
+    """Fallback risk for appointments without a model score, in [0, 1].
+
+    Additions run in the same order as the old per-row version, so the floats
+    come out bit-for-bit the same.
     """
-    delta = f"-{window_days} day"
-    with engine.begin() as conn:
-        rates = pd.read_sql(text(q), conn, params={"d": day, "delta": delta})
-    if rates.empty:
-        return pd.DataFrame(columns=["patient_id", "noshow_rate_90d"])
-    rates["noshow_rate_90d"] = rates["noshows"] / rates["total"].replace(0, np.nan)
-    rates["noshow_rate_90d"] = rates["noshow_rate_90d"].fillna(0.0)
-    return rates[["patient_id", "noshow_rate_90d"]]
-
-
-def _load_model_scores(day: str) -> pd.DataFrame:
-    repo = Path(__file__).resolve().parents[1]
-    candidates = [
-        repo / "03_cancellation_model" / "cancellation_scores.csv",
-        repo / "data" / "daily" / day / "cancellation_scores.csv",
-    ]
-    for p in candidates:
-        if p.exists():
-            df = pd.read_csv(p)
-            cols = [c.lower() for c in df.columns]
-            df.columns = cols
-            if "risk_score" not in df.columns and "risk_bucket" in df.columns:
-                mapping = {"low": 0.2, "medium": 0.5, "high": 0.8}
-                df["risk_score"] = (
-                    df["risk_bucket"].str.lower().map(mapping).fillna(0.5)
+    score = 100.0 * rate.astype(float)
+    score = score + np.where(is_new, 15.0, 0.0)
+    score = score + np.where((hour < 10) | (hour >= 17), 10.0, 0.0)
+    score = score + np.where(weekday == 0, 5.0, 0.0)
+    return np.clip(score, 0.0, 100.0) / 100.0
+
+
+_BUCKETS = np.array(["low", "medium", "high"], dtype=object)
+# every reason text, indexed by 8 * bucket + 4 * new + 2 * phone + consent
+_REASONS = np.array(
+    [
+        ", ".join(
+            [
+                p
+                for p, on in zip(
+                    ("new patient", "missing phone", "missing consent"), flags, strict=True
                 )
-            return df[["appointment_id", "risk_score"]]
-    return pd.DataFrame(columns=["appointment_id", "risk_score"])
-
-
-def _heuristic_risk(row, patient_rate: float) -> float:
-    score = 100.0 * float(patient_rate)
-    if row["is_new_patient"]:
-        score += 15.0
-    hour = row["appt_dt"].hour
-    if hour < 10 or hour >= 17:
-        score += 10.0
-    if row["appt_dt"].weekday() == 0:
-        score += 5.0
-    return max(0.0, min(score, 100.0)) / 100.0
-
-
-def _bucket(x: float) -> str:
-    if x >= 0.7:
-        return "high"
-    if x >= 0.4:
-        return "medium"
-    return "low"
-
-
-def build(day: str) -> Path:
-    repo = Path(__file__).resolve().parents[1]
-    outdir = repo / "02_reception_automation"
-    outdir.mkdir(parents=True, exist_ok=True)
-    out_csv = outdir / f"priorities_{day}.csv"
-
-    appts = _load_day_appointments(day)
-    if appts.empty:
-        appts.to_csv(out_csv, index=False)
-        print(f"No appointments for {day}. Wrote empty file {out_csv}")
-        return out_csv
+                if on
+            ]
+            + [f"risk {b}"]
+        )
+        for b in _BUCKETS
+        for flags in np.ndindex(2, 2, 2)
+    ],
+    dtype=object,
+)
 
-    appts["patient_name"] = (
-        appts["first_name"].fillna("") + " " + appts["last_name"].fillna("")
-    )
-    appts["appt_dt"] = pd.to_datetime(appts["appt_start"])
 
-    seen = _is_new_patient(day)
-    appts = appts.merge(
-        seen[["patient_id", "is_new_before_day"]], on="patient_id", how="left"
-    )
-    appts["is_new_patient"] = appts["is_new_before_day"].isna()
-    appts.drop(columns=["is_new_before_day"], inplace=True)
+def _local_hour_weekday(appt_start: pd.Series):
+    """Wall-clock hour and weekday as written in the ISO timestamp.
 
-    rates = _patient_noshow_rate(day)
-    appts = appts.merge(rates, on="patient_id", how="left").fillna(
-        {"noshow_rate_90d": 0.0}
-    )
+    Same as parsing and reading .hour / .weekday(), but without datetime
+    objects, and it holds across the +01:00/+02:00 offset change. Start
+    times repeat a lot (slots), so only the distinct ones are sliced.
+    """
+    codes, starts = pd.factorize(appt_start.astype(str))
+    starts = pd.Series(starts)
+    hour = starts.str.slice(11, 13).astype(int).to_numpy()
+    weekday = pd.to_datetime(starts.str.slice(0, 10), format="%Y-%m-%d").dt.weekday.to_numpy()
+    return hour[codes], weekday[codes]
 
-    appts["missing_phone"] = appts["phone"].astype(str).str.len().fillna(0) < 6
-    appts["missing_consent"] = appts["consent_form_received"].fillna(0).astype(int) == 0
 
-    scores = _load_model_scores(day)
-    appts = appts.merge(scores, on="appointment_id", how="left")
+def _priority_columns(appts: pd.DataFrame) -> pd.DataFrame:
+    """prioritize() without the sort, for any number of days at once"""
+    appts = appts.copy()
+    appts["patient_name"] = appts["first_name"].fillna("") + " " + appts["last_name"].fillna("")
+    hour, weekday = _local_hour_weekday(appts["appt_start"])
+    is_new = appts["is_new_patient"].to_numpy(bool)
 
-    def risk_row(r):
-        if pd.notna(r.get("risk_score")):
-            return float(r["risk_score"])
-        return _heuristic_risk(r, float(r["noshow_rate_90d"]))
+    appts["missing_phone"] = appts["phone"].astype(str).str.len().fillna(0) < 6
+    appts["missing_consent"] = appts["consent_form_received"].fillna(0).astype(int) == 0
 
-    appts["risk_score"] = appts.apply(risk_row, axis=1)
-    appts["risk_bucket"] = appts["risk_score"].apply(_bucket)
+    model = appts["risk_score"].to_numpy(float)
+    heuristic = _heuristic_risk(appts["noshow_rate_90d"].to_numpy(float), is_new, hour, weekday)
+    risk = np.where(np.isnan(model), heuristic, model)
+    bucket = np.select([risk >= 0.7, risk >= 0.4], [2, 1], default=0)
+    appts["risk_score"] = risk
+    appts["risk_bucket"] = _BUCKETS[bucket]
 
     appts["priority_score"] = (
         100 * appts["is_new_patient"].astype(int)
         + 80 * appts["risk_score"].astype(float)
         + 40 * appts["missing_phone"].astype(int)
         + 30 * appts["missing_consent"].astype(int)
-        + 10
-        * ((appts["appt_dt"].dt.hour < 10) | (appts["appt_dt"].dt.hour >= 17)).astype(
-            int
+        + 10 * ((hour < 10) | (hour >= 17)).astype(int)
+    )
+
+    code = (
+        8 * bucket
+        + 4 * is_new
+        + 2 * appts["missing_phone"].to_numpy(bool)
+        + appts["missing_consent"].to_numpy(bool)
+    )
+    appts["priority_reason"] = _REASONS[code]
+
+    return appts
+
+
+def prioritize(appts: pd.DataFrame) -> pd.DataFrame:
+    """Risk, bucket, priority and reasons for merged appointment rows.
+
+    Expects the day's appointments joined with is_new_patient,
+    noshow_rate_90d and the model's risk_score (NaN when unscored). Returns
+    the output columns, highest priority first.
+    """
+    return _priority_columns(appts)[COLUMNS].sort_values("priority_score", ascending=False)
+
+
+def _days(start: str, end: str) -> list:
+    return [d.date().isoformat() for d in pd.date_range(start, end, freq="D")]
+
+
+def _store(start: str, end: str, days: list, rows: pd.DataFrame) -> str:
+    """Replace the range's lists in one transaction; returns built_at"""
+    built_at = datetime.utcnow().isoformat()
+    rows = rows.astype({c: int for c in BOOL_COLUMNS})
+    counts = rows["day"].value_counts()
+    marks = pd.DataFrame(
+        {"day": days, "built_at": built_at, "n_rows": [int(counts.get(d, 0)) for d in days]}
+    )
+    with engine.begin() as conn:
+        conn.execute(
+            text("DELETE FROM priorities WHERE day BETWEEN :start AND :end"),
+            {"start": start, "end": end},
         )
+        insert_frame(conn, "priorities", rows)
+        upsert_frame(conn, "priority_builds", marks, "day")
+    return built_at
+
+
+def build_range(start: str, end: str, workers: int = None, csv: bool = False) -> list:
+    """Build and store the priority list of every day from `start` to `end`.
+
+    Appointments, patient stats and model scores are read once for the whole
+    range and prioritized in one pass, then every day is replaced in the
+    priorities table in one transaction. Days without appointments are
+    recorded as built with no rows. With `csv`, each day is also sorted and
+    written to priorities_<day>.csv by a pool of threads. Returns the days.
+    """
+    t0 = time.perf_counter()
+    appts = _load_appointments(start, end)
+    empty = appts.head(0).drop(columns="appt_date")
+    if not appts.empty:
+        appts = appts.merge(_patient_stats(start, end), on=["appt_date", "patient_id"], how="left")
+        appts = appts.merge(
+            _load_model_scores(start, end), on=["appt_date", "appointment_id"], how="left"
+        )
+        appts = _priority_columns(appts)
+        rows = appts[COLUMNS].assign(day=appts["appt_date"])
+    else:
+        rows = pd.DataFrame(columns=["day"] + COLUMNS)
+    days = _days(start, end)
+    _store(start, end, days, rows)
+
+    span = start if start == end else f"{start}..{end}"
+    n_days = rows["day"].nunique()
+    print(
+        f"Stored priorities for {span}: {len(rows)} appointments over "
+        f"{n_days} day(s) in {time.perf_counter() - t0:.2f}s"
     )
+    if n_days < len(days):
+        missing = sorted(set(days) - set(rows["day"]))
+        more = f" and {len(missing) - 7} more" if len(missing) > 7 else ""
+        print(f"  no appointments: {', '.join(missing[:7])}{more}")
+    if csv:
+        _export_csv(appts, empty, days, workers)
+    return days
+
+
+def _export_csv(appts: pd.DataFrame, empty: pd.DataFrame, days: list, workers: int = None):
+    """priorities_<day>.csv per day, as the lists were shipped before the table"""
+    by_day = dict(tuple(appts.groupby("appt_date", sort=False))) if len(appts) else {}
+
+    def write(day: str) -> Path:
+        out_csv = output_path(day)
+        if day in by_day:
+            out = by_day[day][COLUMNS].sort_values("priority_score", ascending=False)
+        else:
+            out = empty
+        _write_csv(out, out_csv)
+        return out_csv
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        paths = list(pool.map(write, days))
+    for path in paths[:3]:
+        print(f"  - {path}")
+    if len(paths) > 3:
+        print(f"  - ... and {len(paths) - 3} more CSV files")
 
-    def reasons(r):
-        parts = []
-        if r["is_new_patient"]:
-            parts.append("new patient")
-        if r["missing_phone"]:
-            parts.append("missing phone")
-        if r["missing_consent"]:
-            parts.append("missing consent")
-        parts.append(f"risk {r['risk_bucket']}")
-        return ", ".join(parts)
-
-    appts["priority_reason"] = appts.apply(reasons, axis=1)
-
-    cols = [
-        "appointment_id",
-        "patient_id",
-        "patient_name",
-        "phone",
-        "consent_form_received",
-        "physio_name",
-        "appt_start",
-        "appt_end",
-        "booked_at",
-        "is_new_patient",
-        "noshow_rate_90d",
-        "risk_score",
-        "risk_bucket",
-        "missing_phone",
-        "missing_consent",
-        "priority_score",
-        "priority_reason",
-    ]
-    appts = appts[cols].sort_values("priority_score", ascending=False)
-
-    appts.to_csv(out_csv, index=False)
-    print(f"Wrote priorities to {out_csv}")
-    return out_csv
+
+def build(day: str, csv: bool = False) -> None:
+    build_range(day, day, csv=csv)
+
+
+def rebuild_tomorrow(after: str) -> None:
+    """Rebuild tomorrow's list right after a run (`after`) changed its inputs.
+
+    refresh_daily and score.py call this when they wrote rows, so the first
+    desk asking in the morning gets a ready list. A failed build is reported,
+    not raised: the run that called it succeeded, and the API still builds a
+    missing list on request.
+    """
+    day = _tomorrow_str()
+    try:
+        build(day)
+    except Exception as e:
+        print(f"⚠️ Priorities for {day} not rebuilt after {after}: {e}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--day", help="YYYY-MM-DD (default = tomorrow)")
+    parser.add_argument("--from", dest="start", help="build a range from YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", help="build a range up to YYYY-MM-DD")
+    parser.add_argument("--csv", action="store_true", help="also write priorities_<day>.csv files")
+    parser.add_argument("--workers", type=int, help="threads writing the CSVs")
     args = parser.parse_args()
-    day = args.day or _tomorrow_str()
-    build(day)
+
+    # creates the priorities tables on databases from before them
+    run_sql_file(str(Path(__file__).resolve().parents[1] / "01_kpi_dashboard" / "schema.sql"))
+    if args.start or args.end:
+        if not (args.start and args.end):
+            parser.error("pass both --from and --to")
+        build_range(args.start, args.end, args.workers, args.csv)
+    else:
+        day = args.day or _tomorrow_str()
+        build_range(day, day, args.workers, args.csv)
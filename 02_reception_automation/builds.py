@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+from . import build_priorities as bp
+
+# Priority lists are built off the request thread. Requests for a day whose
+# build is already running wait on that build instead of starting another.
+# Tomorrow's list is normally ready before anyone asks: refresh_daily and
+# score.py rebuild it as soon as they write rows (rebuild_tomorrow).
+#
+# This is per process: with several server workers each one coordinates its
+# own builds, and build_priorities replaces a day in one transaction so they
+# cannot corrupt each other's output.
+
+BUILD_WORKERS = 2
+
+_pool = ThreadPoolExecutor(BUILD_WORKERS, thread_name_prefix="priorities-build")
+_builds = {}  # day -> {"future", "started_at", "finished_at", "error"}
+_lock = threading.Lock()
+
+
+def _finished(day: str, fut: Future) -> None:
+    with _lock:
+        b = _builds.get(day)
+        if b is not None and b["future"] is fut:
+            b["finished_at"] = datetime.utcnow().isoformat()
+            b["error"] = None if fut.exception() is None else repr(fut.exception())
+
+
+def submit(day: str) -> Future:
+    """The running build for `day`, or a new one if none is in flight"""
+    with _lock:
+        b = _builds.get(day)
+        if b is not None and not b["future"].done():
+            return b["future"]
+        fut = _pool.submit(bp.build, day)
+        _builds[day] = {
+            "future": fut,
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "error": None,
+        }
+    fut.add_done_callback(lambda f: _finished(day, f))
+    return fut
+
+
+def status(day: str) -> dict:
+    """building / ready / failed / missing, with timestamps of the last build"""
+    with _lock:
+        b = dict(_builds.get(day) or {})
+    out = {"day": day}
+    if b and not b["future"].done():
+        out["state"] = "building"
+    elif b.get("error"):
+        out["state"] = "failed"
+        out["error"] = b["error"]
+    elif bp.built(day) is not None:
+        out["state"] = "ready"
+    else:
+        out["state"] = "missing"
+    if b:
+        out["started_at"], out["finished_at"] = b["started_at"], b["finished_at"]
+    return out
@@ -0,0 +1,40 @@
+# gunicorn settings for the reception API, overridable from the environment
+# (.env.example lists them). Run from the repo root:
+#
+#   gunicorn -c 02_reception_automation/gunicorn.conf.py 02_reception_automation.wsgi:app
+#
+# Graceful reload: `kill -HUP <master pid>` starts fresh workers on the current
+# code and config, then lets the old ones finish their requests (up to
+# graceful_timeout) before they exit. A retrained model does not need this:
+# workers pick up model_arrays/CURRENT on their own.
+
+import multiprocessing
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# API_* from the repo's .env (gunicorn does not read it), as common/db.py does
+# for DATABASE_URL; variables already set in the environment win
+load_dotenv(Path(__file__).resolve().parents[1] / ".env")
+
+bind = os.getenv("API_BIND", "127.0.0.1:8008")
+
+# Each worker keeps its own priorities cache and score batcher. The model
+# arrays are memory-mapped, so workers mostly cost interpreter + pandas
+# memory. Threads cover requests waiting on the DB or on a build.
+workers = int(os.getenv("API_WORKERS", min(4, multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("API_THREADS", 8))
+
+# longer than server.BUILD_WAIT_S, so a request waiting on a build is not killed
+timeout = int(os.getenv("API_TIMEOUT", 90))
+graceful_timeout = 30
+keepalive = 5
+
+# not preloaded: HUP then re-imports the app, and background threads start
+# inside each worker rather than before the fork
+preload_app = False
+
+accesslog = os.getenv("API_ACCESS_LOG", "-")
+errorlog = "-"
@@ -0,0 +1,171 @@
+import gzip
+import hashlib
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from flask import json
+
+from . import build_priorities as bp
+
+# Reception screens poll /priorities every few seconds, but a day's list only
+# changes when build_priorities runs. Each day is read once per build (keyed
+# on priority_builds.built_at) into the full serialized body, a gzipped copy,
+# and an index for filtered requests: rows sorted by priority, plus row
+# positions per risk bucket and per physio. priority_builds is looked up at
+# most every BUILD_CHECK_S per day, so a rebuild shows up within that.
+
+COLUMNS = [
+    "appointment_id",
+    "patient_id",
+    "patient_name",
+    "phone",
+    "consent_form_received",
+    "physio_name",
+    "appt_start",
+    "is_new_patient",
+    "risk_score",  # ✅ added
+    "risk_bucket",
+    "missing_phone",
+    "missing_consent",
+    "priority_score",
+    "priority_reason",
+]
+
+FILTER_PARAMS = ("limit", "cursor", "risk_bucket", "physio", "min_priority", "fields")
+
+CACHE_MAX_DAYS = 32
+BUILD_CHECK_S = 1.0
+GZIP_MIN_BYTES = 1024
+
+_cache = {}
+_lock = threading.Lock()
+_NONE = np.empty(0, dtype=np.int64)
+
+
+def _dumps(payload: dict) -> bytes:
+    return (json.dumps(payload, separators=(",", ":")) + "\n").encode()
+
+
+def load_payload(day: str) -> dict:
+    """The full /priorities response for a day's stored list, rows by priority"""
+    show = bp.load_priorities(day)[COLUMNS]
+    items = show.to_dict(orient="records")
+    return {"day": day, "count": len(items), "items": items}
+
+
+def _positions(values: list) -> dict:
+    """{lower-cased value: sorted row positions}"""
+    keys = pd.Series(values, dtype=object).fillna("").astype(str).str.lower()
+    return {k: np.asarray(v, dtype=np.int64) for k, v in keys.groupby(keys).indices.items()}
+
+
+def get(day: str) -> dict:
+    """Cache entry for the day's current build, None if it was never built"""
+    now = time.monotonic()
+    entry = _cache.get(day)
+    if entry is not None and now < entry["next_check"]:
+        return entry
+    build = bp.built(day)
+    if build is None:
+        return None
+    key = build["built_at"]
+    if entry is not None and entry["key"] == key:
+        entry["next_check"] = now + BUILD_CHECK_S
+        return entry
+
+    payload = load_payload(day)
+    items = payload["items"]
+    body = _dumps(payload)
+    entry = {
+        "key": key,
+        "next_check": now + BUILD_CHECK_S,
+        "day": day,
+        "body": body,
+        "gzip": gzip.compress(body, 6) if len(body) >= GZIP_MIN_BYTES else None,
+        # content hash: a rebuild that writes the same rows keeps the ETag
+        "etag": hashlib.sha1(body).hexdigest(),
+        "items": items,
+        # negated so searchsorted finds the min_priority cut on an ascending array
+        "neg_priority": -np.array([r["priority_score"] for r in items], dtype=np.float64),
+        "by_bucket": _positions([r["risk_bucket"] for r in items]),
+        "by_physio": _positions([r["physio_name"] for r in items]),
+    }
+    with _lock:
+        _cache.pop(day, None)
+        _cache[day] = entry
+        while len(_cache) > CACHE_MAX_DAYS:
+            _cache.pop(next(iter(_cache)))
+    return entry
+
+
+def _split(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+
+def _number(args, name: str, cast):
+    try:
+        return cast(args[name]) if args.get(name) not in (None, "") else None
+    except ValueError:
+        raise ValueError(f"{name} must be a number") from None
+
+
+def query(entry: dict, args) -> tuple:
+    """(body, etag) for a filtered page of the day.
+
+    risk_bucket and physio take comma-separated values (any of them matches),
+    min_priority keeps rows at or above the score, fields projects columns.
+    Pages come `limit` rows at a time and `next_cursor` continues after the
+    last one. Raises ValueError for invalid parameters.
+    """
+    fields = _split(args.get("fields")) or COLUMNS
+    unknown = [f for f in fields if f not in COLUMNS]
+    if unknown:
+        raise ValueError(f"unknown fields: {unknown}")
+    limit = _number(args, "limit", int)
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be positive")
+    min_priority = _number(args, "min_priority", float)
+
+    pos = None
+    for name, index in (("risk_bucket", entry["by_bucket"]), ("physio", entry["by_physio"])):
+        wanted = _split(args.get(name))
+        if wanted:
+            hit = np.unique(np.concatenate([index.get(w.lower(), _NONE) for w in wanted]))
+            pos = hit if pos is None else np.intersect1d(pos, hit, assume_unique=True)
+    if pos is None:
+        pos = np.arange(len(entry["items"]))
+    if min_priority is not None:
+        # rows are sorted by priority, so the rows at or above it are a prefix
+        cut = np.searchsorted(entry["neg_priority"], -min_priority, side="right")
+        pos = pos[: np.searchsorted(pos, cut)]
+    total = len(pos)
+
+    # cursor = "<etag prefix>.<row position>": stale once the list is rebuilt
+    tag = entry["etag"][:8]
+    cursor = args.get("cursor")
+    if cursor:
+        prefix, _, last = cursor.partition(".")
+        if prefix != tag or not last.isdigit():
+            raise ValueError("cursor is invalid or the list was rebuilt; start again without one")
+        pos = pos[np.searchsorted(pos, int(last), side="right") :]
+    page = pos if limit is None else pos[:limit]
+    more = len(page) < len(pos)
+
+    items = entry["items"]
+    if fields is COLUMNS:
+        rows = [items[i] for i in page]
+    else:
+        rows = [{f: items[i][f] for f in fields} for i in page]
+    body = _dumps(
+        {
+            "day": entry["day"],
+            "count": len(rows),
+            "total": total,
+            "items": rows,
+            "next_cursor": f"{tag}.{page[-1]}" if more else None,
+        }
+    )
+    canonical = "&".join(f"{k}={args.get(k)}" for k in FILTER_PARAMS if args.get(k))
+    return body, hashlib.sha1(f"{entry['etag']}?{canonical}".encode()).hexdigest()
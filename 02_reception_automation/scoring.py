@@ -0,0 +1,288 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parents[1] / "03_cancellation_model"))
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import forest
+import numpy as np
+import pandas as pd
+from features import build_posted_frame
+from joblib import load
+from score import buckets, load_threshold, model_version
+
+from common.db import read_engine
+
+repo = Path(__file__).resolve().parents[1]
+MODEL_FILE = repo / "03_cancellation_model" / "model.joblib"
+METRICS_FILE = MODEL_FILE.with_name("metrics.json")
+REQUIRED = ("patient_id", "appt_start", "booked_at", "price_estimate")
+
+# Requests that queue up while a batch is being scored share the next
+# predict_proba. MAX_WAIT_MS > 0 additionally holds the first request back
+# for stragglers, trading single-request latency for bigger batches.
+MAX_BATCH = 256
+MAX_WAIT_MS = 0.0
+
+# how often a worker stats model_arrays/CURRENT for a newly trained model
+RELOAD_CHECK_S = 2.0
+
+
+class MicroBatcher:
+    """Coalesce concurrent score requests into one call of `fn`.
+
+    `fn` takes a frame of rows and returns one result row per input row in
+    the same order. A single background thread owns `fn`, so the model and
+    its DB connection are never used from two threads at once.
+    """
+
+    def __init__(self, fn, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._q = queue.Queue()
+        threading.Thread(target=self._loop, name="score-batcher", daemon=True).start()
+
+    def submit(self, rows: pd.DataFrame) -> Future:
+        fut = Future()
+        self._q.put((rows, fut))
+        return fut
+
+    def _take(self, timeout=None):
+        """Next queued request still wanted by its caller (None when the wait runs out)"""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            wait = None if deadline is None else deadline - time.perf_counter()
+            try:
+                if wait is None:
+                    item = self._q.get()
+                else:
+                    item = self._q.get(timeout=wait) if wait > 0 else self._q.get_nowait()
+            except queue.Empty:
+                return None
+            # False when the caller gave up (timed out) while it was queued
+            if item[1].set_running_or_notify_cancel():
+                return item
+
+    def _next_batch(self):
+        batch = [self._take()]
+        n = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while n < self.max_batch:
+            item = self._take(max(0.0, deadline - time.perf_counter()))
+            if item is None:
+                break
+            batch.append(item)
+            n += len(item[0])
+        return batch
+
+    def _run(self, rows: pd.DataFrame, fut: Future) -> None:
+        try:
+            fut.set_result(self.fn(rows).reset_index(drop=True))
+        except Exception as e:
+            fut.set_exception(e)
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if len(batch) == 1:
+                self._run(*batch[0])
+                continue
+            try:
+                out = self.fn(pd.concat([r for r, _ in batch], ignore_index=True))
+            except Exception:
+                # one bad request must not fail the others it was batched with
+                for rows, fut in batch:
+                    self._run(rows, fut)
+                continue
+            start = 0
+            for rows, fut in batch:
+                fut.set_result(out.iloc[start : start + len(rows)].reset_index(drop=True))
+                start += len(rows)
+
+
+def _resident_model(model_file: Path):
+    """(predict_proba, version) for the model to serve.
+
+    The export named by model_arrays/CURRENT comes first: its arrays are
+    memory-mapped, so all workers share one copy and loading is a few opens.
+    Without one the pipeline is unpickled and flattened in memory into the
+    same arrays (forest.flatten): RandomForest.predict_proba dispatches every
+    call through joblib, which dominates on the handful of rows a request
+    carries. A pipeline forest.py cannot reproduce is served as it is.
+    """
+    version = forest.current()
+    if version:
+        model = forest.load(version)
+        return (lambda X: forest.predict_proba(model, X)), version
+
+    pipe = load(model_file)
+    version = model_version(model_file)
+    try:
+        meta, arrays = forest.flatten(pipe)
+    except ValueError:
+        return pipe.predict_proba, version
+    model = dict(meta, **arrays, version=version)
+    return (lambda X: forest.predict_proba(model, X)), version
+
+
+def _artifact_key(model_file: Path) -> tuple:
+    """Changes whenever train.py writes a new model, export or threshold"""
+    key = []
+    for f in (forest.ARRAYS_DIR / "CURRENT", model_file, METRICS_FILE):
+        try:
+            key.append(f.stat().st_mtime_ns)
+        except FileNotFoundError:
+            key.append(None)
+    return tuple(key)
+
+
+def make_scorer(model_file: Path = MODEL_FILE):
+    """score_rows(rows) for the batcher thread.
+
+    The model is loaded on the first call and stays resident. Every
+    RELOAD_CHECK_S it stats the artifacts and swaps in a newly trained model
+    between batches, so workers never need a restart. Requests already in a
+    batch finish on the model they started with.
+    """
+    state = {"key": None, "next_check": 0.0}
+
+    def refresh():
+        now = time.monotonic()
+        if now < state["next_check"]:
+            return
+        state["next_check"] = now + RELOAD_CHECK_S
+        key = _artifact_key(model_file)
+        if key != state["key"]:
+            state["predict_proba"], state["version"] = _resident_model(model_file)
+            state["threshold"] = load_threshold()
+            state["key"] = key
+
+    def score_rows(rows: pd.DataFrame) -> pd.DataFrame:
+        refresh()
+        with read_engine.begin() as conn:
+            X, feat_cols = build_posted_frame(rows, conn)
+        probs = state["predict_proba"](X[feat_cols])[:, 1]
+        return pd.DataFrame(
+            {
+                "appointment_id": rows.get("appointment_id"),
+                "risk_score": probs,
+                "risk_bucket": buckets(probs, state["threshold"]),
+                "model_version": state["version"],
+            }
+        )
+
+    return score_rows
+
+
+_batcher = None
+_lock = threading.Lock()
+
+
+def get_batcher() -> MicroBatcher:
+    """The worker's batcher, created on first use"""
+    global _batcher
+    with _lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(make_scorer())
+    return _batcher
+
+
+def parse_rows(payload) -> pd.DataFrame:
+    """One appointment object, a list of them, or {"appointments": [...]}"""
+    if isinstance(payload, dict) and "appointments" in payload:
+        payload = payload["appointments"]
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not isinstance(payload, list) or not payload:
+        raise ValueError("expected an appointment object or a non-empty list")
+    if not all(isinstance(r, dict) for r in payload):
+        raise ValueError("every appointment must be an object")
+    rows = pd.DataFrame(payload)
+    missing = [c for c in REQUIRED if c not in rows.columns]
+    if missing:
+        raise ValueError(f"missing fields: {missing}")
+    if rows[list(REQUIRED)].isna().any().any():
+        raise ValueError(f"every appointment needs {list(REQUIRED)}")
+
+    # checked here, per request: a bad value inside a shared batch would fail
+    # every request scored with it
+    ids = ["patient_id"] + (["appointment_id"] if "appointment_id" in rows else [])
+    for col in ids:
+        rows[col] = _converted(rows[col], _integer, "an integer")
+    rows["price_estimate"] = _converted(rows["price_estimate"], _number, "a number")
+    for col in ("appt_start", "booked_at"):
+        _converted(rows[col], _timestamp, "an ISO 8601 timestamp")
+    return rows
+
+
+def _integer(v):
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)):
+        raise ValueError
+    f = float(v)
+    if not f.is_integer():
+        raise ValueError
+    return int(f)
+
+
+def _number(v):
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)):
+        raise ValueError
+    f = float(v)
+    if not np.isfinite(f):
+        raise ValueError
+    return f
+
+
+def _timestamp(v):
+    if not isinstance(v, str):
+        raise ValueError
+    # the parse build_posted_frame makes
+    return pd.to_datetime(v, utc=True, format="ISO8601")
+
+
+def _converted(values: pd.Series, convert, expected: str) -> pd.Series:
+    """values.map(convert); ValueError naming the first value it cannot take.
+
+    Missing values (an optional field left out of some rows) pass through.
+    """
+    out = []
+    for i, v in enumerate(values):
+        if v is None or (isinstance(v, float) and np.isnan(v)):
+            out.append(None)
+            continue
+        try:
+            out.append(convert(v))
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(
+                f"appointments[{i}].{values.name}: expected {expected}, got {v!r}"
+            ) from None
+    return pd.Series(out, index=values.index, name=values.name, dtype=object)
+
+
+def score(payload, timeout: float = 10.0) -> dict:
+    """Score posted appointments. Raises ValueError for a bad payload and
+    TimeoutError when the batcher does not answer within `timeout` seconds."""
+    rows = parse_rows(payload)
+    fut = get_batcher().submit(rows)
+    try:
+        out = fut.result(timeout=timeout)
+    except FutureTimeout:
+        fut.cancel()  # still queued: the batcher skips it
+        raise
+    items = [
+        {
+            "appointment_id": None if pd.isna(a) else int(a),
+            "risk_score": float(r),
+            "risk_bucket": str(b),
+        }
+        for a, r, b in zip(
+            out["appointment_id"], out["risk_score"], out["risk_bucket"], strict=True
+        )
+    ]
+    return {"model_version": out["model_version"].iloc[0], "count": len(items), "items": items}
@@ -1,12 +1,41 @@
-import argparse
+import sys
 from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+# sibling modules, also when loaded by path (tests, scripts/)
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import argparse
+import hashlib
+import json
+import os
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
+import smtp_delivery
 from dotenv import load_dotenv
-import os
+from sqlalchemy import text
+
+from common.db import read_engine, run_sql_file
 
 load_dotenv()
 OUTBOX = Path(os.getenv("EMAIL_OUTBOX_DIR", "outbox"))
 
+# the day's reachable patients (phone and consent on file), highest priority
+# first. No rows at all: the list was never built. One row with NULL
+# appointment_id: built, but nobody to remind.
+REMINDER_ROWS_SQL = """
+SELECT b.day, p.appointment_id, p.patient_id, p.patient_name, p.physio_name, p.appt_start
+FROM priority_builds b
+LEFT JOIN priorities p
+  ON p.day = b.day AND p.missing_phone = 0 AND p.missing_consent = 0
+WHERE b.day = :d
+ORDER BY p.priority_score DESC, p.appointment_id;
+"""
+
 TEMPLATE = """To: {patient_name} <{fake_email}>
 Subject: Appointment reminder for {appt_date} at {appt_time}
 
@@ -22,69 +51,186 @@ Clinic Reception
 """
 
 
-def fake_email_for(row) -> str:
-    base = f"{str(row['patient_name']).strip().lower().replace(' ','_')}.{int(row['patient_id'])}"
-    return f"{base}@example.local"
+FORMATS = ("files", "jsonl", "mbox")
+
+# threads writing reminder files: on a network share each create and rename
+# is a round trip, and these overlap them
+WRITE_WORKERS = 8
+
+
+def fake_emails(df: pd.DataFrame) -> pd.Series:
+    base = (
+        df["patient_name"].astype(str).str.strip().str.lower().str.replace(" ", "_")
+        + "."
+        + df["patient_id"].astype(int).astype(str)
+    )
+    return base + "@example.local"
+
+
+def _format_all(template: str, fields: dict, index) -> pd.Series:
+    """template.format(**row) for every row: one column concatenation per
+    piece of the template instead of one format() call per reminder"""
+    out = pd.Series("", index=index, dtype=object)
+    for literal, name, _, _ in string.Formatter().parse(template):
+        out = out + literal
+        if name is not None:
+            out = out + fields[name]
+    return out
+
+
+def render(df: pd.DataFrame) -> pd.DataFrame:
+    """appointment_id, name (file name), to, subject and content per reminder"""
+    # wall-clock date and time as stored (ISO with the local offset)
+    start = df["appt_start"].astype(str)
+    fields = {
+        "patient_name": df["patient_name"].astype(str),
+        "fake_email": fake_emails(df),
+        "appt_date": start.str.slice(0, 10),
+        "appt_time": start.str.slice(11, 16),
+        "physio_name": df["physio_name"].astype(str),
+    }
+    ids = df["appointment_id"].astype(int)
+    content = _format_all(TEMPLATE, fields, df.index)
+    return pd.DataFrame(
+        {
+            "appointment_id": ids,
+            "name": fields["appt_date"] + "_" + ids.astype(str) + "_reminder.txt",
+            "to": fields["fake_email"],
+            "subject": content.str.split("\n", n=2).str[1].str.slice(len("Subject: ")),
+            "content": content,
+        }
+    )
+
+
+def _sha(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    """Write aside and rename, so a reader never picks up half a reminder"""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, path)
 
 
-def main(day: str, dry_run: bool):
-    repo = Path(__file__).resolve().parents[2]
-    csv_path = repo / "02_reception_automation" / f"priorities_{day}.csv"
-    assert (
-        csv_path.exists()
-    ), f"Priorities file not found: {csv_path}. Run build_priorities first."
+def _manifest_path(outbox: Path, day: str) -> Path:
+    return outbox / f".manifest_{day}.json"
 
-    # 🔒 Robust guard for empty CSVs or missing columns
-    df = (
-        pd.read_csv(csv_path, parse_dates=["appt_start"])
-        if csv_path.stat().st_size > 0
-        else pd.DataFrame()
+
+def _load_manifest(outbox: Path, day: str) -> dict:
+    """{file name: sha256 of what was last written} for the day"""
+    path = _manifest_path(outbox, day)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _archive(msgs: pd.DataFrame, day: str, fmt: str) -> tuple:
+    """(file name, content) of one file holding every reminder of the day"""
+    if fmt == "jsonl":
+        lines = [
+            json.dumps(r, ensure_ascii=False)
+            for r in msgs[["appointment_id", "name", "to", "subject", "content"]].to_dict("records")
+        ]
+        return f"reminders_{day}.jsonl", "".join(line + "\n" for line in lines)
+    # mboxrd: a From_ line before each message, body lines starting with
+    # "From " quoted; dated midnight of the day so re-runs are byte-identical
+    stamp = time.asctime(time.strptime(day, "%Y-%m-%d"))
+    quoted = msgs["content"].str.replace(r"(?m)^(>*From )", r">\1", regex=True)
+    return f"reminders_{day}.mbox", "".join(
+        f"From reception@example.local {stamp}\n{m}\n" for m in quoted
     )
-    if (
-        df.empty
-        or "missing_phone" not in df.columns
-        or "missing_consent" not in df.columns
-    ):
+
+
+def write_outbox(
+    msgs: pd.DataFrame,
+    day: str,
+    outbox: Path,
+    fmt: str = "files",
+    workers: int = WRITE_WORKERS,
+    dry_run: bool = False,
+) -> tuple:
+    """Write what changed since the last run; returns (written, up to date).
+
+    A file is skipped when the day's manifest has its content hash and it is
+    still in the outbox (a file edited by hand is not noticed; delete it to
+    have it rewritten). Files are written by a pool of threads, each to a
+    temp name and renamed into place.
+    """
+    if fmt == "files":
+        files = dict(zip(msgs["name"], msgs["content"], strict=True))
+    else:
+        name, content = _archive(msgs, day, fmt)
+        files = {name: content}
+    hashes = {name: _sha(content) for name, content in files.items()}
+
+    manifest = _load_manifest(outbox, day)
+    existing = {e.name for e in os.scandir(outbox)} if outbox.exists() else set()
+    todo = [n for n in files if manifest.get(n) != hashes[n] or n not in existing]
+    if dry_run or not todo:
+        return len(todo), len(files) - len(todo)
+
+    outbox.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda n: _write_atomic(outbox / n, files[n]), todo))
+    _write_atomic(_manifest_path(outbox, day), json.dumps({**manifest, **hashes}, indent=0))
+    return len(todo), len(files) - len(todo)
+
+
+def deliver(msgs: pd.DataFrame, day: str, dry_run: bool) -> None:
+    """Send through the SMTP relay instead of writing the outbox"""
+    run_sql_file(str(Path(__file__).resolve().parents[1] / "01_kpi_dashboard" / "schema.sql"))
+    out = smtp_delivery.send_day(msgs, day, dry_run)
+    relay = f"{smtp_delivery.SMTP_HOST}:{smtp_delivery.SMTP_PORT}"
+    if dry_run:
         print(
-            "No eligible rows (empty priorities or missing columns). Nothing to send."
+            f"Dry run, nothing sent: {out['to_send']} reminders would go to {relay} "
+            f"({out['already_sent']} already sent)"
         )
         return
+    rate = out["sent"] / out["secs"] if out["secs"] else 0.0
+    print(
+        f"Sent {out['sent']} reminders via {relay} in {out['secs']:.2f}s ({rate:,.0f} msg/s), "
+        f"{out['failed']} failed, {out['already_sent']} already sent"
+    )
+    for error, n in out.get("errors", {}).items():
+        print(f"  {n} x {error}")
 
-    send_df = df[(~df["missing_phone"]) & (~df["missing_consent"])].copy()
-
-    OUTBOX.mkdir(parents=True, exist_ok=True)
-    written = 0
-    previews = []
-
-    for _, r in send_df.iterrows():
-        appt_date = r["appt_start"].date().isoformat()
-        appt_time = r["appt_start"].strftime("%H:%M")
-        content = TEMPLATE.format(
-            patient_name=r["patient_name"],
-            fake_email=fake_email_for(r),
-            appt_date=appt_date,
-            appt_time=appt_time,
-            physio_name=r["physio_name"],
-        )
-        fname = f"{appt_date}_{int(r['appointment_id'])}_reminder.txt"
-        fpath = OUTBOX / fname
-        previews.append((fname, content.splitlines()[1]))
-        if not dry_run:
-            with open(fpath, "w", encoding="utf-8") as f:
-                f.write(content)
-            written += 1
+
+def main(
+    day: str, dry_run: bool, fmt: str = "files", workers: int = WRITE_WORKERS, smtp: bool = False
+):
+    with read_engine.begin() as conn:
+        df = pd.read_sql(text(REMINDER_ROWS_SQL), conn, params={"d": day})
+    assert not df.empty, f"No priorities stored for {day}. Run build_priorities first."
+
+    send_df = df.dropna(subset=["appointment_id"])
+    if send_df.empty:
+        print("No eligible rows (no appointments with phone and consent). Nothing to send.")
+        return
+
+    msgs = render(send_df)
+    if smtp:
+        deliver(msgs, day, dry_run)
+        return
+    written, current = write_outbox(msgs, day, OUTBOX, fmt, workers, dry_run)
 
     if dry_run:
-        print("Dry run, no files written.")
-    print(f"Prepared {len(send_df)} reminders, wrote {written} files to {OUTBOX}")
-    if previews[:5]:
-        print("Sample:")
-        for fn, subj in previews[:5]:
-            print(f"  {fn} | {subj}")
+        print(f"Dry run, no files written ({written} would be).")
+        written = 0
+    print(
+        f"Prepared {len(msgs)} reminders, wrote {written} files to {OUTBOX}"
+        + (f" ({current} already up to date)" if current else "")
+    )
+    print("Sample:")
+    for name, subject in msgs[["name", "subject"]].head(5).itertuples(index=False):
+        print(f"  {name} | Subject: {subject}")
 
 
 if __name__ == "__main__":
     from datetime import datetime, timedelta
+
     import pytz
 
     BERLIN = pytz.timezone("Europe/Berlin")
@@ -93,5 +239,19 @@ if __name__ == "__main__":
     p = argparse.ArgumentParser()
     p.add_argument("--day", default=tomorrow, help="YYYY-MM-DD")
     p.add_argument("--dry-run", action="store_true")
+    p.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="files",
+        help="one .txt per reminder, or one JSONL / mbox archive for the day",
+    )
+    p.add_argument(
+        "--workers", type=int, default=WRITE_WORKERS, help="threads writing reminder files"
+    )
+    p.add_argument(
+        "--smtp",
+        action="store_true",
+        help="deliver through SMTP_HOST:SMTP_PORT (see .env.example) instead of the outbox",
+    )
     args = p.parse_args()
-    main(args.day, args.dry_run)
+    main(args.day, args.dry_run, args.format, args.workers, args.smtp)
@@ -1,75 +1,125 @@
-from flask import Flask, jsonify, request
-from pathlib import Path
-import pandas as pd
-from . import build_priorities as bp
+from concurrent.futures import TimeoutError as FutureTimeout
+from flask import Flask, Response, jsonify, request, url_for
+from . import builds
+from . import priorities_cache
+from . import scoring
 import pytz
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 app = Flask(__name__)
 
+# how long a request waits on a missing day's build before answering 202
+BUILD_WAIT_S = 60.0
+
 
 def default_tomorrow():
     berlin = pytz.timezone("Europe/Berlin")
     return (datetime.now(berlin).date() + timedelta(days=1)).isoformat()
 
 
+def _day_arg():
+    """?day=YYYY-MM-DD (default tomorrow); ValueError for anything else"""
+    day = request.args.get("day") or default_tomorrow()
+    try:
+        valid = date.fromisoformat(day).isoformat() == day
+    except ValueError:
+        valid = False
+    if not valid:
+        raise ValueError(f"day must be a date as YYYY-MM-DD, got {day!r}")
+    return day
+
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
 
+def _json(body: bytes, etag: str, gzipped: bytes = None) -> Response:
+    """Pre-serialized body with its ETag; 304 when the client already has it"""
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+    elif gzipped is not None and "gzip" in request.accept_encodings:
+        resp = Response(gzipped, mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def _building(day: str):
+    """202 pointing at the status URL while the day's list is being built"""
+    status_url = url_for("priorities_status", day=day)
+    body = dict(builds.status(day), status_url=status_url)
+    return jsonify(body), 202, {"Location": status_url, "Retry-After": "2"}
+
+
 @app.get("/priorities")
 def priorities():
-    day = request.args.get("day") or default_tomorrow()
-    repo = Path(__file__).resolve().parents[2]
-    pcsv = repo / "02_reception_automation" / f"priorities_{day}.csv"
+    try:
+        day = _day_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # build if missing
-    if not pcsv.exists():
-        bp.build(day)
+    # repeat polls are a primary key lookup on priority_builds and a dict
+    # lookup; the list itself is only read when it was rebuilt (see
+    # priorities_cache)
+    entry = priorities_cache.get(day)
+
+    # build if missing: concurrent requests share one build. With ?async=1
+    # (or Prefer: respond-async) answer 202 at once instead of waiting.
+    if entry is None:
+        build = builds.submit(day)
+        wants_async = request.args.get("async") in ("1", "true") or (
+            "respond-async" in request.headers.get("Prefer", "")
+        )
+        if wants_async:
+            return _building(day)
+        try:
+            build.result(timeout=BUILD_WAIT_S)
+        except FutureTimeout:
+            return _building(day)
+        except Exception:
+            entry = None  # builds.status(day) reports the error
+        else:
+            entry = priorities_cache.get(day)
 
-    # if still missing or empty, return safe fallback
-    if not pcsv.exists() or pcsv.stat().st_size == 0:
+    # if the build failed, return safe fallback
+    if entry is None:
         return jsonify({"day": day, "count": 0, "items": []})
 
-    df = pd.read_csv(pcsv)
+    if not any(request.args.get(k) for k in priorities_cache.FILTER_PARAMS):
+        return _json(entry["body"], entry["etag"], entry["gzip"])
+    try:
+        body, etag = priorities_cache.query(entry, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _json(body, etag)
 
-    # If the CSV exists but has no rows, return empty
-    if df.empty:
-        return jsonify({"day": day, "count": 0, "items": []})
 
-    # Make sure required columns exist
-    required_cols = [
-        "appointment_id",
-        "patient_id",
-        "patient_name",
-        "phone",
-        "consent_form_received",
-        "physio_name",
-        "appt_start",
-        "is_new_patient",
-        "risk_score",  # ✅ added
-        "risk_bucket",
-        "missing_phone",
-        "missing_consent",
-        "priority_score",
-        "priority_reason",
-    ]
-    missing = [c for c in required_cols if c not in df.columns]
-    if missing:
-        return jsonify(
-            {
-                "day": day,
-                "count": 0,
-                "items": [],
-                "warning": f"Priorities file missing expected columns: {missing}",
-            }
-        )
+@app.get("/priorities/status")
+def priorities_status():
+    try:
+        day = _day_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    out = builds.status(day)
+    if out["state"] == "ready":
+        out["url"] = url_for("priorities", day=day)
+    return jsonify(out)
+
 
-    # select and sort
-    show = df[required_cols].sort_values("priority_score", ascending=False)
-    items = show.to_dict(orient="records")
-    return jsonify({"day": day, "count": len(items), "items": items})
+@app.post("/score")
+def score():
+    """Model risk for posted appointments, micro-batched with concurrent requests"""
+    try:
+        return jsonify(scoring.score(request.get_json(force=True)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FutureTimeout:
+        return jsonify({"error": "scoring is overloaded, try again"}), 503, {"Retry-After": "1"}
 
 
 if __name__ == "__main__":
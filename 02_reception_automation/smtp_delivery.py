@@ -0,0 +1,337 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import asyncio
+import hashlib
+import os
+import random
+import smtplib
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email import message_from_string, policy
+from email.utils import formatdate
+
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from common.bulk import upsert_frame
+from common.db import engine, read_engine
+
+# Reminders go out over a small pool of persistent SMTP connections instead of
+# one connection per message. Each connection belongs to one asyncio worker
+# that takes messages off a shared queue. smtplib's blocking calls run on a
+# thread per worker, so the workers' round trips to the relay overlap. A shared
+# limiter spaces sends to SMTP_RATE messages per second across all workers.
+# Transient failures (4xx replies, dropped connections, timeouts) are retried
+# with exponential backoff, on a fresh connection when the old one broke. 5xx
+# replies fail at once. When the relay itself keeps failing (SMTP_MAX_FAILURES
+# connection failures in a row across all workers) the run stops: what is
+# left is recorded as failed, for the next run to retry.
+
+load_dotenv()
+SMTP_HOST = os.getenv("SMTP_HOST", "127.0.0.1")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 1025))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "0") == "1"
+SMTP_FROM = os.getenv("SMTP_FROM", "Clinic Reception <reception@example.local>")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))
+SMTP_RATE = float(os.getenv("SMTP_RATE", 0))  # messages per second, 0 = no limit
+SMTP_RETRIES = int(os.getenv("SMTP_RETRIES", 3))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+# consecutive connection failures that stop the run, 0 = never stop
+SMTP_MAX_FAILURES = int(os.getenv("SMTP_MAX_FAILURES", 8))
+
+BACKOFF_S = 0.5  # first retry delay, doubled per attempt, plus jitter
+# relays cap messages per session; reconnect before hitting it
+MAX_PER_CONNECTION = 100
+# delivery results are written to reminder_deliveries in batches of this size
+# while sending, so a crash mid-run does not resend what already went out
+FLUSH_EVERY = 200
+
+# reminders of the day already sent; skipped when the content is unchanged
+SENT_SQL = """
+SELECT appointment_id, content_sha FROM reminder_deliveries
+WHERE day = :d AND status = 'sent';
+"""
+
+
+class RateLimiter:
+    """Space sends at least 1/rate seconds apart across all workers"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = 0.0
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(self.next_slot, now)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` connection failures in a row, counted across
+    all workers; any successful send closes it again"""
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self.failures = 0
+        self.error = None
+
+    @property
+    def open(self) -> bool:
+        return 0 < self.threshold <= self.failures
+
+    def failure(self, error: str) -> None:
+        self.failures += 1
+        self.error = error
+
+    def success(self) -> None:
+        self.failures = 0
+
+
+def content_sha(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def build_message(content: str, msg_id: str):
+    """The rendered reminder (To and Subject headers, blank line, body) as an
+    email with From, Date and a Message-ID that is stable across retries"""
+    msg = message_from_string(content, policy=policy.SMTP)
+    msg["From"] = SMTP_FROM
+    msg["Date"] = formatdate(localtime=True)
+    msg["Message-ID"] = msg_id
+    return msg
+
+
+def _connect(host: str, port: int) -> smtplib.SMTP:
+    conn = smtplib.SMTP(host, port, timeout=SMTP_TIMEOUT)
+    if SMTP_STARTTLS:
+        conn.starttls(context=ssl.create_default_context())
+    if SMTP_USER:
+        conn.login(SMTP_USER, SMTP_PASSWORD)
+    return conn
+
+
+def _close(conn) -> None:
+    try:
+        conn.quit()
+    except (smtplib.SMTPException, OSError):
+        conn.close()
+
+
+def _broken(exc: Exception) -> bool:
+    """The session cannot be reused: dropped, closing (421), or in an unknown state.
+
+    A refused recipient or a rejected message leaves it usable: smtplib has
+    already sent RSET.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return any(code == 421 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code == 421
+    return True
+
+
+def _transient(exc: Exception) -> bool:
+    """Worth retrying: a 4xx reply, or the connection failing underneath"""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    # SMTPServerDisconnected, refused connections, timeouts (all OSError)
+    return isinstance(exc, OSError)
+
+
+async def _worker(
+    queue: asyncio.Queue,
+    limiter: RateLimiter,
+    breaker: CircuitBreaker,
+    host: str,
+    port: int,
+    retries: int,
+    done,
+) -> None:
+    conn, used = None, 0
+    try:
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            attempts, error = 0, None
+            while True:
+                if breaker.open:
+                    error = f"not sent, relay down ({breaker.failures} failures): {breaker.error}"
+                    break
+                attempts += 1
+                try:
+                    if conn is None or used >= MAX_PER_CONNECTION:
+                        if conn is not None:
+                            await asyncio.to_thread(_close, conn)
+                        conn, used = None, 0
+                        conn = await asyncio.to_thread(_connect, host, port)
+                    await limiter.wait()
+                    await asyncio.to_thread(
+                        conn.send_message, item["message"], to_addrs=[item["recipient"]]
+                    )
+                    used += 1
+                    breaker.success()
+                    error = None
+                    break
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    # conn is still None when connecting (or logging in) failed
+                    if conn is None or _broken(e):
+                        breaker.failure(error)
+                        if conn is not None:
+                            # start a new session on the next attempt
+                            await asyncio.to_thread(conn.close)
+                            conn = None
+                    if not _transient(e) or attempts > retries:
+                        break
+                    await asyncio.sleep(BACKOFF_S * 2 ** (attempts - 1) * (1 + random.random()))
+            await done(
+                {
+                    "appointment_id": item["appointment_id"],
+                    "recipient": item["recipient"],
+                    "content_sha": item["content_sha"],
+                    "status": "failed" if error else "sent",
+                    "attempts": attempts,
+                    "last_error": error,
+                    "updated_at": datetime.utcnow().isoformat(),
+                }
+            )
+    finally:
+        if conn is not None:
+            await asyncio.to_thread(_close, conn)
+
+
+async def _deliver(
+    items: list,
+    pool_size: int,
+    rate: float,
+    host: str,
+    port: int,
+    retries: int,
+    max_failures: int,
+    record,
+) -> list:
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(pool_size, thread_name_prefix="smtp"))
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+    limiter = RateLimiter(rate)
+    breaker = CircuitBreaker(max_failures)
+    results, pending = [], []
+
+    async def done(result: dict) -> None:
+        results.append(result)
+        pending.append(result)
+        if record is not None and len(pending) >= FLUSH_EVERY:
+            batch = pending[:]
+            pending.clear()
+            await asyncio.to_thread(record, batch)
+
+    workers = min(pool_size, len(items))
+    await asyncio.gather(
+        *(_worker(queue, limiter, breaker, host, port, retries, done) for _ in range(workers))
+    )
+    if record is not None and pending:
+        await asyncio.to_thread(record, pending)
+    return results
+
+
+def deliver(
+    msgs: pd.DataFrame,
+    day: str,
+    pool_size: int = SMTP_POOL_SIZE,
+    rate: float = SMTP_RATE,
+    host: str = SMTP_HOST,
+    port: int = SMTP_PORT,
+    retries: int = SMTP_RETRIES,
+    max_failures: int = SMTP_MAX_FAILURES,
+    record=None,
+) -> pd.DataFrame:
+    """Send rendered reminders (send_reminders.render) over `pool_size`
+    connections; one result row per reminder.
+
+    After `max_failures` connection failures in a row the remaining
+    reminders fail without being attempted. `record(results)` is called with
+    each batch of results as they come in.
+    """
+    domain = SMTP_FROM.rpartition("@")[2].rstrip(">") or "localhost"
+    items = [
+        {
+            "appointment_id": int(r.appointment_id),
+            "recipient": r.to,
+            "content_sha": sha,
+            "message": build_message(
+                r.content, f"<reminder.{day}.{int(r.appointment_id)}.{sha[:12]}@{domain}>"
+            ),
+        }
+        for r, sha in zip(
+            msgs.itertuples(index=False), [content_sha(c) for c in msgs["content"]], strict=True
+        )
+    ]
+    if not items:
+        return pd.DataFrame(
+            columns=[
+                "appointment_id",
+                "recipient",
+                "content_sha",
+                "status",
+                "attempts",
+                "last_error",
+                "updated_at",
+            ]
+        )
+    results = asyncio.run(
+        _deliver(items, pool_size, rate, host, port, retries, max_failures, record)
+    )
+    return pd.DataFrame(results)
+
+
+def _record(day: str):
+    def record(results: list) -> None:
+        with engine.begin() as conn:
+            upsert_frame(
+                conn,
+                "reminder_deliveries",
+                pd.DataFrame(results).assign(day=day),
+                ["day", "appointment_id"],
+            )
+
+    return record
+
+
+def send_day(msgs: pd.DataFrame, day: str, dry_run: bool = False) -> dict:
+    """Deliver the day's reminders that were not already sent as they are now,
+    recording each outcome in reminder_deliveries"""
+    with read_engine.begin() as conn:
+        sent = pd.read_sql(text(SENT_SQL), conn, params={"d": day})
+    sent = dict(zip(sent["appointment_id"], sent["content_sha"], strict=True))
+    shas = msgs["content"].map(content_sha)
+    todo = msgs[[sent.get(a) != s for a, s in zip(msgs["appointment_id"], shas, strict=True)]]
+    out = {"already_sent": len(msgs) - len(todo), "sent": 0, "failed": 0, "secs": 0.0}
+    if dry_run or todo.empty:
+        out["to_send"] = len(todo)
+        return out
+
+    t0 = time.perf_counter()
+    results = deliver(todo, day, record=_record(day))
+    out["secs"] = time.perf_counter() - t0
+    out["sent"] = int((results["status"] == "sent").sum())
+    out["failed"] = int((results["status"] == "failed").sum())
+    out["errors"] = results["last_error"].dropna().value_counts().head(3).to_dict()
+    return out
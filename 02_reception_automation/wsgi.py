@@ -0,0 +1,27 @@
+"""Production entry point for the reception API.
+
+Linux, several worker processes (config in gunicorn.conf.py next to this file):
+
+    gunicorn -c 02_reception_automation/gunicorn.conf.py 02_reception_automation.wsgi:app
+
+Windows, or anywhere without gunicorn: one process serving API_THREADS threads
+
+    python -m 02_reception_automation.wsgi
+
+Both need the optional server package (`pip install gunicorn` / `pip install
+waitress`). The debug server runs from the repo root too (server.py uses
+relative imports, so not as a script path):
+
+    python -m 02_reception_automation.server
+    flask --app 02_reception_automation.server run --port 8008 --debug
+"""
+
+import os
+
+from .server import app
+
+if __name__ == "__main__":
+    from waitress import serve
+
+    host, _, port = os.getenv("API_BIND", "127.0.0.1:8008").rpartition(":")
+    serve(app, host=host, port=int(port), threads=int(os.getenv("API_THREADS", 8)))
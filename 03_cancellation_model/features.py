@@ -6,12 +6,43 @@ sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 import pandas as pd
 import numpy as np
-from sqlalchemy import text
-from common.db import engine
+from sqlalchemy import bindparam, text
+from common.db import read_engine
 
 POS_STATUSES = {"no_show", "canceled"}  # label = 1
 NEG_STATUSES = {"completed"}  # label = 0
 
+# appointment times are read as wall-clock time in the clinic's zone
+CLINIC_TZ = "Europe/Berlin"
+
+
+# appointments in [start, end] with each patient's stored history up to that day
+RANGE_WITH_HISTORY_SQL = """
+SELECT
+  a.appointment_id, a.patient_id, a.physio_id,
+  a.appt_start, a.appt_end, a.booked_at, a.status,
+  a.price_estimate, a.appt_date,
+  COALESCE(h.prior_total, 0) AS hist_total,
+  COALESCE(h.prior_pos, 0) AS hist_pos
+FROM appointments a
+LEFT JOIN patient_history h ON h.patient_id = a.patient_id AND h.day = a.appt_date
+WHERE a.appt_date BETWEEN :start AND :end
+ORDER BY a.appt_start
+"""
+
+# every stored history day before :end of the given patients, for
+# appointments not in the DB yet: each takes its patient's latest day before
+# its own (one query for a whole batch instead of one per row)
+POSTED_HISTORY_SQL = """
+SELECT patient_id, day,
+       prior_total + n_total AS hist_total,
+       prior_pos + n_pos AS hist_pos
+FROM patient_history
+WHERE patient_id IN :ids AND day < :end
+"""
+# patients per POSTED_HISTORY_SQL call, well under SQLite's bound-variable limit
+HISTORY_CHUNK = 500
+
 
 def _load_all_appointments():
     q = """
@@ -22,22 +53,15 @@ def _load_all_appointments():
     FROM appointments a
     ORDER BY a.appt_start
     """
-    with engine.begin() as conn:
+    with read_engine.begin() as conn:
         df = pd.read_sql(
             text(q), conn, parse_dates=["appt_start", "appt_end", "booked_at"]
         )
     return df
 
 
-def _basic_features(df: pd.DataFrame) -> pd.DataFrame:
-    X = df.copy()
-    X["days_since_booking"] = (
-        (X["appt_start"] - X["booked_at"]).dt.days.clip(lower=0).fillna(0)
-    )
-    X["hour"] = X["appt_start"].dt.hour
-    X["weekday"] = X["appt_start"].dt.dayofweek  # 0=Mon
-
-    # cumulative patient history
+def _history_counts(X: pd.DataFrame) -> pd.DataFrame:
+    """prior_total/prior_pos from the full appointment history (training)"""
     X = X.sort_values(["patient_id", "appt_start"]).reset_index(drop=True)
     is_pos = X["status"].isin(POS_STATUSES).astype(int)
 
@@ -45,21 +69,66 @@ def _basic_features(df: pd.DataFrame) -> pd.DataFrame:
     X["prior_pos"] = (
         is_pos.groupby(X["patient_id"]).cumsum().shift(1).fillna(0).astype(int)
     )
-    X["noshow_rate_prior"] = np.where(
-        X["prior_total"] > 0, X["prior_pos"] / X["prior_total"], 0.0
-    )
-    X["is_new_patient"] = (X["prior_total"] == 0).astype(int)
-
-    # optional synthetic weather proxy
-    weather_proxy = pd.DataFrame(
-        [
-            {"weekday": 0, "hour": 8, "is_rainy": 1},
-            {"weekday": 0, "hour": 9, "is_rainy": 0},
-            # Add more rows as needed
-        ]
-    )
-    X = X.merge(weather_proxy, on=["weekday", "hour"], how="left")
-    X["is_rainy"] = X["is_rainy"].fillna(0)
+    return X
+
+
+def _day_history_counts(X: pd.DataFrame) -> pd.DataFrame:
+    """prior_total/prior_pos from patient_history plus earlier visits that day"""
+    X = X.sort_values(["patient_id", "appt_start"]).reset_index(drop=True)
+    is_pos = X["status"].isin(POS_STATUSES).astype(int)
+    same_day = [X["patient_id"], X["appt_date"]]
+
+    X["prior_total"] = X["hist_total"] + X.groupby(same_day).cumcount()
+    X["prior_pos"] = X["hist_pos"] + (is_pos.groupby(same_day).cumsum() - is_pos)
+    return X.drop(columns=["hist_total", "hist_pos"])
+
+
+# synthetic weather proxy: (weekday, hour) -> is_rainy, anything else is dry
+WEATHER_PROXY = {
+    (0, 8): 1,
+    (0, 9): 0,
+    # Add more rows as needed
+}
+_RAINY = np.zeros(7 * 24)
+for (_wd, _hr), _v in WEATHER_PROXY.items():
+    _RAINY[_wd * 24 + _hr] = _v
+
+FEATURE_COLS = [
+    "days_since_booking",
+    "hour",
+    "weekday",
+    "is_new_patient",
+    "noshow_rate_prior",
+    "price_estimate",
+    "is_rainy",  # added
+]
+
+
+def _time_features(appt_start: pd.Series, booked_at: pd.Series) -> dict:
+    hour = appt_start.dt.hour
+    weekday = appt_start.dt.dayofweek  # 0=Mon
+    return {
+        "days_since_booking": (appt_start - booked_at).dt.days.clip(lower=0).fillna(0),
+        "hour": hour,
+        "weekday": weekday,
+        "is_rainy": _RAINY[weekday.to_numpy() * 24 + hour.to_numpy()],
+    }
+
+
+def _prior_features(prior_total: pd.Series, prior_pos: pd.Series) -> dict:
+    return {
+        "noshow_rate_prior": np.where(prior_total > 0, prior_pos / prior_total, 0.0),
+        "is_new_patient": (prior_total == 0).astype(int),
+    }
+
+
+def _basic_features(df: pd.DataFrame, history=_history_counts) -> pd.DataFrame:
+    # cumulative patient history
+    X = history(df.copy())
+    for col, values in _time_features(X["appt_start"], X["booked_at"]).items():
+        X[col] = values
+    for col, values in _prior_features(X["prior_total"], X["prior_pos"]).items():
+        X[col] = values
 
     # label
     y = X["status"].map(
@@ -67,15 +136,7 @@ def _basic_features(df: pd.DataFrame) -> pd.DataFrame:
     )
     X["label"] = y
 
-    feat_cols = [
-        "days_since_booking",
-        "hour",
-        "weekday",
-        "is_new_patient",
-        "noshow_rate_prior",
-        "price_estimate",
-        "is_rainy",  # added
-    ]
+    feat_cols = list(FEATURE_COLS)
     keep_cols = [
         "appointment_id",
         "patient_id",
@@ -83,7 +144,10 @@ def _basic_features(df: pd.DataFrame) -> pd.DataFrame:
         "appt_start",
         "status",
         "label",
-    ] + feat_cols
+    ]
+    if "appt_date" in X.columns:
+        keep_cols.append("appt_date")  # scoring frames, to split output per day
+    keep_cols += feat_cols
     return X[keep_cols], feat_cols
 
 
@@ -94,8 +158,78 @@ def build_training_frame():
     return train_df, feat_cols
 
 
+def build_scoring_range(start: str, end: str):
+    """Features for every appointment from `start` to `end` in one pass.
+
+    Reads only those days and their patient_history rows, so the cost follows
+    the size of the range rather than of the whole table.
+    """
+    with read_engine.begin() as conn:
+        df = pd.read_sql(
+            text(RANGE_WITH_HISTORY_SQL),
+            conn,
+            params={"start": start, "end": end},
+            parse_dates=["appt_start", "appt_end", "booked_at"],
+        )
+    X, feat_cols = _basic_features(df, history=_day_history_counts)
+    return X, feat_cols
+
+
 def build_scoring_frame(day: str):
-    df = _load_all_appointments()
-    X, feat_cols = _basic_features(df)
-    score_df = X[X["appt_start"].dt.date.astype(str) == day].copy()
-    return score_df, feat_cols
+    return build_scoring_range(day, day)
+
+
+def _posted_history(conn, patient_ids: pd.Series, days: pd.Series) -> tuple:
+    """(prior_total, prior_pos) per row: the patient's stored history before
+    the row's day, zeros for a patient without any"""
+    q = text(POSTED_HISTORY_SQL).bindparams(bindparam("ids", expanding=True))
+    ids = sorted({int(p) for p in patient_ids})
+    end = days.max()
+    found = [
+        r
+        for i in range(0, len(ids), HISTORY_CHUNK)
+        for r in conn.execute(q, {"ids": ids[i : i + HISTORY_CHUNK], "end": end})
+    ]
+    hist = pd.DataFrame(found, columns=["patient_id", "day", "hist_total", "hist_pos"])
+    hist = hist.astype({"patient_id": "int64"}).assign(day=pd.to_datetime(hist["day"]))
+
+    posted = pd.DataFrame(
+        {
+            "row": np.arange(len(days)),
+            "patient_id": patient_ids.astype("int64").to_numpy(),
+            "day": pd.to_datetime(days).to_numpy(),
+        }
+    )
+    # latest history day strictly before each row's day, per patient
+    m = pd.merge_asof(
+        posted.sort_values("day"),
+        hist.sort_values("day"),
+        on="day",
+        by="patient_id",
+        allow_exact_matches=False,
+    ).sort_values("row")
+    prior_total = m["hist_total"].fillna(0).astype("int64").reset_index(drop=True)
+    prior_pos = m["hist_pos"].fillna(0).astype("int64").reset_index(drop=True)
+    return prior_total, prior_pos
+
+
+def build_posted_frame(rows: pd.DataFrame, conn):
+    """Features for appointments that may not be in the DB yet (e.g. POST /score).
+
+    `rows` needs patient_id, appt_start, booked_at and price_estimate; history
+    is everything stored before the appointment's day. Rows keep their order.
+    Built column by column without the sort/merge of _basic_features, since
+    this runs per request.
+    """
+    start_utc = pd.to_datetime(rows["appt_start"], utc=True, format="ISO8601")
+    booked_utc = pd.to_datetime(rows["booked_at"], utc=True, format="ISO8601")
+    start = start_utc.dt.tz_convert(CLINIC_TZ)
+    booked = booked_utc.dt.tz_convert(CLINIC_TZ)
+    days = start_utc.dt.strftime("%Y-%m-%d")
+
+    prior_total, prior_pos = _posted_history(conn, rows["patient_id"], days)
+    cols = _time_features(start, booked)
+    cols.update(_prior_features(prior_total, prior_pos))
+    cols["price_estimate"] = rows["price_estimate"].astype(float)
+    X = pd.DataFrame({c: np.asarray(cols[c]) for c in FEATURE_COLS})
+    return X, list(FEATURE_COLS)
@@ -0,0 +1,216 @@
+"""NumPy-only inference for the cancellation model.
+
+train.py exports the fitted Pipeline (ColumnTransformer of StandardScaler +
+OneHotEncoder, then a RandomForestClassifier) as plain .npy files under
+model_arrays/<version>/, where <version> is the model_version of the joblib
+file they came from. model_arrays/CURRENT names the live version.
+
+The arrays are memory-mapped read-only, so every API worker and score.py run
+on the machine shares one copy in the page cache instead of unpickling its
+own forest. Scoring walks every tree for every row at once with NumPy
+gathers; nothing here imports sklearn.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 2
+ARRAYS_DIR = Path(__file__).resolve().parent / "model_arrays"
+
+# rows scored per traversal; the (rows x trees) node arrays stay a few MB
+CHUNK_ROWS = 1024
+# levels walked between dropping (row, tree) pairs that reached a leaf
+COMPACT_EVERY = 4
+
+
+def flatten(pipe) -> tuple:
+    """(meta, arrays) for a fitted pipeline.
+
+    Raises ValueError for pipelines this module cannot reproduce.
+    """
+    pre, clf = pipe[:-1], pipe.steps[-1][1]
+    if len(pre) != 1 or not hasattr(pre[0], "transformers_"):
+        raise ValueError("expected Pipeline([ColumnTransformer, forest])")
+    if not hasattr(clf, "estimators_") or list(clf.classes_) != [0, 1]:
+        raise ValueError("expected a fitted binary forest classifier")
+
+    num_cols, mean, scale = [], None, None
+    cat_cols, cat_values, cat_offsets = [], [], [0]
+    for name, step, cols in pre[0].transformers_:
+        if name == "remainder":
+            continue
+        kind = type(step).__name__
+        if kind == "StandardScaler" and not num_cols:
+            num_cols = list(cols)
+            mean = step.mean_ if step.with_mean else np.zeros(len(cols))
+            scale = step.scale_ if step.with_std else np.ones(len(cols))
+        elif kind == "OneHotEncoder" and not cat_cols and step.drop is None:
+            cat_cols = list(cols)
+            for cats in step.categories_:
+                cat_values.extend(np.asarray(cats, dtype=np.float64))
+                cat_offsets.append(len(cat_values))
+        else:
+            raise ValueError(f"unsupported transformer {name}: {kind}")
+
+    # all trees in one node table; leaves point at themselves so a fixed
+    # number of steps lands every row on its leaf. The child of node i is
+    # children[2 * i + went_left], one gather per level.
+    feature, threshold, children, p1, roots = [], [], [], [], []
+    base = 0
+    for est in clf.estimators_:
+        t = est.tree_
+        n = t.node_count
+        leaf = t.children_left == -1
+        idx = np.arange(n) + base
+        roots.append(base)
+        feature.append(np.where(leaf, 0, t.feature))
+        threshold.append(np.where(leaf, np.inf, t.threshold))
+        left = np.where(leaf, idx, t.children_left + base)
+        right = np.where(leaf, idx, t.children_right + base)
+        children.append(np.column_stack([right, left]).ravel())
+        v = t.value[:, 0, :]
+        p1.append(v[:, 1] / v.sum(axis=1))
+        base += n
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "num_cols": num_cols,
+        "cat_cols": cat_cols,
+        "max_depth": int(max(e.tree_.max_depth for e in clf.estimators_)),
+    }
+    children = np.concatenate(children).astype(np.int32)
+    arrays = {
+        "mean": np.asarray(mean, dtype=np.float64),
+        "scale": np.asarray(scale, dtype=np.float64),
+        "cat_values": np.asarray(cat_values, dtype=np.float64),
+        "cat_offsets": np.asarray(cat_offsets, dtype=np.int64),
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "children": children,
+        "is_leaf": children[1::2] == np.arange(base),
+        "p1": np.concatenate(p1).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }
+    return meta, arrays
+
+
+def export(pipe, version: str, root: Path = ARRAYS_DIR, keep: int = 2) -> Path:
+    """Write root/<version>/ and point root/CURRENT at it.
+
+    The directory is complete before CURRENT changes (written aside, then
+    renamed) and CURRENT itself is swapped with os.replace, so a worker
+    polling it never sees a half-written model. Older versions beyond `keep`
+    are removed.
+    """
+    meta, arrays = flatten(pipe)
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    out, tmp = root / version, root / f".{version}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    for name, arr in arrays.items():
+        np.save(tmp / f"{name}.npy", np.ascontiguousarray(arr))
+    (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    shutil.rmtree(out, ignore_errors=True)
+    tmp.rename(out)
+
+    pointer = root / ".CURRENT.tmp"
+    pointer.write_text(version, encoding="utf-8")
+    os.replace(pointer, root / "CURRENT")
+    prune(root, keep)
+    return out
+
+
+def prune(root: Path = ARRAYS_DIR, keep: int = 2) -> None:
+    """Drop all but the `keep` newest versions (never the current one)"""
+    live = current(root)
+    dirs = sorted(
+        (d for d in Path(root).iterdir() if d.is_dir() and not d.name.startswith(".")),
+        key=lambda d: d.stat().st_mtime,
+        reverse=True,
+    )
+    for d in dirs[keep:]:
+        if d.name != live:
+            # a worker may still map it; on Windows that blocks the delete
+            shutil.rmtree(d, ignore_errors=True)
+
+
+def current(root: Path = ARRAYS_DIR):
+    """Version named by root/CURRENT, or None when nothing was exported"""
+    try:
+        return (Path(root) / "CURRENT").read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load(version: str, root: Path = ARRAYS_DIR, mmap: bool = True) -> dict:
+    """Model dict for root/<version>/; arrays are read-only memory maps"""
+    path = Path(root) / version
+    meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    if meta["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported format {meta['format_version']}")
+    model = dict(meta, version=version)
+    for f in path.glob("*.npy"):
+        arr = np.load(f, mmap_mode="r" if mmap else None, allow_pickle=False)
+        # plain ndarray view: gathers on a memmap subclass come back as memmaps
+        model[f.stem] = np.asarray(arr)
+    return model
+
+
+def transform(model: dict, X) -> np.ndarray:
+    """ColumnTransformer output rounded through float32 like sklearn's trees.
+
+    Kept as float64 (exact) since the thresholds are float64; the comparison
+    is then the same one the tree code makes.
+    """
+    num = np.column_stack([np.asarray(X[c], dtype=np.float64) for c in model["num_cols"]])
+    blocks = [(num - model["mean"]) / model["scale"]]
+    off, vals = model["cat_offsets"], model["cat_values"]
+    for i, c in enumerate(model["cat_cols"]):
+        x = np.asarray(X[c], dtype=np.float64)
+        # unknown categories one-hot to all zeros (handle_unknown="ignore")
+        blocks.append((x[:, None] == vals[off[i] : off[i + 1]][None, :]).astype(np.float64))
+    return np.hstack(blocks).astype(np.float32).astype(np.float64)
+
+
+def _traverse(model: dict, Z: np.ndarray) -> np.ndarray:
+    """Positive-class probability for each row of Z, averaged over trees.
+
+    Every (tree, row) pair is one entry in flat arrays, tree-major so that
+    neighbouring entries hit the same nodes. Each level is a few gathers;
+    pairs that reached a leaf are dropped every COMPACT_EVERY levels.
+    """
+    feature, threshold = model["feature"], model["threshold"]
+    children, is_leaf = model["children"], model["is_leaf"]
+    n, n_feat, n_trees = len(Z), Z.shape[1], len(model["roots"])
+    depth = model["max_depth"]
+
+    node = np.repeat(model["roots"], n)
+    pos = np.arange(n * n_trees, dtype=np.int32)
+    base = np.tile(np.arange(n, dtype=np.int32) * n_feat, n_trees)
+    leaf = np.empty(n * n_trees, dtype=np.int32)
+    zf = Z.ravel()
+    level = 0
+    while len(node):
+        went_left = zf[base + feature[node]] <= threshold[node]
+        node = children[2 * node + went_left]
+        level += 1
+        if level % COMPACT_EVERY == 0 or level >= depth:
+            done = is_leaf[node]
+            leaf[pos[done]] = node[done]
+            keep = ~done
+            node, pos, base = node[keep], pos[keep], base[keep]
+    return model["p1"][leaf].reshape(n_trees, n).mean(axis=0)
+
+
+def predict_proba(model: dict, X) -> np.ndarray:
+    """(n, 2) class probabilities, matching Pipeline.predict_proba"""
+    Z = transform(model, X)
+    p1 = np.empty(len(Z))
+    for i in range(0, len(Z), CHUNK_ROWS):
+        p1[i : i + CHUNK_ROWS] = _traverse(model, Z[i : i + CHUNK_ROWS])
+    return np.column_stack([1.0 - p1, p1])
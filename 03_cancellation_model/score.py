@@ -4,10 +4,24 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 import argparse
+import hashlib
+import importlib
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
 import pandas as pd
+import forest
 from joblib import load
-from features import build_scoring_frame
+from common.bulk import upsert_frame
+from common.db import engine
+from features import build_scoring_range
+
+REPO = Path(__file__).resolve().parents[1]
+
+# rows per predict_proba call; keeps memory flat when re-scoring long ranges
+CHUNK_ROWS = 200_000
 
 
 def load_threshold():
@@ -28,59 +42,153 @@ def bucket(x: float, threshold: float = 0.7) -> str:
         return "low"
 
 
-def write_outputs(day: str, scores: pd.DataFrame):
-    repo = Path(__file__).resolve().parents[1]
+def model_version(model_file: Path) -> str:
+    """Content hash of the model file, so re-training never overwrites old scores"""
+    return hashlib.sha256(model_file.read_bytes()).hexdigest()[:12]
 
-    # daily file for reception loader
-    daily = repo / "data" / "daily" / day
-    daily.mkdir(parents=True, exist_ok=True)
-    scores[["appointment_id", "risk_score", "risk_bucket"]].to_csv(
-        daily / "cancellation_scores.csv", index=False
+
+def buckets(scores: np.ndarray, threshold: float = 0.7) -> np.ndarray:
+    """Vectorized `bucket` over an array of scores"""
+    return np.select([scores >= threshold, scores >= 0.4], ["high", "medium"], default="low")
+
+
+def load_predictor(model_file: Path, arrays: bool = False):
+    """(predict_proba, version) for a model file.
+
+    The sklearn pipeline by default: its compiled trees are several times
+    faster per row on the large frames a range re-score builds. With `arrays`
+    it uses the memory-mapped model_arrays/<version>/ export when there is one
+    (shared page cache, no sklearn, much faster to load).
+    """
+    version = model_version(model_file)
+    if arrays and (forest.ARRAYS_DIR / version).is_dir():
+        model = forest.load(version)
+        return (lambda X: forest.predict_proba(model, X)), version
+    return load(model_file).predict_proba, version
+
+
+def predict_scores(
+    predict_proba, df: pd.DataFrame, feat_cols, threshold: float, chunk_rows=CHUNK_ROWS
+):
+    """Score every row of `df` with predict_proba in fixed-size chunks"""
+    probs = np.concatenate(
+        [
+            predict_proba(df[feat_cols].iloc[i : i + chunk_rows])[:, 1]
+            for i in range(0, len(df), chunk_rows)
+        ]
     )
+    out = pd.DataFrame(
+        {
+            "day": df["appt_date"].to_numpy(),
+            "appointment_id": df["appointment_id"].astype(int).to_numpy(),
+            "risk_score": probs,
+        }
+    )
+    out["risk_bucket"] = buckets(probs, threshold)
+    return out
+
 
-    # combined file
+def write_daily(day: str, scores: pd.DataFrame) -> Path:
+    """Daily file for the reception loader"""
+    daily = REPO / "data" / "daily" / day
+    daily.mkdir(parents=True, exist_ok=True)
+    dst = daily / "cancellation_scores.csv"
+    scores[["appointment_id", "risk_score", "risk_bucket"]].to_csv(dst, index=False)
+    return dst
+
+
+def write_combined(scores: pd.DataFrame) -> Path:
+    """Replace the scored days in the combined file with one read and one write"""
     dst = Path(__file__).resolve().parent / "cancellation_scores.csv"
     if dst.exists():
         old = pd.read_csv(dst)
-        old = old[old["day"] != day]
+        old = old[~old["day"].isin(scores["day"].unique())]
         combined = pd.concat([old, scores], ignore_index=True)
     else:
         combined = scores.copy()
     combined.to_csv(dst, index=False)
+    return dst
+
 
-    print(f"Wrote {len(scores)} scores to:")
-    print(f"  - {daily / 'cancellation_scores.csv'}")
+def store_scores(scores: pd.DataFrame, version: str) -> int:
+    """Upsert into cancellation_scores keyed by (appointment_id, model_version)"""
+    rows = scores.assign(model_version=version, scored_at=datetime.utcnow().isoformat())
+    with engine.begin() as conn:
+        return upsert_frame(conn, "cancellation_scores", rows, ["appointment_id", "model_version"])
+
+
+def export_csv(scores: pd.DataFrame, workers: int = None):
+    """Optional CSV copies: one file per day plus the combined file"""
+    days = dict(tuple(scores.groupby("day", sort=True)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        daily = list(pool.map(lambda kv: write_daily(*kv), days.items()))
+    dst = write_combined(scores)
+
+    print(f"Wrote {len(scores)} scores for {len(days)} day(s) to:")
+    for path in daily[:3]:
+        print(f"  - {path}")
+    if len(daily) > 3:
+        print(f"  - ... and {len(daily) - 3} more daily files")
     print(f"  - {dst}")
 
 
-def main(day: str, model_path: str):
-    pipe = load(Path(__file__).resolve().parent / model_path)
+def main(
+    start: str,
+    end: str,
+    model_path: str,
+    workers: int = None,
+    csv: bool = False,
+    arrays: bool = False,
+):
+    """Score every appointment from `start` to `end` with one model load.
+
+    Rebuilds tomorrow's priority list when the range includes tomorrow.
+    """
+    t0 = time.perf_counter()
+    model_file = Path(__file__).resolve().parent / model_path
+    predict_proba, version = load_predictor(model_file, arrays)
     threshold = load_threshold()
 
-    df, feat_cols = build_scoring_frame(day)
+    df, feat_cols = build_scoring_range(start, end)
+    span = start if start == end else f"{start}..{end}"
     if df.empty:
-        print(f"No appointments found for {day}. Nothing to score.")
+        print(f"No appointments found for {span}. Nothing to score.")
         return
 
-    probs = pipe.predict_proba(df[feat_cols])[:, 1]
-    out = pd.DataFrame(
-        {
-            "day": day,
-            "appointment_id": df["appointment_id"].astype(int),
-            "risk_score": probs,
-        }
-    )
-    out["risk_bucket"] = out["risk_score"].map(lambda x: bucket(x, threshold))
-    write_outputs(day, out)
+    out = predict_scores(predict_proba, df, feat_cols, threshold)
+    n = store_scores(out, version)
+    print(f"Stored {n} scores in cancellation_scores (model {version})")
+    bp = importlib.import_module("02_reception_automation.build_priorities")
+    if start <= bp._tomorrow_str() <= end:
+        # tomorrow's list carries these risk scores
+        bp.rebuild_tomorrow("score.py")
+    if csv:
+        export_csv(out, workers)
+    print(f"Scored {span} in {time.perf_counter() - t0:.2f}s")
 
 
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
-    p.add_argument("--day", required=True, help="YYYY-MM-DD")
+    p.add_argument("--day", help="YYYY-MM-DD")
+    p.add_argument("--from", dest="start", help="score a range from YYYY-MM-DD")
+    p.add_argument("--to", dest="end", help="score a range up to YYYY-MM-DD")
     p.add_argument(
         "--model",
         default="model.joblib",
         help="model filename inside 03_cancellation_model",
     )
+    p.add_argument("--csv", action="store_true", help="also write the per-day and combined CSVs")
+    p.add_argument("--workers", type=int, help="threads writing daily CSVs")
+    p.add_argument(
+        "--arrays",
+        action="store_true",
+        help="score with the mmapped model_arrays export instead of the sklearn "
+        "pipeline (faster to load, slower per row on large ranges)",
+    )
     args = p.parse_args()
-    main(args.day, args.model)
+    if args.day:
+        main(args.day, args.day, args.model, args.workers, args.csv, args.arrays)
+    elif args.start and args.end:
+        main(args.start, args.end, args.model, args.workers, args.csv, args.arrays)
+    else:
+        p.error("pass --day, or --from and --to")
@@ -7,7 +7,7 @@ import argparse
 import json
 import numpy as np
 import pandas as pd
-from joblib import dump
+from joblib import dump, load
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.ensemble import RandomForestClassifier
@@ -15,6 +15,8 @@ from sklearn.pipeline import Pipeline
 from sklearn.metrics import roc_auc_score, average_precision_score
 
 from features import build_training_frame
+import forest
+from score import model_version
 
 
 def precision_at_k(y_true, y_score, k=None, frac=None):
@@ -40,6 +42,15 @@ def compute_dynamic_threshold(y_true, y_score, coverage=0.5):
     return float(threshold)
 
 
+def export_arrays(pipe, model_file: Path):
+    """Memory-mappable copy for sklearn-free scoring (forest.py); running API
+    workers pick it up from model_arrays/CURRENT without a restart"""
+    try:
+        forest.export(pipe, model_version(model_file))
+    except ValueError as e:
+        print(f"Skipping the model_arrays export: {e}")
+
+
 def main(valid_days: int, model_out: str):
     df, feat_cols = build_training_frame()
     df = df.sort_values("appt_start")
@@ -107,6 +118,7 @@ def main(valid_days: int, model_out: str):
 
     outdir = Path(__file__).resolve().parent
     dump(pipe, outdir / model_out)
+    export_arrays(pipe, outdir / model_out)
     with open(outdir / "metrics.json", "w", encoding="utf-8") as f:
         json.dump(metrics, f, indent=2)
 
@@ -117,5 +129,14 @@ if __name__ == "__main__":
     p = argparse.ArgumentParser()
     p.add_argument("--valid-days", type=int, default=7)
     p.add_argument("--model-out", default="model.joblib")
+    p.add_argument(
+        "--export-only",
+        action="store_true",
+        help="skip training; write model_arrays/ for the existing --model-out file",
+    )
     args = p.parse_args()
-    main(args.valid_days, args.model_out)
+    if args.export_only:
+        model_file = Path(__file__).resolve().parent / args.model_out
+        export_arrays(load(model_file), model_file)
+    else:
+        main(args.valid_days, args.model_out)
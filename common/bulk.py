@@ -0,0 +1,122 @@
+import time
+
+import pandas as pd
+from sqlalchemy import inspect
+
+# rows per CSV chunk / executemany batch; memory stays flat regardless of file size
+CHUNK_ROWS = 50_000
+
+_PLACEHOLDER = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+
+def table_columns(conn, table: str) -> dict:
+    """Insertable columns of `table` (generated columns excluded) -> python type"""
+    cols = {}
+    for c in inspect(conn).get_columns(table):
+        if c.get("computed"):
+            continue
+        try:
+            cols[c["name"]] = c["type"].python_type
+        except NotImplementedError:
+            cols[c["name"]] = str
+    return cols
+
+
+def coerce_frame(df: pd.DataFrame, types: dict) -> pd.DataFrame:
+    """Cast each column to the schema type; unparsable values become NULL"""
+    out = pd.DataFrame(index=df.index)
+    for col, typ in types.items():
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if typ is int:
+            s = pd.to_numeric(s, errors="coerce").round().astype("Int64")
+        elif typ is float:
+            s = pd.to_numeric(s, errors="coerce").astype("float64")
+        else:
+            s = s.astype("string")
+        out[col] = s
+    return out
+
+
+def _rows(df: pd.DataFrame):
+    # object dtype turns numpy scalars / pd.NA into plain python values the driver accepts
+    obj = df.astype(object)
+    return list(obj.where(obj.notna(), None).itertuples(index=False, name=None))
+
+
+def _insert_sql(conn, table: str, cols) -> str:
+    mark = _PLACEHOLDER.get(conn.dialect.paramstyle, "?")
+    names = ", ".join(cols)
+    marks = ", ".join([mark] * len(cols))
+    return f"INSERT INTO {table} ({names}) VALUES ({marks})"
+
+
+def insert_frame(conn, table: str, df: pd.DataFrame, types: dict = None) -> int:
+    """Coerce `df` to the schema and insert it with one prepared executemany.
+
+    Runs on the caller's connection, so it joins whatever transaction is open.
+    """
+    if df.empty:
+        return 0
+    types = types or table_columns(conn, table)
+    unknown = [c for c in df.columns if c not in types]
+    if unknown:
+        raise ValueError(f"{table}: columns not in schema: {unknown}")
+    frame = coerce_frame(df, types)
+    conn.exec_driver_sql(_insert_sql(conn, table, list(frame.columns)), _rows(frame))
+    return len(frame)
+
+
+def upsert_frame(conn, table: str, df: pd.DataFrame, key, types: dict = None) -> int:
+    """Insert-or-update `df` on the `key` column(s) with one executemany"""
+    if df.empty:
+        return 0
+    keys = [key] if isinstance(key, str) else list(key)
+    types = types or table_columns(conn, table)
+    frame = coerce_frame(df, types)
+    cols = list(frame.columns)
+    sets = ", ".join(f"{c}=excluded.{c}" for c in cols if c not in keys)
+    sql = _insert_sql(conn, table, cols) + f" ON CONFLICT ({', '.join(keys)}) DO "
+    sql += f"UPDATE SET {sets}" if sets else "NOTHING"
+    conn.exec_driver_sql(sql, _rows(frame))
+    return len(frame)
+
+
+def delete_keys(conn, table: str, key: str, values) -> int:
+    """Delete rows whose `key` is in `values` with one executemany"""
+    values = list(values)
+    if not values:
+        return 0
+    mark = _PLACEHOLDER.get(conn.dialect.paramstyle, "?")
+    conn.exec_driver_sql(
+        f"DELETE FROM {table} WHERE {key} = {mark}", [(_plain(v),) for v in values]
+    )
+    return len(values)
+
+
+def _plain(v):
+    return v.item() if hasattr(v, "item") else v
+
+
+def read_csv_text(csv_path, **kwargs):
+    """Read a CSV with every column as text (coerce_frame does the typing)"""
+    return pd.read_csv(csv_path, dtype=str, keep_default_na=False, na_values=[""], **kwargs)
+
+
+def stream_csv(engine, csv_path, table: str, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Load a CSV into `table` in fixed-size chunks inside a single transaction"""
+    t0 = time.perf_counter()
+    rows = 0
+    with engine.begin() as conn:
+        types = table_columns(conn, table)
+        # read everything as text so chunks never disagree on inferred dtypes
+        for chunk in read_csv_text(csv_path, chunksize=chunk_rows):
+            rows += insert_frame(conn, table, chunk, types)
+    secs = time.perf_counter() - t0
+    return {
+        "table": table,
+        "rows": rows,
+        "seconds": secs,
+        "rows_per_sec": rows / secs if secs > 0 else 0.0,
+    }
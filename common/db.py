@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
 from dotenv import load_dotenv
 import os
 
@@ -6,7 +7,69 @@ import os
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///clinic.db")
-engine = create_engine(DATABASE_URL, future=True)
+
+# applied to every new SQLite connection; WAL lets dashboard/API readers keep
+# going while refresh_daily holds the write lock
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KIB", 64 * 1024)),  # negative = KiB
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+    "busy_timeout": 5000,
+}
+
+# journal_mode is a property of the file and cannot be set read-only
+READ_ONLY_PRAGMAS = {
+    **{k: v for k, v in SQLITE_PRAGMAS.items() if k != "journal_mode"},
+    "query_only": "ON",
+}
+
+
+def _is_sqlite_file(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _apply_pragmas(eng, pragmas: dict):
+    @event.listens_for(eng, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cur.execute(f"PRAGMA {name}={value}")
+        cur.close()
+
+
+def make_engine(url: str = DATABASE_URL, read_only: bool = False, pool_size: int = 5):
+    """Build an engine with the tuned SQLite pragmas.
+
+    Writers get a single pooled connection so concurrent jobs queue on the pool
+    instead of failing with 'database is locked'. Readers open the file with
+    mode=ro and share a pool. Non-SQLite URLs get a plain pooled engine.
+    """
+    u = make_url(url)
+    if not _is_sqlite_file(u):
+        return create_engine(url, future=True)
+
+    if read_only:
+        path = os.path.abspath(u.database)
+        eng = create_engine(
+            f"sqlite:///file:{path}?mode=ro&uri=true",
+            future=True,
+            pool_size=pool_size,
+            max_overflow=0,
+        )
+        _apply_pragmas(eng, READ_ONLY_PRAGMAS)
+    else:
+        eng = create_engine(url, future=True, pool_size=1, max_overflow=0)
+        _apply_pragmas(eng, SQLITE_PRAGMAS)
+    return eng
+
+
+# single writer for ETL, migrations and anything that modifies data
+engine = make_engine(DATABASE_URL)
+# pooled read-only connections for the dashboard, API and reports
+read_engine = make_engine(DATABASE_URL, read_only=True, pool_size=8)
 
 
 def run_sql_file(path: str):
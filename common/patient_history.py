@@ -0,0 +1,82 @@
+# --- ensure 'common' is importable no matter where we run from ---
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import bindparam, text
+
+from common.db import engine, run_sql_file
+
+# patient_history holds one row per (patient, appointment day) with the
+# cumulative and rolling counts before that day. A refresh recomputes only the
+# patients it touched, so scoring a day is a join on that day's rows instead
+# of a pass over every appointment ever recorded.
+
+HISTORY_INSERT = """
+INSERT INTO patient_history
+  (patient_id, day, n_total, n_pos, n_noshow, prior_total, prior_pos, first_seen, last_seen,
+   total_30d, pos_30d, noshow_30d, total_90d, pos_90d, noshow_90d)
+SELECT patient_id,
+       day,
+       n_total,
+       n_pos,
+       n_noshow,
+       SUM(n_total) OVER upto - n_total,
+       SUM(n_pos) OVER upto - n_pos,
+       MIN(day) OVER upto,
+       LAG(day) OVER upto,
+       COALESCE(SUM(n_total) OVER last30, 0),
+       COALESCE(SUM(n_pos) OVER last30, 0),
+       COALESCE(SUM(n_noshow) OVER last30, 0),
+       COALESCE(SUM(n_total) OVER last90, 0),
+       COALESCE(SUM(n_pos) OVER last90, 0),
+       COALESCE(SUM(n_noshow) OVER last90, 0)
+FROM (
+  SELECT patient_id,
+         appt_date AS day,
+         julianday(appt_date) AS jd,
+         COUNT(*) AS n_total,
+         SUM(CASE WHEN status IN ('no_show','canceled') THEN 1 ELSE 0 END) AS n_pos,
+         SUM(CASE WHEN status = 'no_show' THEN 1 ELSE 0 END) AS n_noshow
+  FROM appointments
+  {where}
+  GROUP BY patient_id, appt_date
+)
+WINDOW upto AS (PARTITION BY patient_id ORDER BY day ROWS UNBOUNDED PRECEDING),
+       last30 AS (PARTITION BY patient_id ORDER BY jd RANGE BETWEEN 30 PRECEDING AND 1 PRECEDING),
+       last90 AS (PARTITION BY patient_id ORDER BY jd RANGE BETWEEN 90 PRECEDING AND 1 PRECEDING)
+"""
+
+# per-patient maintenance, in order; served by the PK and idx_appt_patient_date
+PATIENT_STATEMENTS = [
+    "DELETE FROM patient_history WHERE patient_id IN :ids",
+    HISTORY_INSERT.format(where="WHERE patient_id IN :ids"),
+]
+
+# stays well under SQLite's bound-variable limit
+_CHUNK = 500
+
+
+def refresh_patient_history(conn, patient_ids):
+    """Recompute patient_history for the given patients on the caller's connection"""
+    ids = sorted({int(i) for i in patient_ids})
+    for i in range(0, len(ids), _CHUNK):
+        params = {"ids": ids[i : i + _CHUNK]}
+        for sql in PATIENT_STATEMENTS:
+            conn.execute(text(sql).bindparams(bindparam("ids", expanding=True)), params)
+
+
+def rebuild_patient_history(conn):
+    """Recompute every patient_history row from scratch (initial load, migrations)"""
+    conn.execute(text("DELETE FROM patient_history"))
+    conn.execute(text(HISTORY_INSERT.format(where="")))
+
+
+if __name__ == "__main__":
+    # create the table on an existing DB and fill it
+    root = Path(__file__).resolve().parents[1]
+    run_sql_file(str(root / "01_kpi_dashboard" / "schema.sql"))
+    with engine.begin() as conn:
+        rebuild_patient_history(conn)
+    print("✅ Rebuilt patient_history.")
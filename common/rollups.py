@@ -0,0 +1,133 @@
+# --- ensure 'common' is importable no matter where we run from ---
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, text
+
+from common.db import engine, run_sql_file
+
+# Rollups are rebuilt per day from the raw tables, so a refresh only pays for
+# the days it touched and readers get O(days) rows instead of O(appointments).
+
+KPI_INSERT = """
+INSERT INTO daily_kpis
+  (day, bookings, completed, canceled, no_show, revenue_estimate, revenue_paid, updated_at)
+SELECT appt_date AS day,
+       COUNT(*),
+       SUM(CASE WHEN status='completed' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN status='canceled' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN status='no_show' THEN 1 ELSE 0 END),
+       COALESCE(SUM(price_estimate), 0),
+       0,
+       :t
+FROM appointments
+{where}
+GROUP BY appt_date
+"""
+
+KPI_PAID = """
+UPDATE daily_kpis
+SET revenue_paid = (
+  SELECT COALESCE(SUM(p.amount), 0)
+  FROM payments p JOIN appointments a ON a.appointment_id = p.appointment_id
+  WHERE a.appt_date = daily_kpis.day
+)
+{where}
+"""
+
+UTIL_INSERT = """
+INSERT INTO daily_utilization (day, physio_id, appointments, hours_scheduled)
+SELECT appt_date AS day,
+       physio_id,
+       COUNT(*),
+       SUM(strftime('%s', appt_end) - strftime('%s', appt_start)) / 3600.0
+FROM appointments
+{where}
+GROUP BY appt_date, physio_id
+"""
+
+# readers (dashboard, report)
+KPI_DAY_SQL = """
+SELECT bookings,
+       canceled AS cancellations,
+       CASE WHEN completed + no_show = 0 THEN 0.0
+            ELSE 1.0 * completed / (completed + no_show)
+       END AS show_rate,
+       revenue_estimate,
+       revenue_paid
+FROM daily_kpis
+WHERE day = :d
+"""
+
+UTIL_DAY_SQL = """
+SELECT p.full_name, u.hours_scheduled
+FROM daily_utilization u JOIN physios p ON p.physio_id = u.physio_id
+WHERE u.day = :d
+ORDER BY p.full_name
+"""
+
+TREND_SQL = """
+SELECT day AS d,
+       bookings,
+       canceled AS cancellations,
+       completed,
+       no_show
+FROM daily_kpis
+WHERE day >= DATE('now','-14 day')
+ORDER BY day
+"""
+
+
+# day-scoped maintenance, in order; each is served by idx_appt_date or a PK
+DAY_STATEMENTS = [
+    "DELETE FROM daily_kpis WHERE day IN :days",
+    "DELETE FROM daily_utilization WHERE day IN :days",
+    KPI_INSERT.format(where="WHERE appt_date IN :days"),
+    KPI_PAID.format(where="WHERE day IN :days"),
+    UTIL_INSERT.format(where="WHERE appt_date IN :days"),
+]
+
+
+def _run(conn, days=None):
+    t = datetime.utcnow().isoformat()
+    if days is None:
+        conn.execute(text("DELETE FROM daily_kpis"))
+        conn.execute(text("DELETE FROM daily_utilization"))
+        conn.execute(text(KPI_INSERT.format(where="")), {"t": t})
+        conn.execute(text(KPI_PAID.format(where="")))
+        conn.execute(text(UTIL_INSERT.format(where="")))
+        return
+
+    params = {"days": sorted(days), "t": t}
+    for sql in DAY_STATEMENTS:
+        stmt = text(sql).bindparams(bindparam("days", expanding=True))
+        conn.execute(stmt, params)
+
+
+def refresh_rollups(conn, days):
+    """Recompute daily_kpis/daily_utilization for the given days.
+
+    Pass the caller's open connection so the rollup lands in the same
+    transaction as the data it summarizes.
+    """
+    days = {str(d) for d in days}
+    if days:
+        _run(conn, days)
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup row from scratch (initial load, backfills)"""
+    _run(conn)
+
+
+if __name__ == "__main__":
+    # create the rollup tables on an existing DB and fill them
+    root = Path(__file__).resolve().parents[1]
+    run_sql_file(str(root / "01_kpi_dashboard" / "schema.sql"))
+    with engine.begin() as conn:
+        rebuild_rollups(conn)
+    print("✅ Rebuilt daily_kpis and daily_utilization.")
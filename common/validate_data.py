@@ -3,16 +3,109 @@ import sys
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[2]))
-import json, sys
+import argparse, json, sys
 from datetime import datetime, timedelta
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from sqlalchemy import text
-from common.db import engine
+from common.db import read_engine
+
+TOMORROW_FLAGS_SQL = """
+SELECT
+  SUM(CASE WHEN p.phone IS NULL OR LENGTH(TRIM(p.phone)) < 6 THEN 1 ELSE 0 END) AS missing_phone,
+  SUM(CASE WHEN p.consent_form_received = 0 THEN 1 ELSE 0 END) AS missing_consent
+FROM appointments a
+JOIN patients p ON p.patient_id = a.patient_id
+WHERE a.appt_date = :d
+"""
+
+OVERLAP_ROWS_SQL = """
+SELECT a.appointment_id, a.physio_id,
+       CAST(strftime('%s', a.appt_start) AS INTEGER) AS start_s,
+       CAST(strftime('%s', a.appt_end) AS INTEGER) AS end_s
+FROM appointments a
+WHERE {appts}
+"""
+
+# Every check is a template over three filters: {appts} on appointments `a`,
+# {payments} on payments `p` and {patients} on patients. The full audit fills
+# them with 1=1, --day/--since with appt_date/paid_date predicates, so a gate
+# after a refresh only reads the touched day(s) through the date indexes.
+ZERO_CHECKS = [
+    (
+        "null_patient_names",
+        "SELECT COUNT(*) FROM patients WHERE (first_name IS NULL OR last_name IS NULL) AND {patients}",
+    ),
+    (
+        "bad_consent_values",
+        "SELECT COUNT(*) FROM patients WHERE consent_form_received NOT IN (0,1) AND {patients}",
+    ),
+    (
+        "invalid_status_values",
+        "SELECT COUNT(*) FROM appointments a WHERE a.status NOT IN ('booked','completed','canceled','no_show') AND {appts}",
+    ),
+    (
+        "end_before_start",
+        "SELECT COUNT(*) FROM appointments a WHERE strftime('%s', a.appt_end) <= strftime('%s', a.appt_start) AND {appts}",
+    ),
+    (
+        "booked_after_start",
+        "SELECT COUNT(*) FROM appointments a WHERE strftime('%s', a.booked_at) > strftime('%s', a.appt_start) AND {appts}",
+    ),
+    # referential
+    (
+        "orphans_in_appointments_patients",
+        "SELECT COUNT(*) FROM appointments a LEFT JOIN patients p ON p.patient_id=a.patient_id WHERE p.patient_id IS NULL AND {appts}",
+    ),
+    (
+        "orphans_in_appointments_physios",
+        "SELECT COUNT(*) FROM appointments a LEFT JOIN physios ph ON ph.physio_id=a.physio_id WHERE ph.physio_id IS NULL AND {appts}",
+    ),
+    (
+        "orphans_in_payments",
+        "SELECT COUNT(*) FROM payments p LEFT JOIN appointments a ON a.appointment_id=p.appointment_id WHERE a.appointment_id IS NULL AND {payments}",
+    ),
+]
+
+PAID_NOT_COMPLETED_SQL = """
+SELECT COUNT(*) AS n
+FROM payments p
+JOIN appointments a ON a.appointment_id = p.appointment_id
+WHERE a.status != 'completed' AND {appts}
+"""
+
+COMPLETED_UNPAID_SQL = """
+SELECT COUNT(*) AS n
+FROM appointments a
+LEFT JOIN payments p ON p.appointment_id = a.appointment_id
+WHERE a.status='completed' AND p.appointment_id IS NULL
+  AND datetime(a.appt_end) <= datetime('now','-1 day')
+  AND {appts}
+"""
+
+
+def scope_filters(op: str = None) -> dict:
+    """Template filters for a scope: None = whole DB, "= :d" one day, ">= :d" since"""
+    if op is None:
+        return {"appts": "1=1", "payments": "1=1", "patients": "1=1"}
+    return {
+        "appts": f"a.appt_date {op}",
+        "payments": f"p.paid_date {op}",
+        "patients": f"patient_id IN (SELECT a.patient_id FROM appointments a WHERE a.appt_date {op})",
+    }
+
+
+# the day-scoped form of every check (also EXPLAINed by scripts/check_query_plans.py)
+_DAY = scope_filters("= :d")
+DAY_CHECKS = [sql.format(**_DAY) for _, sql in ZERO_CHECKS] + [
+    sql.format(**_DAY)
+    for sql in (OVERLAP_ROWS_SQL, PAID_NOT_COMPLETED_SQL, COMPLETED_UNPAID_SQL)
+]
 
 
 def qdf(sql, params=None):
-    with engine.begin() as conn:
+    with read_engine.begin() as conn:
         return pd.read_sql(text(sql), conn, params=params or {})
 
 
@@ -20,132 +113,130 @@ def fail(name, detail, out):
     out["failures"].append({"check": name, "detail": detail})
 
 
-def warn(name, detail, out):
-    out["warnings"].append({"check": name, "detail": detail})
+def warn(name, detail, out, **extra):
+    out["warnings"].append({"check": name, "detail": detail, **extra})
 
 
-def check_sql_zero(name, sql, out):
-    df = qdf(sql)
+def check_sql_zero(name, sql, out, params=None):
+    df = qdf(sql, params)
     cnt = int(df.iloc[0, 0]) if not df.empty else 0
     if cnt != 0:
         fail(name, f"count={cnt}", out)
 
 
-def check_overlaps(out):
-    # overlapping appointments per physio per day
-    sql = """
-    SELECT physio_id, appt_start, appt_end, date(appt_start) AS d
-    FROM appointments
-    ORDER BY physio_id, appt_start
+def find_overlaps(df: pd.DataFrame) -> pd.DataFrame:
+    """Overlapping appointments per physio per day, fully vectorized.
+
+    `df` needs appointment_id, physio_id and start_s/end_s as UTC epoch
+    seconds (the day is start_s // 86400, the same UTC date as appt_date).
+    Within each (physio, day) sorted by start, a row overlaps when it starts
+    before the latest end seen so far; `overlaps_with` is the appointment
+    holding that end.
     """
-    df = qdf(sql)
+    cols = ["appointment_id", "overlaps_with", "physio_id", "d"]
+    if df[["start_s", "end_s"]].isna().to_numpy().any():
+        df = df.dropna(subset=["start_s", "end_s"])
     if df.empty:
-        return
-    df["appt_start"] = pd.to_datetime(df["appt_start"])
-    df["appt_end"] = pd.to_datetime(df["appt_end"])
-    bad = 0
-    for (pid, d), g in df.groupby(["physio_id", "d"]):
-        g = g.sort_values("appt_start")
-        prev_end = None
-        for _, r in g.iterrows():
-            if prev_end is not None and r["appt_start"] < prev_end:
-                bad += 1
-            prev_end = (
-                max(prev_end, r["appt_end"]) if prev_end is not None else r["appt_end"]
-            )
-    if bad:
+        return pd.DataFrame(columns=cols)
+
+    ids = df["appointment_id"].to_numpy(np.int64)
+    physio = df["physio_id"].to_numpy(np.int64)
+    start = df["start_s"].to_numpy(np.int64)
+    end = df["end_s"].to_numpy(np.int64)
+    day = start // 86_400
+
+    base = min(start.min(), end.min())
+    span = int(max(start.max(), end.max()) - base) + 1
+    day0 = day.min()
+    group = pd.factorize(physio)[0].astype(np.int64) * (day.max() - day0 + 1) + (day - day0)
+    if (int(group.max()) + 1) * span < 2**62:
+        # one int64 sort key (group, start) is much cheaper than a lexsort
+        order = np.argsort(group * span + (start - base))
+    else:
+        order = np.lexsort((start, group))
+    group, start, end = group[order], start[order], end[order]
+
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = group[1:] != group[:-1]
+    gid = np.cumsum(first) - 1
+
+    # lift every group above the previous one so a single running max never
+    # leaks across group boundaries
+    offset = gid * span
+    s = start - base + offset
+    e = end - base + offset
+
+    run_max = np.maximum.accumulate(e)
+    idx = np.arange(len(e))
+    holder = np.maximum.accumulate(np.where(e == run_max, idx, 0))
+
+    bad = np.flatnonzero(~first[1:] & (s[1:] < run_max[:-1])) + 1
+    rows = order[bad]
+    # format each distinct day once, not once per flagged row
+    days, inv = np.unique(day[rows], return_inverse=True)
+    labels = pd.to_datetime(days * 86_400, unit="s").strftime("%Y-%m-%d").to_numpy()
+    return pd.DataFrame(
+        {
+            "appointment_id": ids[rows],
+            "overlaps_with": ids[order[holder[bad - 1]]],
+            "physio_id": physio[rows],
+            "d": labels[inv],
+        },
+        columns=cols,
+    )
+
+
+def check_overlaps(out, filters=None, params=None):
+    # overlapping appointments per physio per day
+    df = qdf(OVERLAP_ROWS_SQL.format(**(filters or scope_filters())), params)
+    pairs = find_overlaps(df)
+    if not pairs.empty:
         warn(
             "appt_overlaps",
-            f"detected {bad} overlaps (investigate schedule rules)",
+            f"detected {len(pairs)} overlaps (investigate schedule rules)",
             out,
+            pairs=pairs[["appointment_id", "overlaps_with"]].head(50).values.tolist(),
         )
+    return pairs
 
 
-def check_payments_vs_status(out):
+def check_payments_vs_status(out, filters=None, params=None):
+    filters = filters or scope_filters()
     # payment exists for canceled or no_show (should be zero due to trigger, but verify)
-    sql = """
-    SELECT COUNT(*) AS n
-    FROM payments p
-    JOIN appointments a ON a.appointment_id = p.appointment_id
-    WHERE a.status != 'completed'
-    """
-    df = qdf(sql)
+    df = qdf(PAID_NOT_COMPLETED_SQL.format(**filters), params)
     n = int(df.loc[0, "n"])
     if n:
         fail("payment_for_non_completed", f"{n} rows", out)
 
     # completed without payment within 1 day after end (warning, not fail)
-    sql2 = """
-    SELECT COUNT(*) AS n
-    FROM appointments a
-    LEFT JOIN payments p ON p.appointment_id = a.appointment_id
-    WHERE a.status='completed' AND p.appointment_id IS NULL
-      AND datetime(a.appt_end) <= datetime('now','-1 day')
-    """
-    df2 = qdf(sql2)
+    df2 = qdf(COMPLETED_UNPAID_SQL.format(**filters), params)
     n2 = int(df2.loc[0, "n"])
     if n2:
         warn("completed_without_payment", f"{n2} rows older than 1 day", out)
 
 
-def run():
-    out = {"timestamp": datetime.utcnow().isoformat(), "failures": [], "warnings": []}
-
-    # basic integrity
-    check_sql_zero(
-        "null_patient_names",
-        "SELECT COUNT(*) FROM patients WHERE first_name IS NULL OR last_name IS NULL",
-        out,
-    )
-    check_sql_zero(
-        "bad_consent_values",
-        "SELECT COUNT(*) FROM patients WHERE consent_form_received NOT IN (0,1)",
-        out,
-    )
-    check_sql_zero(
-        "invalid_status_values",
-        "SELECT COUNT(*) FROM appointments WHERE status NOT IN ('booked','completed','canceled','no_show')",
-        out,
-    )
-    check_sql_zero(
-        "end_before_start",
-        "SELECT COUNT(*) FROM appointments WHERE strftime('%s', appt_end) <= strftime('%s', appt_start)",
-        out,
-    )
-    check_sql_zero(
-        "booked_after_start",
-        "SELECT COUNT(*) FROM appointments WHERE strftime('%s', booked_at) > strftime('%s', appt_start)",
-        out,
-    )
+def run(day: str = None, since: str = None):
+    """Validate the whole DB, or only one day / everything from `since` on"""
+    if day:
+        scope, filters, params = f"day={day}", scope_filters("= :d"), {"d": day}
+    elif since:
+        scope, filters, params = f"since={since}", scope_filters(">= :d"), {"d": since}
+    else:
+        scope, filters, params = "full", scope_filters(), {}
+    out = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "scope": scope,
+        "failures": [],
+        "warnings": [],
+    }
 
-    # referential
-    check_sql_zero(
-        "orphans_in_appointments_patients",
-        "SELECT COUNT(*) FROM appointments a LEFT JOIN patients p ON p.patient_id=a.patient_id WHERE p.patient_id IS NULL",
-        out,
-    )
-    check_sql_zero(
-        "orphans_in_appointments_physios",
-        "SELECT COUNT(*) FROM appointments a LEFT JOIN physios ph ON ph.physio_id=a.physio_id WHERE ph.physio_id IS NULL",
-        out,
-    )
-    check_sql_zero(
-        "orphans_in_payments",
-        "SELECT COUNT(*) FROM payments p LEFT JOIN appointments a ON a.appointment_id=p.appointment_id WHERE a.appointment_id IS NULL",
-        out,
-    )
+    # basic integrity + referential
+    for name, sql in ZERO_CHECKS:
+        check_sql_zero(name, sql.format(**filters), out, params)
 
     # phone and consent for tomorrow’s list
     tomorrow = (datetime.now() + timedelta(days=1)).date().isoformat()
-    sql_flags = """
-    SELECT
-      SUM(CASE WHEN p.phone IS NULL OR LENGTH(TRIM(p.phone)) < 6 THEN 1 ELSE 0 END) AS missing_phone,
-      SUM(CASE WHEN p.consent_form_received = 0 THEN 1 ELSE 0 END) AS missing_consent
-    FROM appointments a
-    JOIN patients p ON p.patient_id = a.patient_id
-    WHERE date(a.appt_start) = :d
-    """
-    df_flags = qdf(sql_flags, {"d": tomorrow})
+    df_flags = qdf(TOMORROW_FLAGS_SQL, {"d": tomorrow})
     if not df_flags.empty:
         mp = int(df_flags.loc[0, "missing_phone"] or 0)
         mc = int(df_flags.loc[0, "missing_consent"] or 0)
@@ -157,8 +248,8 @@ def run():
             )
 
     # overlaps and payments sanity
-    check_overlaps(out)
-    check_payments_vs_status(out)
+    check_overlaps(out, filters, params)
+    check_payments_vs_status(out, filters, params)
 
     # write report
     rpt_dir = Path("artifacts/validation_reports")
@@ -175,4 +266,9 @@ def run():
 
 
 if __name__ == "__main__":
-    sys.exit(run())
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--day", help="only check rows on this YYYY-MM-DD (refresh gate)")
+    group.add_argument("--since", help="only check rows on or after this YYYY-MM-DD")
+    args = parser.parse_args()
+    sys.exit(run(day=args.day, since=args.since))
@@ -0,0 +1,147 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from common.validate_data import find_overlaps
+
+# The validate_data rules, applied to a parsed daily drop before refresh_daily
+# opens its write transaction. Rejected rows are dropped from the frames and
+# written to data/quarantine/<day>/ with the rule they broke.
+
+STATUSES = ("booked", "completed", "canceled", "no_show")
+
+KNOWN_IDS_SQL = {
+    "patients": "SELECT patient_id FROM patients",
+    "physios": "SELECT physio_id FROM physios",
+    "appointments": "SELECT appointment_id FROM appointments",
+}
+
+_EPOCH = pd.Timestamp(0, tz="UTC")
+
+
+def known_ids(conn) -> dict:
+    """{table: Index of primary keys}; read once and reused for every day"""
+    return {
+        table: pd.Index(pd.read_sql(text(sql), conn).iloc[:, 0].to_numpy(np.int64))
+        for table, sql in KNOWN_IDS_SQL.items()
+    }
+
+
+def remember(ids: dict, table: str, values) -> None:
+    """Add keys written by a refresh so later days in a backfill can reference them"""
+    ids[table] = ids[table].append(pd.Index(np.asarray(values, dtype=np.int64))).unique()
+
+
+def forget(ids: dict, table: str, values) -> None:
+    """Drop keys a refresh is about to delete, so rows pointing at them are held"""
+    ids[table] = ids[table].difference(pd.Index(np.asarray(values, dtype=np.int64)))
+
+
+def _in(index: pd.Index, values: pd.Series) -> np.ndarray:
+    # get_indexer reuses the index's hash table, so repeated days stay cheap
+    return index.get_indexer(values.fillna(-1).to_numpy(np.int64)) >= 0
+
+
+def _ts(s: pd.Series) -> pd.Series:
+    return pd.to_datetime(s, utc=True, errors="coerce")
+
+
+def _first_rule(index, rules: list) -> pd.Series:
+    """Name of the first rule each row breaks ("" when it passes all of them)"""
+    names = [name for name, _ in rules]
+    masks = [np.asarray(mask, dtype=bool) for _, mask in rules]
+    return pd.Series(np.select(masks, names, default=""), index=index)
+
+
+def check_appointments(appts: pd.DataFrame, ids: dict):
+    """(reason per row, overlap pairs among the rows that pass)"""
+    start, end, booked = _ts(appts["appt_start"]), _ts(appts["appt_end"]), _ts(appts["booked_at"])
+    rules = [
+        ("missing_values", appts.isna().any(axis=1)),
+        ("bad_timestamp", start.isna() | end.isna() | booked.isna()),
+        ("invalid_status", ~appts["status"].isin(STATUSES)),
+        ("end_before_start", end <= start),
+        ("booked_after_start", booked > start),
+        ("unknown_patient", ~_in(ids["patients"], appts["patient_id"])),
+        ("unknown_physio", ~_in(ids["physios"], appts["physio_id"])),
+    ]
+    reason = _first_rule(appts.index, rules)
+
+    # overlaps are reported but kept, the same severity the DB audit gives them
+    ok = (reason == "").to_numpy()
+    pairs = find_overlaps(
+        pd.DataFrame(
+            {
+                "appointment_id": appts["appointment_id"].to_numpy()[ok],
+                "physio_id": appts["physio_id"].to_numpy()[ok],
+                "start_s": ((start - _EPOCH) // pd.Timedelta(seconds=1)).to_numpy()[ok],
+                "end_s": ((end - _EPOCH) // pd.Timedelta(seconds=1)).to_numpy()[ok],
+            }
+        )
+    )
+    return reason, pairs
+
+
+def check_payments(pays: pd.DataFrame, appts: pd.DataFrame, appt_reason: pd.Series, ids: dict):
+    """Reason per payment row; `appts` is the same drop with its reasons"""
+    drop = pd.Index(appts["appointment_id"].fillna(-1).to_numpy(np.int64))
+    pos = drop.get_indexer(pays["appointment_id"].fillna(-1).to_numpy(np.int64))
+    in_drop = pos >= 0
+    # a trailing sentinel makes pos == -1 (not in the drop) read as "no status"
+    status = np.append(appts["status"].fillna("").to_numpy(object), "")[pos]
+    rejected = np.append((appt_reason != "").to_numpy(), False)[pos]
+
+    rules = [
+        ("missing_values", pays.isna().any(axis=1)),
+        ("bad_timestamp", _ts(pays["paid_at"]).isna()),
+        ("duplicate_payment_id", pays["payment_id"].duplicated()),
+        ("unknown_appointment", ~in_drop & ~_in(ids["appointments"], pays["appointment_id"])),
+        ("appointment_rejected", rejected),
+        # only decidable for appointments in this drop; the DB audit covers the rest
+        ("payment_for_non_completed", in_drop & (status != "completed")),
+    ]
+    return _first_rule(pays.index, rules)
+
+
+def validate_day(appts: pd.DataFrame, pays: pd.DataFrame, ids: dict):
+    """Split one drop into rows safe to write and rows to quarantine.
+
+    Returns (appts_ok, pays_ok, report) where report holds per-rule counts
+    ("rejected", "warnings") and the rejected frames with a `reason` column.
+    """
+    appt_reason, pairs = check_appointments(appts, ids)
+    pay_reason = check_payments(pays, appts, appt_reason, ids)
+
+    report = {"rejected": {}, "warnings": {}, "quarantine": {}}
+    for table, df, reason in (
+        ("appointments", appts, appt_reason),
+        ("payments", pays, pay_reason),
+    ):
+        bad = (reason != "").to_numpy()
+        if bad.any():
+            report["quarantine"][table] = df[bad].assign(reason=reason[bad])
+            for rule, n in reason[bad].value_counts().items():
+                report["rejected"][rule] = report["rejected"].get(rule, 0) + int(n)
+    if not pairs.empty:
+        report["warnings"]["appt_overlaps"] = len(pairs)
+
+    return (
+        appts[(appt_reason == "").to_numpy()],
+        pays[(pay_reason == "").to_numpy()],
+        report,
+    )
+
+
+def quarantine(day: str, report: dict, root: Path) -> Path:
+    """Write the rejected rows of a day under root/<day>/ (cleared when clean)"""
+    out = Path(root) / day
+    for old in out.glob("*.csv"):
+        old.unlink()
+    if not report["quarantine"]:
+        return None
+    out.mkdir(parents=True, exist_ok=True)
+    for table, df in report["quarantine"].items():
+        df.to_csv(out / f"{table}.csv", index=False)
+    return out
@@ -0,0 +1,82 @@
+"""Cancellation model: sklearn pipeline (model.joblib) vs forest.py (model_arrays).
+
+Reports the cold load time of each artifact (fresh interpreter, imports
+included), per-row latency at a few batch sizes, and the largest difference
+between the two sets of probabilities.
+
+    python scripts/bench_forest.py --sizes 1 100 10000
+
+Needs a loaded DB and a trained model (train.py writes both artifacts).
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parents[1] / "03_cancellation_model"))
+
+import forest
+import numpy as np
+from features import build_training_frame
+from joblib import load
+
+model_dir = Path(__file__).resolve().parents[1] / "03_cancellation_model"
+
+LOAD_SNIPPETS = {
+    "joblib": "from joblib import load; load({path!r})",
+    "arrays": "import sys; sys.path.insert(0, {dir!r}); import forest; forest.load({version!r})",
+}
+
+
+def cold_load(kind: str, path: Path, repeat: int) -> float:
+    """Best wall time of a fresh interpreter loading the model, minus bare startup"""
+    code = LOAD_SNIPPETS[kind].format(path=str(path), dir=str(model_dir), version=path.name)
+
+    def best(src):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable, "-c", src], check=True)
+            times.append(time.perf_counter() - t0)
+        return min(times)
+
+    return best(code) - best("pass")
+
+
+def per_row_us(fn, X, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(X)
+        times.append(time.perf_counter() - t0)
+    return np.median(times) / len(X) * 1e6
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10_000])
+    p.add_argument("--repeat", type=int, default=5)
+    a = p.parse_args()
+
+    joblib_file, arrays_dir = model_dir / "model.joblib", forest.ARRAYS_DIR / forest.current()
+    for kind, path in (("joblib", joblib_file), ("arrays", arrays_dir)):
+        files = [path] if path.is_file() else list(path.iterdir())
+        size = sum(f.stat().st_size for f in files) / 1e6
+        print(f"load {kind:>6}: {cold_load(kind, path, a.repeat) * 1000:7.1f}ms  ({size:.1f} MB)")
+
+    pipe, model = load(joblib_file), forest.load(arrays_dir.name)
+    df, feat_cols = build_training_frame()
+    X = df[feat_cols].sample(max(a.sizes), replace=True, random_state=0)
+
+    diff = np.abs(pipe.predict_proba(X) - forest.predict_proba(model, X)).max()
+    print(f"max |p_sklearn - p_arrays| over {len(X):,} rows: {diff:.2e}")
+
+    print(f"{'batch':>8} {'sklearn us/row':>15} {'arrays us/row':>14}")
+    for n in a.sizes:
+        Xn = X.iloc[:n]
+        skl = per_row_us(pipe.predict_proba, Xn, a.repeat)
+        arr = per_row_us(lambda x: forest.predict_proba(model, x), Xn, a.repeat)
+        print(f"{n:>8,} {skl:>15.1f} {arr:>14.1f}")
@@ -0,0 +1,76 @@
+"""Schedule-overlap check: the old groupby/iterrows loop vs find_overlaps.
+
+python scripts/bench_overlaps.py --sizes 10000 100000 1000000 --loop-max 100000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pandas as pd
+
+from common.validate_data import find_overlaps
+
+
+def synthetic(n: int, seed: int = 0) -> pd.DataFrame:
+    """n appointments over 8 physios, 8:00-18:00 in 15 minute slots"""
+    rng = np.random.default_rng(seed)
+    days = max(1, n // 200)
+    day = rng.integers(0, days, n)
+    start = 1_700_000_000 + day * 86_400 + 8 * 3600 + rng.integers(0, 40, n) * 900
+    end = start + rng.choice([1800, 2700, 3600], n)
+    return pd.DataFrame(
+        {
+            "appointment_id": np.arange(1, n + 1),
+            "physio_id": rng.integers(1, 9, n),
+            "start_s": start,
+            "end_s": end,
+        }
+    )
+
+
+def legacy_count(df: pd.DataFrame) -> int:
+    """The loop check_overlaps used before (per group, per row)"""
+    df = df.assign(
+        d=df["start_s"] // 86_400,
+        appt_start=pd.to_datetime(df["start_s"], unit="s"),
+        appt_end=pd.to_datetime(df["end_s"], unit="s"),
+    ).sort_values(["physio_id", "appt_start"])
+    bad = 0
+    for _, g in df.groupby(["physio_id", "d"]):
+        g = g.sort_values("appt_start")
+        prev_end = None
+        for _, r in g.iterrows():
+            if prev_end is not None and r["appt_start"] < prev_end:
+                bad += 1
+            prev_end = max(prev_end, r["appt_end"]) if prev_end is not None else r["appt_end"]
+    return bad
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    p.add_argument("--loop-max", type=int, default=100_000, help="skip the loop above this")
+    a = p.parse_args()
+
+    print(f"{'rows':>10} {'loop':>10} {'vectorized':>11} {'speedup':>8} {'overlaps':>9}")
+    for n in a.sizes:
+        df = synthetic(n)
+        pairs, t_vec = timed(find_overlaps, df)
+        if n <= a.loop_max:
+            bad, t_loop = timed(legacy_count, df)
+            assert bad == len(pairs), (bad, len(pairs))
+            loop_s, speed = f"{t_loop:9.2f}s", f"{t_loop / t_vec:7.0f}x"
+        else:
+            loop_s, speed = f"{'-':>10}", f"{'-':>8}"
+        print(f"{n:>10,} {loop_s} {t_vec:10.3f}s {speed} {len(pairs):>9,}")
@@ -0,0 +1,134 @@
+"""Priority scoring: the old row-wise apply() vs build_priorities.prioritize.
+
+Both start from the same merged frame (appointments joined with new-patient
+flags, 90-day no-show rates and model scores, some missing) and must produce
+identical output.
+
+    python scripts/bench_priorities.py --sizes 10000 100000 1000000 --legacy-max 1000000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parents[1] / "02_reception_automation"))
+
+import numpy as np
+import pandas as pd
+from build_priorities import prioritize
+
+
+def synthetic(n: int, seed: int = 0) -> pd.DataFrame:
+    """n merged appointment rows over September, 8:00-18:00, a third unscored
+
+    One UTC offset throughout: the old code could not parse mixed offsets.
+    """
+    rng = np.random.default_rng(seed)
+    start = (
+        pd.Timestamp("2025-09-01", tz="Europe/Berlin")
+        + pd.to_timedelta(rng.integers(0, 30, n), unit="D")
+        + pd.to_timedelta(8 * 60 + rng.integers(0, 40, n) * 15, unit="m")
+    )
+    iso = pd.Series(start).map(pd.Timestamp.isoformat)
+    model = rng.random(n)
+    model[rng.random(n) < 0.33] = np.nan
+    return pd.DataFrame(
+        {
+            "appointment_id": np.arange(1, n + 1),
+            "patient_id": rng.integers(1, n // 5 + 2, n),
+            "physio_id": rng.integers(1, 9, n),
+            "appt_start": iso,
+            "appt_end": iso,
+            "booked_at": iso,
+            "status": "booked",
+            "price_estimate": 75.0,
+            "first_name": "Pat",
+            "last_name": rng.choice(["Smith", None], n, p=[0.95, 0.05]),
+            "phone": rng.choice(["+49-170-1234567", "", None], n, p=[0.9, 0.05, 0.05]),
+            "consent_form_received": rng.choice([1, 0], n, p=[0.8, 0.2]),
+            "physio_name": rng.choice(["Marta K", "Jonas B", "Lea S"], n),
+            "is_new_patient": rng.random(n) < 0.2,
+            "noshow_rate_90d": np.where(rng.random(n) < 0.5, 0.0, rng.random(n)),
+            "risk_score": model,
+        }
+    )
+
+
+def legacy(appts: pd.DataFrame) -> pd.DataFrame:
+    """The per-row code build() ran before"""
+    appts = appts.copy()
+    appts["patient_name"] = appts["first_name"].fillna("") + " " + appts["last_name"].fillna("")
+    appts["appt_dt"] = pd.to_datetime(appts["appt_start"])
+    appts["missing_phone"] = appts["phone"].astype(str).str.len().fillna(0) < 6
+    appts["missing_consent"] = appts["consent_form_received"].fillna(0).astype(int) == 0
+
+    def heuristic(row, patient_rate):
+        score = 100.0 * float(patient_rate)
+        if row["is_new_patient"]:
+            score += 15.0
+        hour = row["appt_dt"].hour
+        if hour < 10 or hour >= 17:
+            score += 10.0
+        if row["appt_dt"].weekday() == 0:
+            score += 5.0
+        return max(0.0, min(score, 100.0)) / 100.0
+
+    def bucket(x):
+        return "high" if x >= 0.7 else "medium" if x >= 0.4 else "low"
+
+    def risk_row(r):
+        if pd.notna(r.get("risk_score")):
+            return float(r["risk_score"])
+        return heuristic(r, float(r["noshow_rate_90d"]))
+
+    appts["risk_score"] = appts.apply(risk_row, axis=1)
+    appts["risk_bucket"] = appts["risk_score"].apply(bucket)
+    appts["priority_score"] = (
+        100 * appts["is_new_patient"].astype(int)
+        + 80 * appts["risk_score"].astype(float)
+        + 40 * appts["missing_phone"].astype(int)
+        + 30 * appts["missing_consent"].astype(int)
+        + 10 * ((appts["appt_dt"].dt.hour < 10) | (appts["appt_dt"].dt.hour >= 17)).astype(int)
+    )
+
+    def reasons(r):
+        parts = []
+        if r["is_new_patient"]:
+            parts.append("new patient")
+        if r["missing_phone"]:
+            parts.append("missing phone")
+        if r["missing_consent"]:
+            parts.append("missing consent")
+        parts.append(f"risk {r['risk_bucket']}")
+        return ", ".join(parts)
+
+    appts["priority_reason"] = appts.apply(reasons, axis=1)
+    cols = prioritize(appts.head(0)).columns
+    return appts[cols].sort_values("priority_score", ascending=False)
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    p.add_argument("--legacy-max", type=int, default=100_000, help="skip apply() above this")
+    a = p.parse_args()
+
+    print(f"{'rows':>10} {'apply':>10} {'vectorized':>11} {'speedup':>8}")
+    for n in a.sizes:
+        df = synthetic(n)
+        new, t_vec = timed(prioritize, df)
+        if n <= a.legacy_max:
+            old, t_old = timed(legacy, df)
+            assert old.to_csv(index=False) == new.to_csv(index=False), n
+            old_s, speed = f"{t_old:9.2f}s", f"{t_old / t_vec:7.0f}x"
+        else:
+            old_s, speed = f"{'-':>10}", f"{'-':>8}"
+        print(f"{n:>10,} {old_s} {t_vec:10.3f}s {speed}")
@@ -0,0 +1,183 @@
+"""Dashboard read latency while refresh_daily-style writes are running.
+
+Compares a bare create_engine() (rollback journal, default pragmas) with the
+tuned writer/read-only engines from common/db.py on a synthetic database.
+
+    python scripts/bench_read_latency.py --days 365 --per-day 400 --reads 300
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from common.db import make_engine
+from common.rollups import (
+    KPI_DAY_SQL,
+    TREND_SQL,
+    UTIL_DAY_SQL,
+    rebuild_rollups,
+    refresh_rollups,
+)
+
+root = Path(__file__).resolve().parents[1]
+
+SCHEMA = root / "01_kpi_dashboard" / "schema.sql"
+STATUSES = ["completed", "canceled", "no_show"]
+
+INSERT_APPT = text(
+    "INSERT INTO appointments (appointment_id, patient_id, physio_id, appt_start, "
+    "appt_end, booked_at, status, price_estimate) "
+    "VALUES (:appointment_id, :patient_id, :physio_id, :appt_start, :appt_end, "
+    ":booked_at, :status, :price_estimate)"
+)
+INSERT_PAY = text(
+    "INSERT INTO payments (payment_id, appointment_id, amount, paid_at, method) "
+    "VALUES (:payment_id, :appointment_id, :amount, :paid_at, 'card')"
+)
+
+
+def _day_rows(d: date, per_day: int, first_id: int, rng: random.Random):
+    appts, pays = [], []
+    for i in range(per_day):
+        aid = first_id + i
+        hour = 8 + i % 10
+        start = f"{d.isoformat()}T{hour:02d}:00:00+00:00"
+        end = f"{d.isoformat()}T{hour:02d}:45:00+00:00"
+        status = rng.choice(STATUSES)
+        appts.append(
+            {
+                "appointment_id": aid,
+                "patient_id": rng.randint(1, 2000),
+                "physio_id": 1 + i % 8,
+                "appt_start": start,
+                "appt_end": end,
+                "booked_at": f"{(d - timedelta(days=7)).isoformat()}T09:00:00+00:00",
+                "status": status,
+                "price_estimate": 60.0,
+            }
+        )
+        if status == "completed":
+            pays.append({"payment_id": aid, "appointment_id": aid, "amount": 60.0, "paid_at": end})
+    return appts, pays
+
+
+def _seed(writer, days: int, per_day: int):
+    rng = random.Random(42)
+    with writer.begin() as conn:
+        for stmt in SCHEMA.read_text(encoding="utf-8").split(";"):
+            if stmt.strip():
+                conn.execute(text(stmt))
+        conn.execute(
+            text("INSERT INTO physios (physio_id, full_name) VALUES (:i, :n)"),
+            [{"i": i, "n": f"Physio {i}"} for i in range(1, 9)],
+        )
+        conn.execute(
+            text(
+                "INSERT INTO patients (patient_id, first_name, last_name, created_at) "
+                "VALUES (:i, 'Pat', 'Smith', '2024-01-01')"
+            ),
+            [{"i": i} for i in range(1, 2001)],
+        )
+        today = date.today()
+        for k in range(days):
+            d = today - timedelta(days=days - 1 - k)
+            appts, pays = _day_rows(d, per_day, 1 + k * per_day, rng)
+            conn.execute(INSERT_APPT, appts)
+            if pays:
+                conn.execute(INSERT_PAY, pays)
+        rebuild_rollups(conn)
+
+
+def _refresh_loop(writer, days: int, per_day: int, stop: threading.Event, done: list):
+    """Replay refresh_for_day for the latest day until told to stop"""
+    rng = random.Random(7)
+    d = date.today()
+    first_id = 1 + (days - 1) * per_day
+    while not stop.is_set():
+        appts, pays = _day_rows(d, per_day, first_id, rng)
+        with writer.begin() as conn:
+            conn.execute(
+                text(
+                    "DELETE FROM payments WHERE appointment_id IN "
+                    "(SELECT appointment_id FROM appointments WHERE appt_date=:d)"
+                ),
+                {"d": d.isoformat()},
+            )
+            conn.execute(text("DELETE FROM appointments WHERE appt_date=:d"), {"d": d.isoformat()})
+            conn.execute(INSERT_APPT, appts)
+            if pays:
+                conn.execute(INSERT_PAY, pays)
+            refresh_rollups(conn, [d.isoformat()])
+        done.append(1)
+
+
+def _read_dashboard(reader, day: str):
+    with reader.begin() as conn:
+        conn.execute(text(KPI_DAY_SQL), {"d": day}).all()
+        conn.execute(text(UTIL_DAY_SQL), {"d": day}).all()
+        conn.execute(text(TREND_SQL)).all()
+
+
+def run_mode(name: str, tuned: bool, days: int, per_day: int, reads: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        if tuned:
+            writer = make_engine(url)
+            _seed(writer, days, per_day)
+            reader = make_engine(url, read_only=True)
+        else:
+            writer = create_engine(url, future=True)
+            _seed(writer, days, per_day)
+            reader = writer
+
+        stop, done = threading.Event(), []
+        t = threading.Thread(target=_refresh_loop, args=(writer, days, per_day, stop, done))
+        t.start()
+        time.sleep(0.2)  # let the writer get going
+
+        rng = random.Random(1)
+        lat, errors = [], 0
+        for _ in range(reads):
+            day = (date.today() - timedelta(days=rng.randint(0, 13))).isoformat()
+            t0 = time.perf_counter()
+            try:
+                _read_dashboard(reader, day)
+            except OperationalError:
+                errors += 1
+                continue
+            lat.append((time.perf_counter() - t0) * 1000)
+
+        stop.set()
+        t.join()
+        reader.dispose()
+        writer.dispose()
+
+    lat = np.array(lat) if lat else np.array([np.nan])
+    print(
+        f"{name:<8} p50={np.percentile(lat, 50):7.2f}ms  p95={np.percentile(lat, 95):7.2f}ms  "
+        f"p99={np.percentile(lat, 99):7.2f}ms  max={lat.max():7.2f}ms  "
+        f"errors={errors}  refreshes={len(done)}"
+    )
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--days", type=int, default=365)
+    p.add_argument("--per-day", type=int, default=400)
+    p.add_argument("--reads", type=int, default=300)
+    a = p.parse_args()
+
+    print(f"{a.days} days x {a.per_day} appointments, {a.reads} dashboard reads per mode")
+    run_mode("before", False, a.days, a.per_day, a.reads)
+    run_mode("after", True, a.days, a.per_day, a.reads)
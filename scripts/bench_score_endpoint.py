@@ -0,0 +1,103 @@
+"""POST /score latency and throughput against a running copy of the server.
+
+Starts the Flask app on a local port (threaded werkzeug server), then:
+  - single: N concurrent clients each posting one appointment at a time
+  - batch:  clients posting --batch-size appointments per request
+
+    python scripts/bench_score_endpoint.py --clients 8 --requests 400 --batch-size 100
+
+Needs a loaded DB (patient_history) and a trained 03_cancellation_model/model.joblib.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from werkzeug.serving import make_server
+
+from common.db import read_engine
+
+server = importlib.import_module("02_reception_automation.server")
+
+
+def _appointments(n: int):
+    with read_engine.begin() as conn:
+        pids = pd.read_sql(text("SELECT patient_id FROM patients"), conn)["patient_id"].tolist()
+    rng = random.Random(0)
+    day = date.today() + timedelta(days=1)
+    out = []
+    for i in range(n):
+        hour = rng.randint(8, 17)
+        out.append(
+            {
+                "appointment_id": 10_000_000 + i,
+                "patient_id": rng.choice(pids),
+                "appt_start": f"{day.isoformat()}T{hour:02d}:00:00+02:00",
+                "booked_at": f"{(day - timedelta(days=rng.randint(0, 30))).isoformat()}T09:00:00+02:00",
+                "price_estimate": rng.choice([60.0, 75.0, 90.0]),
+            }
+        )
+    return out
+
+
+def _post(url: str, payload) -> float:
+    body = json.dumps(payload).encode()
+    req = urllib.request.Request(url, body, {"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(req) as r:
+        r.read()
+    return time.perf_counter() - t0
+
+
+def run(url: str, payloads: list, clients: int):
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        lat = np.array(list(pool.map(lambda p: _post(url, p), payloads))) * 1000
+    return lat, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--clients", type=int, default=8)
+    p.add_argument("--requests", type=int, default=400)
+    p.add_argument("--batch-size", type=int, default=100)
+    p.add_argument("--port", type=int, default=8765)
+    a = p.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    srv = make_server("127.0.0.1", a.port, server.app, threaded=True)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{a.port}/score"
+
+    appts = _appointments(max(a.requests, a.batch_size))
+    _post(url, appts[0])  # load the model before timing
+
+    lat, secs = run(url, appts[: a.requests], a.clients)
+    print(
+        f"single  {a.clients} clients: p50={np.percentile(lat, 50):6.2f}ms  "
+        f"p99={np.percentile(lat, 99):6.2f}ms  {a.requests / secs:,.0f} req/s"
+    )
+
+    n_batches = max(1, a.requests // 10)
+    batches = [appts[: a.batch_size]] * n_batches
+    lat, secs = run(url, batches, a.clients)
+    print(
+        f"batch x{a.batch_size}: p50={np.percentile(lat, 50):6.2f}ms  "
+        f"p99={np.percentile(lat, 99):6.2f}ms  "
+        f"{n_batches * a.batch_size / secs:,.0f} appointments/s"
+    )
+    srv.shutdown()
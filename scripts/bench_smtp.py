@@ -0,0 +1,128 @@
+"""Reminder delivery throughput: one SMTP connection per message vs the pooled
+sender in smtp_delivery, against a local aiosmtpd relay.
+
+The relay can add per-message latency (a real one queues to disk before it
+answers 250) and refuse a share of messages with 451, to exercise retries.
+
+    pip install aiosmtpd
+    python scripts/bench_smtp.py --messages 2000 --pools 1 4 8 16 --latency-ms 20
+    python scripts/bench_smtp.py --messages 500 --pools 8 --fail-rate 0.1
+"""
+
+import argparse
+import asyncio
+import random
+import smtplib
+import socket
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parents[1] / "02_reception_automation"))
+
+import numpy as np
+import pandas as pd
+import smtp_delivery
+from send_reminders import render
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    sys.exit("bench_smtp needs the local relay: pip install aiosmtpd")
+
+DAY = "2025-09-05"
+
+
+class Relay:
+    """aiosmtpd handler: counts accepted messages, optionally slow and flaky"""
+
+    def __init__(self, latency_s: float, fail_rate: float):
+        self.latency_s = latency_s
+        self.fail_rate = fail_rate
+        self.accepted = 0
+        self.refused = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        if random.random() < self.fail_rate:
+            self.refused += 1
+            return "451 4.3.0 Try again later"
+        self.accepted += 1
+        return "250 OK"
+
+
+def synthetic(n: int) -> pd.DataFrame:
+    """n rendered reminders for one day"""
+    rng = np.random.default_rng(0)
+    rows = pd.DataFrame(
+        {
+            "appointment_id": np.arange(1, n + 1),
+            "patient_id": rng.integers(1, 5000, n),
+            "patient_name": [f"Pat{i} Smith{i}" for i in rng.integers(1, 5000, n)],
+            "physio_name": rng.choice(["Marta K", "Jonas B", "Lea S"], n),
+            "appt_start": f"{DAY}T09:00:00+02:00",
+        }
+    )
+    return render(rows)
+
+
+def one_per_message(msgs: pd.DataFrame, port: int) -> None:
+    """The naive sender: connect, send, quit for every reminder"""
+    for r in msgs.itertuples(index=False):
+        msg = smtp_delivery.build_message(r.content, f"<bench.{r.appointment_id}@example.local>")
+        with smtplib.SMTP("127.0.0.1", port) as conn:
+            conn.send_message(msg, to_addrs=[r.to])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--messages", type=int, default=1000)
+    p.add_argument("--pools", type=int, nargs="+", default=[1, 4, 8, 16])
+    p.add_argument("--rate", type=float, default=0, help="messages/s limit, 0 = none")
+    p.add_argument("--latency-ms", type=float, default=20, help="relay delay per message")
+    p.add_argument("--fail-rate", type=float, default=0.0, help="share of 451 replies")
+    p.add_argument("--baseline-max", type=int, default=500, help="skip one-per-message above this")
+    a = p.parse_args()
+
+    relay = Relay(a.latency_ms / 1000, a.fail_rate)
+    port = free_port()
+    controller = Controller(relay, hostname="127.0.0.1", port=port)
+    controller.start()
+    smtp_delivery.BACKOFF_S = 0.05  # keep retry rounds short in the bench
+    try:
+        msgs = synthetic(a.messages)
+        print(
+            f"{len(msgs):,} messages, relay latency {a.latency_ms:g}ms, "
+            f"fail rate {a.fail_rate:g}, rate limit {a.rate or 'none'}"
+        )
+        print(f"{'sender':<22} {'secs':>7} {'msg/s':>8} {'sent':>6} {'failed':>6} {'retries':>7}")
+
+        if len(msgs) <= a.baseline_max and not a.fail_rate:
+            t0 = time.perf_counter()
+            one_per_message(msgs, port)
+            secs = time.perf_counter() - t0
+            print(
+                f"{'one conn per message':<22} {secs:>7.2f} {len(msgs) / secs:>8,.0f} {len(msgs):>6}"
+            )
+
+        for pool in a.pools:
+            relay.accepted = 0
+            t0 = time.perf_counter()
+            res = smtp_delivery.deliver(msgs, DAY, pool_size=pool, rate=a.rate, port=port)
+            secs = time.perf_counter() - t0
+            sent = int((res["status"] == "sent").sum())
+            assert relay.accepted == sent, (relay.accepted, sent)
+            print(
+                f"{f'pooled, {pool} conns':<22} {secs:>7.2f} {sent / secs:>8,.0f} {sent:>6} "
+                f"{len(res) - sent:>6} {int(res['attempts'].sum()) - len(res):>7}"
+            )
+    finally:
+        controller.stop()
@@ -0,0 +1,105 @@
+"""Resident memory per scoring worker: unpickled pipeline vs mmapped model_arrays.
+
+Starts --workers processes the way a pre-fork server would. Each one loads
+the model, scores a batch (so the pages it needs are touched) and waits
+until all of them are loaded before reading its own memory counters:
+
+  rss  resident set; shared page-cache pages count in every worker
+  pss  proportional share; shared pages are split between the workers
+  uss  private to the worker, what each additional worker really costs
+
+    python scripts/bench_worker_rss.py --workers 4
+
+Linux only (reads /proc/self/smaps_rollup). Needs a trained model with its
+model_arrays export (train.py writes both, `train.py --export-only` just the
+export); no database.
+"""
+
+import argparse
+import multiprocessing as mp
+import sys
+from pathlib import Path
+
+root = Path(__file__).resolve().parents[1]
+model_dir = root / "03_cancellation_model"
+
+
+def memory_mb() -> dict:
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def synthetic(n: int):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "days_since_booking": rng.integers(0, 30, n),
+            "hour": rng.integers(8, 18, n),
+            "weekday": rng.integers(0, 7, n).astype(np.int32),
+            "is_new_patient": rng.integers(0, 2, n),
+            "noshow_rate_prior": rng.random(n),
+            "price_estimate": rng.choice([60.0, 75.0, 90.0], n),
+            "is_rainy": rng.integers(0, 2, n),
+        }
+    )
+
+
+def worker(kind: str, rows: int, barrier, out):
+    sys.path.append(str(model_dir))
+    import numpy  # noqa: F401 imports are the same in both modes
+    import pandas  # noqa: F401
+
+    base = memory_mb()
+    if kind == "pipeline":
+        from joblib import load
+
+        predict_proba = load(model_dir / "model.joblib").predict_proba
+    else:
+        import forest
+
+        model = forest.load(forest.current())
+        predict_proba = lambda X: forest.predict_proba(model, X)  # noqa: E731
+    X = synthetic(rows)
+    predict_proba(X)
+    barrier.wait()
+    loaded = memory_mb()
+    out.put({k: loaded[k] - base[k] for k in loaded})
+    barrier.wait()
+
+
+def run(kind: str, workers: int, rows: int) -> list:
+    ctx = mp.get_context("spawn")
+    barrier, out = ctx.Barrier(workers), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(kind, rows, barrier, out)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return results
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--rows", type=int, default=100)
+    a = p.parse_args()
+
+    print(f"model memory per worker, {a.workers} workers (MB above a bare numpy+pandas process)")
+    print(f"{'model':>10} {'rss':>8} {'pss':>8} {'uss':>8}")
+    for kind in ("pipeline", "arrays"):
+        res = run(kind, a.workers, a.rows)
+        avg = {k: sum(r[k] for r in res) / len(res) for k in res[0]}
+        print(f"{kind:>10} {avg['rss']:8.1f} {avg['pss']:8.1f} {avg['uss']:8.1f}")
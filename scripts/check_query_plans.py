@@ -0,0 +1,142 @@
+"""EXPLAIN QUERY PLAN every day-scoped query and fail if any still scans a table.
+
+Run from the repo root:
+    python scripts/check_query_plans.py            # scratch DB built from schema.sql
+    python scripts/check_query_plans.py --db clinic.db
+"""
+
+import argparse
+import ast
+import importlib.util
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+SAMPLE_DAY = "2025-09-05"
+
+# (file, attribute) for every query that filters appointments/payments by day
+# (or by patient, for the per-patient history maintenance)
+DAY_QUERIES = [
+    ("common/rollups.py", "KPI_DAY_SQL"),
+    ("common/rollups.py", "UTIL_DAY_SQL"),
+    ("common/rollups.py", "TREND_SQL"),
+    ("common/rollups.py", "DAY_STATEMENTS"),
+    ("common/patient_history.py", "PATIENT_STATEMENTS"),
+    ("common/validate_data.py", "TOMORROW_FLAGS_SQL"),
+    ("common/validate_data.py", "DAY_CHECKS"),
+    ("01_kpi_dashboard/etl/refresh_daily.py", "DAY_APPOINTMENT_ROWS"),
+    ("01_kpi_dashboard/etl/refresh_daily.py", "DAY_APPOINTMENT_IDS"),
+    ("01_kpi_dashboard/etl/refresh_daily.py", "DAY_PAYMENT_ROWS"),
+    ("01_kpi_dashboard/etl/refresh_daily.py", "CURRENT_DATES"),
+    ("01_kpi_dashboard/etl/refresh_daily.py", "PAYMENT_DATES"),
+    ("03_cancellation_model/features.py", "RANGE_WITH_HISTORY_SQL"),
+    ("03_cancellation_model/features.py", "POSTED_HISTORY_SQL"),
+    ("02_reception_automation/build_priorities.py", "RANGE_APPOINTMENTS_SQL"),
+    ("02_reception_automation/build_priorities.py", "RANGE_PATIENT_STATS_SQL"),
+    ("02_reception_automation/build_priorities.py", "RANGE_SCORES_SQL"),
+    ("02_reception_automation/build_priorities.py", "BUILT_SQL"),
+    ("02_reception_automation/build_priorities.py", "DAY_PRIORITIES_SQL"),
+    ("02_reception_automation/send_reminders.py", "REMINDER_ROWS_SQL"),
+    ("02_reception_automation/smtp_delivery.py", "SENT_SQL"),
+    ("01_kpi_dashboard/app.py", "PRIORITY_SUMMARY_SQL"),
+    ("01_kpi_dashboard/app.py", "PRIORITY_TOP_SQL"),
+    ("scripts/report.py", "KPIS_SQL"),
+    ("scripts/report.py", "FLAGS_SQL"),
+    ("scripts/report.py", "RISK_COUNTS_SQL"),
+    ("scripts/report.py", "TOP_PRIORITIES_SQL"),
+]
+
+
+# modules that do real work on import (Streamlit renders the dashboard), so
+# their SQL constants are read from the source instead
+NO_IMPORT = {"01_kpi_dashboard/app.py"}
+
+
+class _Constants:
+    """Module-level string constants of a source file, read without running it"""
+
+    def __init__(self, path: Path):
+        for node in ast.parse(path.read_text(encoding="utf-8")).body:
+            if (
+                isinstance(node, ast.Assign)
+                and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name)
+                and isinstance(node.value, ast.Constant)
+                and isinstance(node.value.value, str)
+            ):
+                setattr(self, node.targets[0].id, node.value.value)
+
+
+def _load_module(relpath: str):
+    path = root / relpath
+    if relpath in NO_IMPORT:
+        return _Constants(path)
+    name = "_plan_check_" + re.sub(r"\W", "_", relpath)
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _collect():
+    mods = {}
+    for relpath, attr in DAY_QUERIES:
+        if relpath not in mods:
+            mods[relpath] = _load_module(relpath)
+        value = getattr(mods[relpath], attr)
+        sqls = value if isinstance(value, list) else [value]
+        for i, sql in enumerate(sqls):
+            label = f"{relpath}:{attr}" + (f"[{i}]" if len(sqls) > 1 else "")
+            yield label, sql
+
+
+def _to_sqlite(sql: str):
+    """Turn a SQLAlchemy text() query into something sqlite3 can EXPLAIN"""
+    sql = sql.strip().rstrip(";")
+    sql = re.sub(r"IN\s+:(\w+)", r"IN (:\1)", sql)  # expanding IN :days
+    params = {}
+    for name in re.findall(r"(?<!:):(\w+)", sql):
+        params[name] = SAMPLE_DAY
+    return sql, params
+
+
+def check(conn) -> int:
+    failures = 0
+    for label, sql in _collect():
+        stmt, params = _to_sqlite(sql)
+        plan = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + stmt, params)]
+        # "SCAN (subquery-N)" walks an already-filtered intermediate result, and
+        # "SCAN CONSTANT ROW" is a SELECT without FROM; neither reads a table
+        scans = [
+            s
+            for s in plan
+            if s.startswith("SCAN ") and not s.startswith(("SCAN (", "SCAN CONSTANT ROW"))
+        ]
+        mark = "FAIL" if scans else "ok"
+        print(f"[{mark}] {label}")
+        for step in plan:
+            print(f"       {step}")
+        failures += bool(scans)
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="SQLite file to check (default: scratch DB from schema.sql)")
+    args = parser.parse_args()
+
+    if args.db:
+        conn = sqlite3.connect(args.db)
+    else:
+        conn = sqlite3.connect(":memory:")
+        conn.executescript((root / "01_kpi_dashboard" / "schema.sql").read_text(encoding="utf-8"))
+
+    failures = check(conn)
+    if failures:
+        print(f"❌ {failures} day-scoped queries still scan a table")
+        sys.exit(1)
+    print("✅ All day-scoped queries are index-backed")
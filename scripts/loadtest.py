@@ -0,0 +1,143 @@
+"""Open-loop load test for the reception API.
+
+Sends requests at a fixed --rps (not "as fast as responses come back"), so a
+slow server shows up as growing latency instead of a politely lower rate.
+Latency is measured from each request's scheduled send time. Requests are
+spread over --paths by weight.
+
+    gunicorn -c 02_reception_automation/gunicorn.conf.py 02_reception_automation.wsgi:app
+    python scripts/loadtest.py --rps 200 --duration 30 --day 2025-09-05
+
+    # repeat with a different API_WORKERS / API_THREADS to size workers
+    python scripts/loadtest.py --rps 500 --paths "/priorities?day={day}:8" "/health:2" --revalidate
+
+--revalidate sends the last ETag back in If-None-Match, the way the
+reception screens poll; 304s count as successes.
+"""
+
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def parse_paths(specs: list, day: str) -> tuple:
+    """["/path:weight", ...] -> (paths, probabilities); weight defaults to 1"""
+    paths, weights = [], []
+    for spec in specs:
+        path, sep, weight = spec.rpartition(":")
+        if not sep or not weight.replace(".", "", 1).isdigit():
+            path, weight = spec, "1"
+        paths.append(path.format(day=day))
+        weights.append(float(weight))
+    w = np.asarray(weights)
+    return paths, w / w.sum()
+
+
+_etag_lock = threading.Lock()
+
+
+def request(base: str, path: str, timeout: float, etags: dict = None) -> int:
+    """HTTP status of one GET; `etags` (path -> last ETag) turns on revalidation"""
+    req = urllib.request.Request(base + path, headers={"Accept-Encoding": "gzip"})
+    if etags is not None and path in etags:
+        req.add_header("If-None-Match", etags[path])
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            r.read()
+            if etags is not None and r.headers.get("ETag"):
+                with _etag_lock:
+                    etags[path] = r.headers["ETag"]
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def run(
+    base: str,
+    paths: list,
+    probs,
+    rps: float,
+    duration: float,
+    concurrency: int,
+    timeout: float,
+    revalidate: bool,
+):
+    """[(path index, status, latency s)] for rps * duration scheduled requests"""
+    n = int(rps * duration)
+    which = np.random.default_rng(0).choice(len(paths), size=n, p=probs)
+    etags = {} if revalidate else None
+    results = [None] * n
+
+    def one(i: int, scheduled: float):
+        try:
+            status = request(base, paths[which[i]], timeout, etags)
+        except Exception:
+            status = 0  # connection error or timeout
+        results[i] = (which[i], status, time.perf_counter() - scheduled)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for i in range(n):
+            scheduled = t0 + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, i, scheduled)
+    return results, time.perf_counter() - t0
+
+
+def report(paths: list, results: list, elapsed: float) -> None:
+    idx = np.array([r[0] for r in results])
+    status = np.array([r[1] for r in results])
+    lat = np.array([r[2] for r in results]) * 1000
+    ok = ((status >= 200) & (status < 300)) | (status == 304)
+
+    print(f"{len(results):,} requests in {elapsed:.1f}s ({len(results) / elapsed:,.0f} req/s)")
+    print(
+        f"{'path':<40} {'n':>7} {'err%':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    )
+    for i, path in [(None, "all")] + list(enumerate(paths)):
+        m = np.ones(len(idx), dtype=bool) if i is None else idx == i
+        if not m.any():
+            continue
+        p50, p90, p99, pmax = np.percentile(lat[m], [50, 90, 99, 100])
+        err = 100 * (~ok[m]).mean()
+        print(
+            f"{path[:40]:<40} {m.sum():>7,} {err:>6.2f} "
+            f"{p50:>8.1f} {p90:>8.1f} {p99:>8.1f} {pmax:>8.1f}"
+        )
+    codes, counts = np.unique(status, return_counts=True)
+    summary = ", ".join(f"{c or 'conn error'}: {k:,}" for c, k in zip(codes, counts, strict=True))
+    print("status codes:", summary)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--url", default="http://127.0.0.1:8008")
+    p.add_argument("--rps", type=float, default=100)
+    p.add_argument("--duration", type=float, default=20, help="seconds")
+    p.add_argument(
+        "--paths",
+        nargs="+",
+        default=["/priorities?day={day}:9", "/health:1"],
+        help='"path:weight" entries; {day} is replaced with --day',
+    )
+    p.add_argument("--day", default="", help="YYYY-MM-DD for {day} (default: server's tomorrow)")
+    p.add_argument("--concurrency", type=int, default=64, help="max requests in flight")
+    p.add_argument("--timeout", type=float, default=10)
+    p.add_argument(
+        "--revalidate", action="store_true", help="send If-None-Match like polling screens"
+    )
+    a = p.parse_args()
+
+    paths, probs = parse_paths(a.paths, a.day)
+    request(a.url.rstrip("/"), "/health", a.timeout)  # fail fast if nothing is listening
+    results, elapsed = run(
+        a.url.rstrip("/"), paths, probs, a.rps, a.duration, a.concurrency, a.timeout, a.revalidate
+    )
+    report(paths, results, elapsed)
@@ -2,58 +2,77 @@ import json
 from pathlib import Path
 import pandas as pd
 from sqlalchemy import text
-from common.db import engine
+from common.db import read_engine
+
+
+KPIS_SQL = """
+SELECT day d,
+       bookings,
+       completed,
+       canceled,
+       no_show,
+       revenue_estimate est_rev,
+       revenue_paid paid_rev
+FROM daily_kpis WHERE day=:d
+"""
+
+FLAGS_SQL = """
+SELECT
+  SUM(CASE WHEN p.phone IS NULL OR LENGTH(TRIM(p.phone))<6 THEN 1 ELSE 0 END) AS missing_phone,
+  SUM(CASE WHEN p.consent_form_received=0 THEN 1 ELSE 0 END) AS missing_consent
+FROM appointments a JOIN patients p ON p.patient_id=a.patient_id
+WHERE a.appt_date=:d
+"""
+
+# bucket counts off the (day, risk_bucket) index; no rows when never built
+RISK_COUNTS_SQL = """
+SELECT p.risk_bucket, COUNT(p.risk_bucket) AS n
+FROM priority_builds b
+LEFT JOIN priorities p ON p.day = b.day
+WHERE b.day = :d
+GROUP BY p.risk_bucket
+ORDER BY n DESC
+"""
+
+TOP_PRIORITIES_SQL = """
+SELECT appointment_id, patient_name, risk_bucket, priority_score
+FROM priorities WHERE day = :d
+ORDER BY priority_score DESC, appointment_id
+LIMIT 5
+"""
 
 
 def kpis(day):
-    with engine.begin() as conn:
-        q = """
-        SELECT DATE(appt_start) d,
-               COUNT(*) bookings,
-               SUM(CASE WHEN status='completed' THEN 1 ELSE 0 END) completed,
-               SUM(CASE WHEN status='canceled' THEN 1 ELSE 0 END) canceled,
-               SUM(CASE WHEN status='no_show' THEN 1 ELSE 0 END) no_show,
-               SUM(price_estimate) est_rev
-        FROM appointments WHERE DATE(appt_start)=:d
-        """
-        row = conn.execute(text(q), {"d": day}).mappings().first()
-        p = """
-        SELECT COALESCE(SUM(amount),0) paid
-        FROM payments p JOIN appointments a ON a.appointment_id=p.appointment_id
-        WHERE DATE(a.appt_start)=:d
-        """
-        paid = conn.execute(text(p), {"d": day}).scalar() or 0
-    row = dict(row or {})
-    row["paid_rev"] = float(paid)
-    return row
+    with read_engine.begin() as conn:
+        row = conn.execute(text(KPIS_SQL), {"d": day}).mappings().first()
+    if row is None:
+        return {
+            "d": day,
+            "bookings": 0,
+            "completed": 0,
+            "canceled": 0,
+            "no_show": 0,
+            "est_rev": 0.0,
+            "paid_rev": 0.0,
+        }
+    return dict(row)
 
 
 def tomorrow_flags(day):
-    with engine.begin() as conn:
-        q = """
-        SELECT
-          SUM(CASE WHEN p.phone IS NULL OR LENGTH(TRIM(p.phone))<6 THEN 1 ELSE 0 END) AS missing_phone,
-          SUM(CASE WHEN p.consent_form_received=0 THEN 1 ELSE 0 END) AS missing_consent
-        FROM appointments a JOIN patients p ON p.patient_id=a.patient_id
-        WHERE DATE(a.appt_start)=:d
-        """
-        row = conn.execute(text(q), {"d": day}).mappings().first()
+    with read_engine.begin() as conn:
+        row = conn.execute(text(FLAGS_SQL), {"d": day}).mappings().first()
     return dict(row or {})
 
 
 def risk_breakdown(day):
-    pri = Path("02_reception_automation") / f"priorities_{day}.csv"
-    if not pri.exists():
-        return {}
-    df = pd.read_csv(pri)
-    if "risk_bucket" not in df.columns:
-        return {"note": "no risk_bucket column in priorities file"}
-    brk = df["risk_bucket"].value_counts().to_dict()
+    with read_engine.begin() as conn:
+        counts = conn.execute(text(RISK_COUNTS_SQL), {"d": day}).mappings().all()
+        if not counts:
+            return {}
+        top = pd.read_sql(text(TOP_PRIORITIES_SQL), conn, params={"d": day})
     return {
-        "risk_counts": brk,
-        "top5": df[["appointment_id", "patient_name", "risk_bucket", "priority_score"]]
-        .head(5)
-        .to_dict(orient="records"),
+        "risk_counts": {r["risk_bucket"]: r["n"] for r in counts if r["n"]},
+        "top5": top.to_dict(orient="records"),
     }
 
 
@@ -0,0 +1,58 @@
+import importlib.util
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parents[1]
+
+# common.db builds its engines at import, so point it at a throwaway file first
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'test.db'}"
+sys.path.insert(0, str(REPO))
+
+from sqlalchemy import text  # noqa: E402
+
+from common.db import engine, run_sql_file  # noqa: E402
+
+run_sql_file(str(REPO / "01_kpi_dashboard" / "schema.sql"))
+
+
+def load_module(relpath: str):
+    """Import a repo file by path (the top-level folders are not packages)"""
+    path = REPO / relpath
+    sys.path.insert(0, str(path.parent))
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    mod = importlib.util.module_from_spec(spec)
+    # registered so worker processes can unpickle its functions
+    sys.modules[path.stem] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+@pytest.fixture
+def db():
+    """The writer engine on an emptied database with one patient and one physio"""
+    with engine.begin() as conn:
+        tables = [
+            r[0]
+            for r in conn.execute(
+                text(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+                )
+            )
+        ]
+        # children before the rows they reference
+        order = {"payments": 0, "appointments": 1}
+        for t in sorted(tables, key=lambda t: order.get(t, 2)):
+            conn.execute(text(f"DELETE FROM {t}"))
+        conn.execute(
+            text(
+                "INSERT INTO patients(patient_id, first_name, last_name, phone, "
+                "consent_form_received, created_at) VALUES (1, 'Ana', 'Berg', '555', 1, "
+                "'2025-01-01T00:00:00+00:00')"
+            )
+        )
+        conn.execute(text("INSERT INTO physios(physio_id, full_name) VALUES (1, 'Marta K')"))
+    return engine
@@ -0,0 +1,79 @@
+import importlib
+
+import pandas as pd
+from conftest import load_module
+from sqlalchemy import text
+
+bp = importlib.import_module("02_reception_automation.build_priorities")
+score = load_module("03_cancellation_model/score.py")
+
+
+def add_appointment(conn, appointment_id, start):
+    conn.execute(
+        text(
+            "INSERT INTO appointments(appointment_id, patient_id, physio_id, appt_start, "
+            "appt_end, booked_at, status, price_estimate) VALUES (:a, 1, 1, :s, :s, "
+            "'2025-09-01T10:00:00+00:00', 'booked', 60.0)"
+        ),
+        {"a": appointment_id, "s": start},
+    )
+
+
+def add_score(conn, appointment_id, version, day, risk, scored_at):
+    conn.execute(
+        text(
+            "INSERT INTO cancellation_scores(appointment_id, model_version, day, risk_score, "
+            "risk_bucket, scored_at) VALUES (:a, :v, :d, :r, 'low', :t)"
+        ),
+        {"a": appointment_id, "v": version, "d": day, "r": risk, "t": scored_at},
+    )
+
+
+def test_rescheduled_appointment_takes_the_score_of_its_day(db):
+    with db.begin() as conn:
+        add_appointment(conn, 10, "2025-09-06T09:00:00+00:00")
+        add_appointment(conn, 11, "2025-09-05T09:00:00+00:00")
+        # 10 was scored on the 5th, then moved to the 6th and scored again by a
+        # newer model; both rows are each day's latest version
+        add_score(conn, 10, "v1", "2025-09-05", 0.9, "2025-09-04T06:00:00")
+        add_score(conn, 11, "v1", "2025-09-05", 0.2, "2025-09-04T06:00:00")
+        add_score(conn, 10, "v2", "2025-09-06", 0.3, "2025-09-05T06:00:00")
+
+    bp.build_range("2025-09-05", "2025-09-06")
+
+    with db.begin() as conn:
+        rows = conn.execute(
+            text("SELECT day, appointment_id, risk_score FROM priorities ORDER BY day")
+        ).fetchall()
+    assert rows == [("2025-09-05", 11, 0.2), ("2025-09-06", 10, 0.3)]
+
+
+def scores(day, risks):
+    return pd.DataFrame(
+        {
+            "day": day,
+            "appointment_id": list(risks),
+            "risk_score": list(risks.values()),
+            "risk_bucket": "low",
+        }
+    )
+
+
+def test_scores_upsert_per_version_and_the_latest_version_is_read(db):
+    d5, d6 = "2025-09-05", "2025-09-06"
+    score.store_scores(pd.concat([scores(d5, {1: 0.1, 2: 0.2}), scores(d6, {3: 0.3})]), "v1")
+    # the same model again replaces its rows; a new model adds its own
+    score.store_scores(scores(d5, {1: 0.15, 2: 0.25}), "v1")
+    score.store_scores(scores(d5, {1: 0.5}), "v2")
+
+    with db.begin() as conn:
+        stored = conn.execute(
+            text(
+                "SELECT appointment_id, model_version, risk_score FROM cancellation_scores "
+                "ORDER BY appointment_id, model_version"
+            )
+        ).fetchall()
+    assert stored == [(1, "v1", 0.15), (1, "v2", 0.5), (2, "v1", 0.25), (3, "v1", 0.3)]
+
+    got = bp._load_model_scores(d5, d6).sort_values(["appt_date", "appointment_id"])
+    assert got.values.tolist() == [[d5, 1, 0.5], [d6, 3, 0.3]]
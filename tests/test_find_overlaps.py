@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.validate_data import find_overlaps
+
+T0 = 1_757_059_200  # 2025-09-05T08:00:00Z
+
+
+def schedule(rows):
+    """(appointment_id, physio_id, start offset s, end offset s) tuples"""
+    df = pd.DataFrame(rows, columns=["appointment_id", "physio_id", "start_s", "end_s"])
+    return df.assign(start_s=df["start_s"] + T0, end_s=df["end_s"] + T0)
+
+
+def loop_overlaps(df: pd.DataFrame) -> pd.Series:
+    """The row-by-row check find_overlaps replaced: per physio and UTC day,
+    sorted by start, a row overlaps when it starts before the latest end so far.
+    Returns the flagged appointment ids."""
+    flagged = []
+    df = df.assign(d=df["start_s"] // 86_400)
+    for _, g in df.groupby(["physio_id", "d"]):
+        prev_end = None
+        for r in g.sort_values("start_s").itertuples():
+            if prev_end is not None and r.start_s < prev_end:
+                flagged.append(r.appointment_id)
+            prev_end = r.end_s if prev_end is None else max(prev_end, r.end_s)
+    return pd.Series(sorted(flagged), dtype=np.int64)
+
+
+def random_schedule(seed: int, n: int = 2_000, slot_s: int = 900) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    start = rng.integers(0, 5, n) * 86_400 + rng.integers(0, 36_000 // slot_s, n) * slot_s
+    return schedule(
+        zip(
+            range(1, n + 1),
+            rng.integers(1, 9, n),
+            start,
+            start + rng.choice([900, 1800, 2700, 3600], n),
+            strict=True,
+        )
+    )
+
+
+def test_edge_cases():
+    df = schedule(
+        [
+            (1, 1, 0, 3600),
+            (2, 1, 3600, 5400),  # starts as 1 ends: back to back, no overlap
+            (3, 1, 4000, 4500),  # inside 2
+            (4, 1, 4600, 6000),  # after 3 ended but inside 2
+            (5, 2, 0, 3600),  # other physio, same time as 1
+            (6, 1, 86_400, 90_000),  # next day
+        ]
+    )
+    out = find_overlaps(df)
+    assert dict(zip(out["appointment_id"], out["overlaps_with"], strict=True)) == {3: 2, 4: 2}
+    assert out["d"].tolist() == ["2025-09-05", "2025-09-05"]
+
+
+def test_empty_and_missing_times():
+    assert find_overlaps(schedule([])).empty
+    df = schedule([(1, 1, 0, 3600), (2, 1, 1800, 5400)])
+    df.loc[1, "start_s"] = np.nan
+    assert find_overlaps(df).empty
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_the_loop(seed):
+    # one-second slots: starts almost never tie, and tied rows are dropped,
+    # so the flagged rows are fully determined
+    df = random_schedule(seed, slot_s=1).drop_duplicates(["physio_id", "start_s"])
+    out = find_overlaps(df)
+    assert sorted(out["appointment_id"]) == loop_overlaps(df).tolist()
+
+    # every pair names an appointment of the same physio it really overlaps
+    rows = df.set_index("appointment_id")
+    a, b = rows.loc[out["appointment_id"]], rows.loc[out["overlaps_with"]]
+    assert (a["physio_id"].to_numpy() == b["physio_id"].to_numpy()).all()
+    assert (b["start_s"].to_numpy() <= a["start_s"].to_numpy()).all()
+    assert (a["start_s"].to_numpy() < b["end_s"].to_numpy()).all()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_the_loop_count_with_tied_starts(seed):
+    # on 15 minute slots which of two rows starting together gets flagged
+    # depends on sort order, but how many rows per physio and day does not
+    df = random_schedule(seed)
+    out = find_overlaps(df)
+    assert out["appointment_id"].is_unique
+    flagged = df[df["appointment_id"].isin(loop_overlaps(df))]
+    expected = flagged.groupby(["physio_id", flagged["start_s"] // 86_400]).size()
+    got = df[df["appointment_id"].isin(out["appointment_id"])]
+    got = got.groupby(["physio_id", got["start_s"] // 86_400]).size()
+    pd.testing.assert_series_equal(got, expected)
@@ -0,0 +1,215 @@
+import gzip
+import importlib
+import json
+
+import pandas as pd
+import pytest
+
+pc = importlib.import_module("02_reception_automation.priorities_cache")
+
+DAY = "2025-09-05"
+
+
+def priorities(n: int = 10) -> pd.DataFrame:
+    """A stored list of n rows, highest priority first"""
+    return pd.DataFrame(
+        {
+            "appointment_id": range(1, n + 1),
+            "patient_id": range(1, n + 1),
+            "patient_name": [f"Patient {i}" for i in range(n)],
+            "phone": "555",
+            "consent_form_received": True,
+            "physio_name": ["Marta K" if i % 2 else "Jon P" for i in range(n)],
+            "appt_start": f"{DAY}T09:00:00+00:00",
+            "is_new_patient": False,
+            "risk_score": 0.5,
+            "risk_bucket": ["high" if i < 3 else "medium" if i < 6 else "low" for i in range(n)],
+            "missing_phone": False,
+            "missing_consent": False,
+            "priority_score": [float(n - i) for i in range(n)],
+            "priority_reason": "",
+        }
+    )
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """Serve priorities() as the day's build; returns the frame to edit for a rebuild"""
+    state = {"df": priorities(), "built_at": "2025-09-04T18:00:00+00:00"}
+    monkeypatch.setattr(pc.bp, "built", lambda day: {"built_at": state["built_at"], "n_rows": 0})
+    monkeypatch.setattr(pc.bp, "load_priorities", lambda day: state["df"])
+    monkeypatch.setattr(pc, "BUILD_CHECK_S", 0.0)
+    monkeypatch.setattr(pc, "_cache", {})
+    return state
+
+
+def page(args) -> dict:
+    body, _ = pc.query(pc.get(DAY), args)
+    return json.loads(body)
+
+
+def pages(args) -> list:
+    """Follow next_cursor from the first page to the last"""
+    out = [page(args)]
+    while out[-1]["next_cursor"]:
+        # a cursor that does not move on would page forever
+        assert len(out) <= out[0]["total"], "next_cursor repeats a page"
+        out.append(page(dict(args, cursor=out[-1]["next_cursor"])))
+    return out
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        {},
+        {"risk_bucket": "high,low"},
+        {"physio": "marta k"},
+        {"min_priority": "4"},
+        {"risk_bucket": "medium", "physio": "Jon P"},
+    ],
+)
+@pytest.mark.parametrize("limit", [1, 2, 3, 100])
+def test_cursor_pages_cover_the_filtered_list_once(stored, args, limit):
+    everything = page(args)
+    assert everything["next_cursor"] is None
+
+    got = pages(dict(args, limit=str(limit)))
+    ids = [r["appointment_id"] for p in got for r in p["items"]]
+    assert ids == [r["appointment_id"] for r in everything["items"]]
+    assert all(p["total"] == everything["total"] for p in got)
+    assert all(p["count"] == limit for p in got[:-1])
+    assert 0 < got[-1]["count"] <= limit
+
+
+def test_empty_filter_has_no_cursor(stored):
+    out = page({"physio": "nobody", "limit": "2"})
+    assert (out["count"], out["total"], out["next_cursor"]) == (0, 0, None)
+
+
+def test_cursor_is_stale_after_a_rebuild(stored):
+    cursor = page({"limit": "3"})["next_cursor"]
+    stored["df"] = priorities(12)
+    stored["built_at"] = "2025-09-04T19:00:00+00:00"
+    with pytest.raises(ValueError, match="rebuilt"):
+        page({"limit": "3", "cursor": cursor})
+
+
+def test_rebuild_with_the_same_rows_keeps_the_cursor(stored):
+    first = page({"limit": "3"})
+    stored["built_at"] = "2025-09-04T19:00:00+00:00"
+    second = page({"limit": "3", "cursor": first["next_cursor"]})
+    assert [r["appointment_id"] for r in second["items"]] == [4, 5, 6]
+
+
+@pytest.mark.parametrize("cursor", ["junk", "abcdefgh.1", ".3"])
+def test_bad_cursor(stored, cursor):
+    with pytest.raises(ValueError, match="cursor"):
+        page({"cursor": cursor})
+
+
+@pytest.fixture
+def client():
+    server = importlib.import_module("02_reception_automation.server")
+    return server.app.test_client()
+
+
+@pytest.mark.parametrize("day", ["garbage", "2026-13-45", "20260918"])
+def test_bad_day_is_400_and_starts_no_build(client, day):
+    builds = importlib.import_module("02_reception_automation.builds")
+    for path in ("/priorities", "/priorities/status"):
+        resp = client.get(path, query_string={"day": day})
+        assert resp.status_code == 400
+        assert "YYYY-MM-DD" in resp.json["error"]
+    assert day not in builds._builds
+
+
+def test_failed_build_falls_back_to_an_empty_list(client, monkeypatch):
+    def broken(day, csv=False):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(pc.bp, "built", lambda day: None)
+    monkeypatch.setattr(pc.bp, "build", broken)
+    monkeypatch.setattr(pc, "_cache", {})
+
+    resp = client.get("/priorities", query_string={"day": "2031-01-02"})
+    assert resp.status_code == 200
+    assert resp.json == {"day": "2031-01-02", "count": 0, "items": []}
+    status = client.get("/priorities/status", query_string={"day": "2031-01-02"}).json
+    assert status["state"] == "failed" and "database is locked" in status["error"]
+
+
+def test_priorities_etag_and_gzip(client, stored):
+    args = {"day": DAY}
+    first = client.get("/priorities", query_string=args)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and "Accept-Encoding" in first.headers["Vary"]
+
+    again = client.get("/priorities", query_string=args, headers={"If-None-Match": etag})
+    assert (again.status_code, again.data, again.headers["ETag"]) == (304, b"", etag)
+
+    zipped = client.get("/priorities", query_string=args, headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped.data) == first.data
+
+    # filtered lists carry their own ETag
+    top = dict(args, limit="2")
+    etag_top = client.get("/priorities", query_string=top).headers["ETag"]
+    assert etag_top != etag
+    assert (
+        client.get("/priorities", query_string=top, headers={"If-None-Match": etag_top}).status_code
+        == 304
+    )
+
+    stored["df"] = priorities(12)
+    stored["built_at"] = "2025-09-04T19:00:00+00:00"
+    rebuilt = client.get("/priorities", query_string=args, headers={"If-None-Match": etag})
+    assert rebuilt.status_code == 200 and rebuilt.json["count"] == 12
+    assert rebuilt.headers["ETag"] != etag
+
+
+def rows_to_store(day: str, n: int) -> pd.DataFrame:
+    """priorities(n) as build_range hands a day's rows to _store"""
+    df = priorities(n).assign(
+        day=day,
+        appt_end=f"{day}T09:45:00+00:00",
+        booked_at="2025-09-01T10:00:00+00:00",
+        noshow_rate_90d=0.25,
+    )
+    df["phone"] = df["phone"].astype(object)
+    df.loc[0, ["phone", "missing_phone"]] = [None, True]
+    df.loc[1, "is_new_patient"] = True
+    return df[["day"] + pc.bp.COLUMNS]
+
+
+def test_stored_lists_round_trip_through_the_cache(db, monkeypatch):
+    monkeypatch.setattr(pc, "BUILD_CHECK_S", 0.0)
+    monkeypatch.setattr(pc, "_cache", {})
+    d5, d6, d7 = DAY, "2025-09-06", "2025-09-07"
+
+    def served(day):
+        return json.loads(pc.get(day)["body"])["items"]
+
+    def expected(rows, day):
+        day_rows = rows[rows["day"] == day].sort_values("priority_score", ascending=False)
+        return day_rows[pc.COLUMNS].to_dict(orient="records")
+
+    rows = pd.concat([rows_to_store(d5, 4), rows_to_store(d6, 2)])
+    built_at = pc.bp._store(d5, d7, [d5, d6, d7], rows)
+
+    assert served(d5) == expected(rows, d5)
+    assert served(d6) == expected(rows, d6)
+    first, second = served(d5)[:2]
+    assert first["phone"] is None and first["missing_phone"] is True
+    assert second["is_new_patient"] is True and second["missing_phone"] is False
+    # built without appointments is an empty list; never built is None
+    assert pc.bp.built(d7) == {"built_at": built_at, "n_rows": 0}
+    assert served(d7) == []
+    assert pc.get("2025-09-08") is None
+
+    # rebuilding one day replaces its rows only, and the cache picks it up
+    old = pc.get(d5)["key"]
+    again = rows_to_store(d5, 3)
+    pc.bp._store(d5, d5, [d5], again)
+    assert pc.get(d5)["key"] != old
+    assert served(d5) == expected(again, d5)
+    assert served(d6) == expected(rows, d6)
@@ -0,0 +1,350 @@
+import importlib
+import re
+
+import pandas as pd
+import pytest
+from conftest import load_module
+from sqlalchemy import text
+
+from common.patient_history import rebuild_patient_history, refresh_patient_history
+from common.rollups import rebuild_rollups, refresh_rollups
+
+rd = load_module("01_kpi_dashboard/etl/refresh_daily.py")
+
+DAY = "2025-09-05"
+
+
+def appt(appointment_id, status="completed", hour=9):
+    return {
+        "appointment_id": appointment_id,
+        "patient_id": 1,
+        "physio_id": 1,
+        "appt_start": f"{DAY}T{hour:02d}:00:00+00:00",
+        "appt_end": f"{DAY}T{hour:02d}:45:00+00:00",
+        "booked_at": "2025-09-01T10:00:00+00:00",
+        "status": status,
+        "price_estimate": 60.0,
+    }
+
+
+def pay(payment_id, appointment_id):
+    return {
+        "payment_id": payment_id,
+        "appointment_id": appointment_id,
+        "amount": 60.0,
+        "paid_at": f"{DAY}T10:00:00+00:00",
+        "method": "card",
+    }
+
+
+def appt_on(day, appointment_id, status="completed", hour=9, physio_id=1):
+    return dict(
+        appt(appointment_id, status, hour),
+        physio_id=physio_id,
+        appt_start=f"{day}T{hour:02d}:00:00+00:00",
+        appt_end=f"{day}T{hour:02d}:45:00+00:00",
+    )
+
+
+def insert(conn, table, row):
+    cols = ", ".join(row)
+    marks = ", ".join(f":{c}" for c in row)
+    conn.execute(text(f"INSERT INTO {table}({cols}) VALUES ({marks})"), row)
+
+
+def write_drop(root, day, appts, pays):
+    out = root / day
+    out.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(appts, columns=list(appt(0))).to_csv(out / "appointments.csv", index=False)
+    pd.DataFrame(pays, columns=list(pay(0, 0))).to_csv(out / "payments.csv", index=False)
+    return out
+
+
+def ids(conn, table, key):
+    return sorted(r[0] for r in conn.execute(text(f"SELECT {key} FROM {table}")))
+
+
+def jobs(conn):
+    return [r[0] for r in conn.execute(text("SELECT job FROM etl_runs ORDER BY id"))]
+
+
+@pytest.fixture(autouse=True)
+def quarantine_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(rd, "QUARANTINE_ROOT", tmp_path / "quarantine")
+
+
+def test_apply_day_writes_only_the_diff(db, tmp_path):
+    write_drop(tmp_path, DAY, [appt(10), appt(11, "booked", 11)], [pay(100, 10)])
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+
+    appts = pd.DataFrame([appt(10), appt(11, "canceled", 11), appt(12, "booked", 13)])
+    pays = pd.DataFrame([pay(100, 10)])
+    with db.begin() as conn:
+        appts = rd.coerce_frame(appts, rd.table_columns(conn, "appointments"))
+        pays = rd.coerce_frame(pays, rd.table_columns(conn, "payments"))
+        stats = rd.apply_day(conn, DAY, appts, pays)
+        status = conn.execute(
+            text("SELECT status FROM appointments WHERE appointment_id = 11")
+        ).scalar()
+        assert ids(conn, "appointments", "appointment_id") == [10, 11, 12]
+
+    # one new, one changed, the unchanged appointment and payment untouched
+    assert stats == {"appointments": (1, 1, 0), "payments": (0, 0, 0)}
+    assert status == "canceled"
+
+
+def test_apply_day_deletes_rows_missing_from_the_drop(db, tmp_path):
+    write_drop(tmp_path, DAY, [appt(10), appt(11, "booked", 11)], [pay(100, 10)])
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+    write_drop(tmp_path, DAY, [appt(10)], [])
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+
+    with db.begin() as conn:
+        assert ids(conn, "appointments", "appointment_id") == [10]
+        assert ids(conn, "payments", "payment_id") == []
+
+
+def test_appointment_dropped_while_its_payment_stays(db, tmp_path):
+    """Deleting the appointment would break payments.appointment_id (FK)"""
+    write_drop(tmp_path, DAY, [appt(10), appt(11, "booked", 11)], [pay(100, 10)])
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+    write_drop(tmp_path, DAY, [appt(11, "booked", 11)], [pay(100, 10)])
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+
+    with db.begin() as conn:
+        assert ids(conn, "appointments", "appointment_id") == [10, 11]
+        assert ids(conn, "payments", "payment_id") == [100]
+        # rows were held back, so the same files are retried rather than skipped
+        assert rd.load_manifest(conn, [DAY]) == {}
+        assert jobs(conn) == ["refresh_daily", "refresh_daily"]
+
+
+def test_payment_for_a_leaving_appointment_is_held_and_retried(db, tmp_path):
+    write_drop(tmp_path, DAY, [appt(10), appt(11, "booked", 11)], [pay(100, 10)])
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+    write_drop(tmp_path, DAY, [appt(11, "booked", 11)], [pay(100, 10)])
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+
+    held = pd.read_csv(tmp_path / "quarantine" / DAY / "payments.csv")
+    assert held[["payment_id", "reason"]].values.tolist() == [[100, "unknown_appointment"]]
+
+    # the identical files come again: applied again, not skipped as unchanged
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+    with db.begin() as conn:
+        assert jobs(conn) == ["refresh_daily"] * 3
+
+
+def test_backfill_logs_a_failing_day_and_goes_on(db, tmp_path, monkeypatch):
+    days = ["2025-09-05", "2025-09-06", "2025-09-07"]
+    for i, day in enumerate(days):
+        row = dict(
+            appt(20 + i), appt_start=f"{day}T09:00:00+00:00", appt_end=f"{day}T09:45:00+00:00"
+        )
+        write_drop(tmp_path, day, [row], [])
+
+    apply_day = rd.apply_day
+
+    def flaky(conn, day, *args):
+        if day == days[1]:
+            raise RuntimeError("disk on fire")
+        return apply_day(conn, day, *args)
+
+    monkeypatch.setattr(rd, "apply_day", flaky)
+    assert rd.backfill([tmp_path / d for d in days], workers=1, batch_days=7) == 1
+    assert rd.backfill([tmp_path / d for d in days], workers=1, batch_days=7) == 1
+
+    with db.begin() as conn:
+        assert ids(conn, "appointments", "appointment_id") == [20, 22]
+        runs = conn.execute(text("SELECT target_date, job FROM etl_runs ORDER BY id")).fetchall()
+    assert runs == [
+        (days[0], "refresh_daily"),
+        (days[1], "refresh_daily_failed"),
+        (days[2], "refresh_daily"),
+        (days[0], "refresh_daily_unchanged"),
+        (days[2], "refresh_daily_unchanged"),
+        (days[1], "refresh_daily_failed"),
+    ]
+
+
+def test_refresh_rebuilds_tomorrow_only_after_writing_rows(db, tmp_path):
+    tomorrow = importlib.import_module("02_reception_automation.build_priorities")._tomorrow_str()
+
+    def builds(conn):
+        return conn.execute(
+            text("SELECT COUNT(*) FROM priority_builds WHERE day = :d"), {"d": tomorrow}
+        ).scalar()
+
+    write_drop(tmp_path, DAY, [appt(10)], [])
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+    with db.begin() as conn:
+        assert builds(conn) == 1
+        conn.execute(text("DELETE FROM priority_builds"))
+
+    # unchanged files, then changed files that write nothing new
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+    rd.refresh_for_day(DAY, tmp_path / DAY, force=True)
+    with db.begin() as conn:
+        assert builds(conn) == 0
+
+
+def test_payment_for_another_days_appointment_refreshes_that_days_revenue(db, tmp_path):
+    def revenue_paid(conn, day):
+        return conn.execute(
+            text("SELECT revenue_paid FROM daily_kpis WHERE day = :d"), {"d": day}
+        ).scalar()
+
+    write_drop(tmp_path, DAY, [appt(10)], [pay(100, 10)])
+    rd.refresh_for_day(DAY, tmp_path / DAY)
+    # the balance is paid the next day: that day's drop carries the payment
+    write_drop(tmp_path, "2025-09-06", [], [dict(pay(101, 10), amount=25.0)])
+    rd.refresh_for_day("2025-09-06", tmp_path / "2025-09-06")
+    with db.begin() as conn:
+        assert revenue_paid(conn, DAY) == 85.0
+
+
+def rollups(conn):
+    kpis = conn.execute(
+        text(
+            "SELECT day, bookings, completed, canceled, no_show, revenue_estimate, revenue_paid "
+            "FROM daily_kpis ORDER BY day"
+        )
+    ).fetchall()
+    util = conn.execute(
+        text(
+            "SELECT day, physio_id, appointments, hours_scheduled FROM daily_utilization "
+            "ORDER BY day, physio_id"
+        )
+    ).fetchall()
+    return kpis, util
+
+
+def test_partial_rollup_refresh_matches_a_rebuild(db):
+    d4, d5, d6, d7 = "2025-09-04", DAY, "2025-09-06", "2025-09-07"
+    with db.begin() as conn:
+        conn.execute(text("INSERT INTO physios(physio_id, full_name) VALUES (2, 'Jon P')"))
+        for row in [
+            appt_on(d4, 1),
+            appt_on(d5, 2),
+            appt_on(d5, 3, "no_show", 11, physio_id=2),
+            appt_on(d5, 4, "canceled", 13),
+            appt_on(d6, 5, physio_id=2),
+            appt_on(d7, 6),
+        ]:
+            insert(conn, "appointments", row)
+        for row in [pay(100, 1), pay(101, 2), pay(102, 5)]:
+            insert(conn, "payments", row)
+        rebuild_rollups(conn)
+
+        # the 4th loses its only appointment, 3 moves from the 5th to the 6th
+        # and 2 gets a second payment; the 7th is not touched
+        conn.execute(text("DELETE FROM payments WHERE appointment_id = 1"))
+        conn.execute(text("DELETE FROM appointments WHERE appointment_id = 1"))
+        conn.execute(
+            text(
+                "UPDATE appointments SET status = :status, appt_start = :appt_start, "
+                "appt_end = :appt_end WHERE appointment_id = 3"
+            ),
+            appt_on(d6, 3, "booked", 15, physio_id=2),
+        )
+        insert(conn, "payments", dict(pay(103, 2), amount=25.0))
+        refresh_rollups(conn, [d4, d5, d6])
+        partial = rollups(conn)
+
+        rebuild_rollups(conn)
+        assert rollups(conn) == partial
+    kpis, util = partial
+    assert [k[0] for k in kpis] == [d5, d6, d7]
+    assert kpis[0][-1] == 85.0
+    assert [u[:3] for u in util] == [(d5, 1, 2), (d6, 2, 2), (d7, 1, 1)]
+
+
+# stored offsets that put the UTC date (what DATE() and appt_date/paid_date
+# take) on another day than the local one, and the other spellings in the data
+EDGE_TIMES = [
+    "2025-09-05T00:30:00+02:00",
+    "2025-09-04T23:30:00-02:00",
+    "2025-09-05T23:59:59Z",
+    "2025-09-05 09:00:00",
+    "2025-09-05T12:00:00.250+00:00",
+    "2025-09-06T02:00:00+01:00",
+]
+
+
+def test_day_columns_select_the_same_rows_as_date(db):
+    vd = importlib.import_module("common.validate_data")
+    scope = vd.scope_filters("= :d")
+    queries = [
+        rd.DAY_APPOINTMENT_ROWS,
+        rd.DAY_APPOINTMENT_IDS,
+        rd.DAY_PAYMENT_ROWS,
+        vd.TOMORROW_FLAGS_SQL,
+        f"SELECT p.payment_id FROM payments p WHERE {scope['payments']}",
+        f"SELECT patient_id FROM patients WHERE {scope['patients']}",
+    ]
+    with db.begin() as conn:
+        for i, t in enumerate(EDGE_TIMES, 1):
+            insert(conn, "appointments", dict(appt(i), appt_start=t, appt_end=t))
+            insert(conn, "payments", dict(pay(100 + i, i), paid_at=t))
+
+        per_day = {}
+        for sql in queries:
+            legacy = re.sub(r"\b(\w+\.)?appt_date\b", r"DATE(\1appt_start)", sql)
+            legacy = re.sub(r"\b(\w+\.)?paid_date\b", r"DATE(\1paid_at)", legacy)
+            assert legacy != sql
+            for d in ("2025-09-04", DAY, "2025-09-06"):
+                got = sorted(conn.execute(text(sql), {"d": d}).fetchall())
+                assert got == sorted(conn.execute(text(legacy), {"d": d}).fetchall()), (sql, d)
+                if sql is rd.DAY_APPOINTMENT_IDS:
+                    per_day[d] = [r[0] for r in got]
+
+    assert per_day == {"2025-09-04": [1], DAY: [2, 3, 4, 5], "2025-09-06": [6]}
+
+
+HISTORY_COLUMNS = (
+    "day, n_total, n_pos, n_noshow, prior_total, prior_pos, first_seen, last_seen, "
+    "total_30d, pos_30d, noshow_30d, total_90d, pos_90d, noshow_90d"
+)
+
+
+def history(conn, patient_id):
+    return conn.execute(
+        text(f"SELECT {HISTORY_COLUMNS} FROM patient_history WHERE patient_id = :p ORDER BY day"),
+        {"p": patient_id},
+    ).fetchall()
+
+
+def test_patient_history_window_counts(db):
+    visits = [
+        ("2025-06-01", "completed"),
+        ("2025-06-01", "no_show"),
+        ("2025-06-11", "canceled"),
+        ("2025-07-01", "completed"),  # 06-01 is exactly 30 days back
+        ("2025-07-02", "booked"),  # 31 days: 06-01 leaves the 30-day window
+        ("2025-09-01", "no_show"),  # 92 days: 06-01 leaves the 90-day window
+    ]
+    with db.begin() as conn:
+        for i, (day, status) in enumerate(visits, 1):
+            insert(conn, "appointments", appt_on(day, i, status, hour=9 + i))
+        conn.execute(
+            text(
+                "INSERT INTO patients(patient_id, first_name, last_name, created_at) "
+                "VALUES (2, 'Ola', 'Dahl', '2025-01-01T00:00:00+00:00')"
+            )
+        )
+        # another patient's visit on the same day counts for them only
+        insert(conn, "appointments", dict(appt_on("2025-06-11", 99, "no_show"), patient_id=2))
+        refresh_patient_history(conn, [1, 2])
+        rows = history(conn, 1)
+        other = history(conn, 2)
+
+        rebuild_patient_history(conn)
+        assert history(conn, 1) == rows and history(conn, 2) == other
+
+    assert rows == [
+        ("2025-06-01", 2, 1, 1, 0, 0, "2025-06-01", None, 0, 0, 0, 0, 0, 0),
+        ("2025-06-11", 1, 1, 0, 2, 1, "2025-06-01", "2025-06-01", 2, 1, 1, 2, 1, 1),
+        ("2025-07-01", 1, 0, 0, 3, 2, "2025-06-01", "2025-06-11", 3, 2, 1, 3, 2, 1),
+        ("2025-07-02", 1, 0, 0, 4, 2, "2025-06-01", "2025-07-01", 2, 1, 0, 4, 2, 1),
+        ("2025-09-01", 1, 1, 1, 5, 2, "2025-06-01", "2025-07-02", 0, 0, 0, 3, 1, 0),
+    ]
+    assert other == [("2025-06-11", 1, 1, 1, 0, 0, "2025-06-11", None, 0, 0, 0, 0, 0, 0)]
@@ -0,0 +1,112 @@
+import threading
+
+import pandas as pd
+import pytest
+from conftest import load_module
+from sqlalchemy import text
+
+scoring = load_module("02_reception_automation/scoring.py")
+features = load_module("03_cancellation_model/features.py")
+
+ROW = {
+    "appointment_id": 7,
+    "patient_id": 1,
+    "appt_start": "2025-09-05T09:00:00+02:00",
+    "booked_at": "2025-09-01T10:00:00+02:00",
+    "price_estimate": 60,
+}
+
+
+def test_parse_rows_converts_types():
+    rows = scoring.parse_rows(
+        {"appointments": [ROW, dict(ROW, patient_id="2", price_estimate="55.5")]}
+    )
+    assert rows["patient_id"].tolist() == [1, 2]
+    assert rows["price_estimate"].tolist() == [60.0, 55.5]
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [
+        ("patient_id", "abc"),
+        ("patient_id", 1.5),
+        ("patient_id", True),
+        ("appointment_id", [1]),
+        ("price_estimate", "sixty"),
+        ("price_estimate", "inf"),
+        ("appt_start", 20250905),
+        ("booked_at", "yesterday"),
+    ],
+)
+def test_parse_rows_rejects_bad_values(field, value):
+    with pytest.raises(ValueError, match=rf"appointments\[1\]\.{field}"):
+        scoring.parse_rows([ROW, dict(ROW, **{field: value})])
+
+
+def test_a_bad_request_fails_alone_in_its_batch():
+    release = threading.Event()
+
+    def fn(rows):
+        release.wait(5)
+        if (rows["patient_id"] < 0).any():
+            raise RuntimeError("bad row")
+        return pd.DataFrame({"risk_score": rows["patient_id"] * 10})
+
+    batcher = scoring.MicroBatcher(fn)
+    first = batcher.submit(pd.DataFrame({"patient_id": [0]}))  # holds the thread
+    queued = [batcher.submit(pd.DataFrame({"patient_id": [p]})) for p in (1, -1, 2)]
+    release.set()
+
+    assert first.result(5)["risk_score"].tolist() == [0]
+    assert queued[0].result(5)["risk_score"].tolist() == [10]
+    with pytest.raises(RuntimeError):
+        queued[1].result(5)
+    assert queued[2].result(5)["risk_score"].tolist() == [20]
+
+
+def test_cancelled_requests_are_skipped():
+    release = threading.Event()
+    seen = []
+
+    def fn(rows):
+        release.wait(5)
+        seen.extend(rows["patient_id"])
+        return pd.DataFrame({"risk_score": rows["patient_id"]})
+
+    batcher = scoring.MicroBatcher(fn)
+    first = batcher.submit(pd.DataFrame({"patient_id": [1]}))
+    gone = batcher.submit(pd.DataFrame({"patient_id": [2]}))
+    kept = batcher.submit(pd.DataFrame({"patient_id": [3]}))
+    assert gone.cancel()  # what score() does when its caller timed out
+    release.set()
+
+    assert first.result(5)["risk_score"].tolist() == [1]
+    assert kept.result(5)["risk_score"].tolist() == [3]
+    assert seen == [1, 3]
+
+
+def test_posted_history_takes_the_latest_day_before_each_row(db):
+    history = [
+        # patient, day, n_total, n_pos, prior_total, prior_pos
+        (1, "2025-09-01", 1, 0, 0, 0),
+        (1, "2025-09-03", 2, 1, 1, 0),
+        (2, "2025-09-02", 1, 1, 4, 2),
+    ]
+    with db.begin() as conn:
+        for p, d, nt, npos, pt, pp in history:
+            conn.execute(
+                text(
+                    "INSERT INTO patient_history(patient_id, day, n_total, n_pos, n_noshow, "
+                    "prior_total, prior_pos, first_seen) VALUES (:p, :d, :nt, :np, 0, :pt, :pp, :d)"
+                ),
+                {"p": p, "d": d, "nt": nt, "np": npos, "pt": pt, "pp": pp},
+            )
+        patients = pd.Series([1, 2, 1, 1, 3, 1])
+        days = pd.Series(
+            ["2025-09-03", "2025-09-05", "2025-09-01", "2025-09-04", "2025-09-05", "2025-09-02"]
+        )
+        total, pos = features._posted_history(conn, patients, days)
+
+    # rows keep their order; a row's own day does not count
+    assert total.tolist() == [1, 5, 0, 3, 0, 1]
+    assert pos.tolist() == [0, 3, 0, 1, 0, 0]
@@ -0,0 +1,76 @@
+import json
+
+import pandas as pd
+import pytest
+from conftest import load_module
+
+sr = load_module("02_reception_automation/send_reminders.py")
+
+DAY = "2025-09-05"
+
+
+def rows(n: int = 3) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "appointment_id": range(1, n + 1),
+            "patient_id": range(11, n + 11),
+            "patient_name": [f"Patient {i}" for i in range(1, n + 1)],
+            "physio_name": "Marta K",
+            "appt_start": [f"{DAY}T{8 + i:02d}:30:00+02:00" for i in range(1, n + 1)],
+        }
+    )
+
+
+def test_render_fills_the_template():
+    msgs = sr.render(rows(1))
+    (m,) = msgs.to_dict("records")
+    assert m["name"] == f"{DAY}_1_reminder.txt"
+    assert m["to"] == "patient_1.11@example.local"
+    assert m["subject"] == f"Appointment reminder for {DAY} at 09:30"
+    assert m["content"].startswith("To: Patient 1 <patient_1.11@example.local>\n")
+    assert "with Marta K\non 2025-09-05 at 09:30." in m["content"]
+
+
+def test_outbox_files_and_manifest(tmp_path):
+    msgs = sr.render(rows())
+    assert sr.write_outbox(msgs, DAY, tmp_path, workers=2) == (3, 0)
+
+    names = sorted(p.name for p in tmp_path.iterdir() if not p.name.startswith("."))
+    assert names == sorted(msgs["name"])
+    for name, content in zip(msgs["name"], msgs["content"], strict=True):
+        assert (tmp_path / name).read_text(encoding="utf-8") == content
+    manifest = json.loads((tmp_path / f".manifest_{DAY}.json").read_text(encoding="utf-8"))
+    assert manifest == {n: sr._sha(c) for n, c in zip(msgs["name"], msgs["content"], strict=True)}
+    # nothing left behind by the write-aside-and-rename
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_rerun_writes_only_what_changed(tmp_path):
+    df = rows()
+    sr.write_outbox(sr.render(df), DAY, tmp_path)
+    assert sr.write_outbox(sr.render(df), DAY, tmp_path) == (0, 3)
+
+    df.loc[1, "physio_name"] = "Jon P"
+    (tmp_path / f"{DAY}_3_reminder.txt").unlink()
+    msgs = sr.render(df)
+    assert sr.write_outbox(msgs, DAY, tmp_path, dry_run=True) == (2, 1)
+    assert not (tmp_path / f"{DAY}_3_reminder.txt").exists()
+
+    assert sr.write_outbox(msgs, DAY, tmp_path) == (2, 1)
+    assert "with Jon P" in (tmp_path / f"{DAY}_2_reminder.txt").read_text(encoding="utf-8")
+    assert (tmp_path / f"{DAY}_3_reminder.txt").exists()
+    assert sr.write_outbox(msgs, DAY, tmp_path) == (0, 3)
+
+
+@pytest.mark.parametrize("fmt", ["jsonl", "mbox"])
+def test_archive_is_one_file_rewritten_only_on_change(tmp_path, fmt):
+    msgs = sr.render(rows())
+    assert sr.write_outbox(msgs, DAY, tmp_path, fmt=fmt) == (1, 0)
+    assert sr.write_outbox(msgs, DAY, tmp_path, fmt=fmt) == (0, 1)
+    (archive,) = [p for p in tmp_path.iterdir() if not p.name.startswith(".")]
+    assert archive.name == f"reminders_{DAY}.{fmt}"
+    body = archive.read_text(encoding="utf-8")
+    if fmt == "jsonl":
+        assert [json.loads(line)["appointment_id"] for line in body.splitlines()] == [1, 2, 3]
+    else:
+        assert body.count("From reception@example.local ") == 3
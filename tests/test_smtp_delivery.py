@@ -0,0 +1,99 @@
+import smtplib
+
+import pandas as pd
+import pytest
+from conftest import load_module
+
+sd = load_module("02_reception_automation/smtp_delivery.py")
+
+DAY = "2025-09-05"
+
+
+def reminders(n: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "appointment_id": range(1, n + 1),
+            "to": [f"patient{i}@example.local" for i in range(1, n + 1)],
+            "content": [
+                f"To: patient{i}@example.local\nSubject: Reminder\n\nSee you at 9:00.\n"
+                for i in range(1, n + 1)
+            ],
+        }
+    )
+
+
+class Relay:
+    """Stands in for smtplib.SMTP sessions: refuses some recipients, or every connect"""
+
+    def __init__(self, refuse=(), down: bool = False):
+        self.refuse = set(refuse)
+        self.down = down
+        self.connects = 0
+        self.sent = []
+
+    def connect(self, host, port):
+        self.connects += 1
+        if self.down:
+            raise ConnectionRefusedError(111, "Connection refused")
+        return Session(self)
+
+
+class Session:
+    def __init__(self, relay: Relay):
+        self.relay = relay
+
+    def send_message(self, msg, to_addrs):
+        if to_addrs[0] in self.relay.refuse:
+            raise smtplib.SMTPRecipientsRefused({to_addrs[0]: (550, b"5.1.1 No such user")})
+        self.relay.sent.append(to_addrs[0])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def relay(monkeypatch):
+    def install(**kwargs):
+        r = Relay(**kwargs)
+        monkeypatch.setattr(sd, "_connect", r.connect)
+        return r
+
+    monkeypatch.setattr(sd, "BACKOFF_S", 0.0)
+    return install
+
+
+def test_refused_recipient_keeps_the_connection(relay):
+    r = relay(refuse={"patient2@example.local", "patient4@example.local"})
+    out = sd.deliver(reminders(6), DAY, pool_size=1, max_failures=3)
+
+    assert out["status"].tolist() == ["sent", "failed", "sent", "failed", "sent", "sent"]
+    # 5xx: not retried, and one session carried every message
+    assert out["attempts"].tolist() == [1] * 6
+    assert r.connects == 1
+
+
+def test_relay_down_stops_the_run(relay):
+    r = relay(down=True)
+    pool, max_failures = 4, 5
+    out = sd.deliver(reminders(50), DAY, pool_size=pool, retries=3, max_failures=max_failures)
+
+    assert len(out) == 50 and (out["status"] == "failed").all()
+    # attempts already in flight when the breaker opens still count
+    assert r.connects < max_failures + pool
+    skipped = out["attempts"] == 0
+    assert skipped.sum() >= 50 - pool
+    assert out.loc[skipped, "last_error"].str.startswith("not sent, relay down").all()
+
+
+def test_a_success_resets_the_failure_count():
+    breaker = sd.CircuitBreaker(2)
+    breaker.failure("ConnectionRefusedError")
+    breaker.success()
+    breaker.failure("ConnectionRefusedError")
+    assert not breaker.open
+    breaker.failure("ConnectionRefusedError")
+    assert breaker.open
+    assert not sd.CircuitBreaker(0).open
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+from common.validate_frames import forget, remember, validate_day
+
+IDS = {
+    "patients": pd.Index([1, 2], dtype=np.int64),
+    "physios": pd.Index([1], dtype=np.int64),
+    "appointments": pd.Index([50], dtype=np.int64),
+}
+
+
+def appt(appointment_id, **kw):
+    row = {
+        "appointment_id": appointment_id,
+        "patient_id": 1,
+        "physio_id": 1,
+        "appt_start": "2025-09-05T09:00:00+00:00",
+        "appt_end": "2025-09-05T09:45:00+00:00",
+        "booked_at": "2025-09-01T10:00:00+00:00",
+        "status": "completed",
+        "price_estimate": 60.0,
+    }
+    return {**row, **kw}
+
+
+def pay(payment_id, appointment_id, **kw):
+    row = {
+        "payment_id": payment_id,
+        "appointment_id": appointment_id,
+        "amount": 60.0,
+        "paid_at": "2025-09-05T10:00:00+00:00",
+        "method": "card",
+    }
+    return {**row, **kw}
+
+
+def ids():
+    return {k: v.copy() for k, v in IDS.items()}
+
+
+def reasons(report, table, key):
+    q = report["quarantine"].get(table)
+    return {} if q is None else dict(zip(q[key], q["reason"], strict=True))
+
+
+def test_appointment_rules():
+    appts = pd.DataFrame(
+        [
+            appt(1),
+            appt(2, status="maybe"),
+            appt(3, appt_end="2025-09-05T08:00:00+00:00"),
+            appt(4, booked_at="2025-09-06T00:00:00+00:00"),
+            appt(5, patient_id=99),
+            appt(6, physio_id=99),
+            appt(7, appt_start="not a time"),
+            appt(8, price_estimate=None),
+        ]
+    )
+    ok, _, report = validate_day(appts, pd.DataFrame(columns=list(pay(0, 0))), ids())
+    assert ok["appointment_id"].tolist() == [1]
+    assert reasons(report, "appointments", "appointment_id") == {
+        2: "invalid_status",
+        3: "end_before_start",
+        4: "booked_after_start",
+        5: "unknown_patient",
+        6: "unknown_physio",
+        7: "bad_timestamp",
+        8: "missing_values",
+    }
+
+
+def test_payment_rules():
+    appts = pd.DataFrame([appt(1), appt(2, status="booked"), appt(3, status="maybe")])
+    pays = pd.DataFrame(
+        [
+            pay(10, 1),
+            pay(11, 50),  # appointment already in the DB
+            pay(12, 77),
+            pay(13, 2),
+            pay(14, 3),
+            pay(10, 1),
+            pay(15, 1, paid_at="yesterday"),
+        ]
+    )
+    _, ok, report = validate_day(appts, pays, ids())
+    assert ok["payment_id"].tolist() == [10, 11]
+    held = report["quarantine"]["payments"]
+    assert list(zip(held["payment_id"], held["reason"], strict=True)) == [
+        (12, "unknown_appointment"),
+        (13, "payment_for_non_completed"),
+        (14, "appointment_rejected"),
+        (10, "duplicate_payment_id"),
+        (15, "bad_timestamp"),
+    ]
+    assert report["rejected"]["unknown_appointment"] == 1
+
+
+def test_overlaps_are_warnings_not_rejections():
+    appts = pd.DataFrame(
+        [
+            appt(1),
+            appt(2, appt_start="2025-09-05T09:30:00+00:00", appt_end="2025-09-05T10:00:00+00:00"),
+        ]
+    )
+    ok, _, report = validate_day(appts, pd.DataFrame(columns=list(pay(0, 0))), ids())
+    assert len(ok) == 2
+    assert report["warnings"] == {"appt_overlaps": 1}
+
+
+def test_known_ids_follow_the_refresh():
+    known = ids()
+    forget(known, "appointments", [50])
+    _, ok, report = validate_day(
+        pd.DataFrame([appt(1)]), pd.DataFrame([pay(11, 50), pay(12, 1)]), known
+    )
+    # 50 is leaving the DB, so its payment is held; 1 arrives with the drop
+    assert ok["payment_id"].tolist() == [12]
+    assert reasons(report, "payments", "payment_id") == {11: "unknown_appointment"}
+
+    remember(known, "appointments", [1])
+    assert sorted(known["appointments"]) == [1]